@@ -0,0 +1,106 @@
+# pipeline/cache.py
+import functools
+import hashlib
+import os
+import pickle
+from pathlib import Path
+import pandas as pd
+
+# Keyword arguments that never change a stage's result; state and the report rows a stage
+# appends are outputs the cache replays
+_UNKEYED_PARAMS = ("inplace", "report", "state")
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    # Any edit to a pipeline module invalidates every cached result
+    h = hashlib.blake2b(digest_size=16)
+    for path in sorted(Path(__file__).parent.glob("*.py")):
+        h.update(path.name.encode())
+        h.update(path.read_bytes())
+    return h.hexdigest()
+
+
+def frame_fingerprint(df):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr(list(df.columns)).encode())
+    h.update(repr([str(t) for t in df.dtypes]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+class StageCache:
+    # Content-addressed, size-bounded (LRU) on-disk cache of stage results, keyed on the
+    # input frame, the stage's parameters and the pipeline code version
+    def __init__(self, cache_dir, max_bytes=10 * 2**30):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def key(self, func, df, params):
+        h = hashlib.blake2b(digest_size=20)
+        h.update(f"{func.__module__}.{func.__qualname__}".encode())
+        h.update(code_version().encode())
+        h.update(frame_fingerprint(df).encode())
+        keyed = {k: v for k, v in params.items() if k not in _UNKEYED_PARAMS}
+        h.update(repr(sorted(keyed.items())).encode())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.pkl"
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            entry = pd.read_pickle(path)
+        except FileNotFoundError:
+            return None
+        except (EOFError, pickle.UnpicklingError, AttributeError, ImportError, ValueError, TypeError):
+            # Truncated, or written by code that no longer loads it: a miss
+            path.unlink(missing_ok=True)
+            return None
+        os.utime(path)  # mark as recently used
+        return entry
+
+    def put(self, key, entry):
+        path = self._path(key)
+        tmp = path.with_suffix(".tmp")
+        pd.to_pickle(entry, tmp)
+        os.replace(tmp, path)
+        self._evict()
+
+    def _evict(self):
+        entries = [(p.stat().st_mtime, p.stat().st_size, p) for p in self.cache_dir.glob("*.pkl")]
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def run(self, func, df, /, **params):
+        key = self.key(func, df, params)
+        state, report = params.get("state"), params.get("report")
+        entry = self.get(key)
+        if entry is None or (state is not None and entry.get("state") is None) or \
+                (report is not None and entry.get("report") is None):
+            start = len(report) if report is not None else 0
+            out = func(df, **params)
+            entry = {
+                "out": out,
+                "state": dict(state) if state is not None else None,
+                "report": report[start:] if report is not None else None,
+            }
+            self.put(key, entry)
+        else:
+            if state is not None:
+                state.update(entry["state"])
+            if report is not None:
+                report.extend(entry["report"])
+        return entry["out"]
+
+    def wrap(self, func):
+        @functools.wraps(func)
+        def cached(df, /, **params):
+            return self.run(func, df, **params)
+        return cached
@@ -0,0 +1,377 @@
+# pipeline/cart.py
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from pipeline.sharded import scratch_dir
+
+# 4. Trees: crtrees hardcopy <features>, class seed(123) rule(0..3) on the analysis sample.
+# Features are binned once into ordered bins shared by every fit; each (features, seed)
+# fit grows one tree on the learning half, prunes it by cost complexity and picks the
+# subtree for every rule from its test-sample error, so rules never refit.
+CART_FEATURES = {
+    "cart1": [
+        "female", "race", "close_cpf", "emp_status", "topup_all_num_cat",
+        "xtage", "xttopup_all_amt_tot", "xtosra_bal_amt", "xtmltp_lst_con_wge",
+    ],
+    "cart2": [
+        "female", "close_cpf", "emp_status", "topup_all_num_cat",
+        "xtage", "xttopup_all_amt_tot", "xtosra_bal_amt", "xtmltp_lst_con_wge",
+    ],
+}
+RULES = (0, 1, 2, 3)
+# Features with more distinct values are cut at this many quantiles
+MAX_BINS = 32
+# Share of the sample in the learning sample (the rest is the test sample)
+LEARN_SHARE = .5
+# Nodes with fewer learning observations are not split
+MIN_SPLIT = 5
+
+
+def _num(s):
+    return pd.to_numeric(s).to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def bin_features(df, features, max_bins=MAX_BINS):
+    # -> codes (rows x features, uint8 bin numbers), each feature's bin upper values and
+    # whether they are exact values, and the rows with no feature missing. Bins are ordered,
+    # so splits are "bin <= b" as crtrees' "x <= c".
+    codes = np.zeros((len(df), len(features)), dtype=np.uint8)
+    keep = np.ones(len(df), dtype=bool)
+    bins = {}
+    for j, col in enumerate(features):
+        x = _num(df[col])
+        present = ~np.isnan(x)
+        keep &= present
+        values = np.unique(x[present])
+        exact = len(values) <= max_bins
+        if not exact:
+            values = np.unique(np.quantile(x[present], np.linspace(0, 1, max_bins + 1)[1:], method="inverted_cdf"))
+        codes[:, j] = np.minimum(np.searchsorted(values, x, side="left"), len(values) - 1)
+        bins[col] = (values, exact)
+    return codes, bins, keep
+
+
+def _compress(codes, y, rows, n_bins):
+    # Rows -> unique bin combinations with their class counts (trees grow on these), and
+    # each row's combination
+    radix = np.cumprod([1] + list(n_bins[:0:-1]))[::-1]
+    if np.prod(np.asarray(n_bins, dtype=np.float64)) < 2**62:
+        key = codes[rows].astype(np.int64) @ radix
+        _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    else:
+        _, first, inverse = np.unique(codes[rows], axis=0, return_index=True, return_inverse=True)
+    counts = np.zeros((len(first), 2))
+    np.add.at(counts, (inverse.ravel(), y[rows].astype(np.int64)), 1)
+    return codes[rows[first]], counts, inverse.ravel()
+
+
+def grow_tree(codes, counts, n_bins, min_split=MIN_SPLIT):
+    # Grows a classification tree on weighted bin combinations (codes, class counts) until
+    # nodes are pure, smaller than min_split or cannot be split. The tree grows a level at
+    # a time: one bincount gives the class histograms (nodes x bins x 2) of every node at
+    # that depth, and each node takes the threshold with the largest Gini decrease, i.e.
+    # the largest sum over children of (n0^2 + n1^2) / n. Node ids follow crtrees: root 1,
+    # children 2k (x <= c) and 2k + 1.
+    n_feat = codes.shape[1]
+    offsets = np.concatenate([[0], np.cumsum(n_bins)]).astype(np.int64)
+    n_total = int(offsets[-1])
+    feat_of_bin = np.repeat(np.arange(n_feat), n_bins)
+    last_bin = np.zeros(n_total, dtype=bool)
+    last_bin[offsets[1:] - 1] = True
+    flat = codes.astype(np.int64) + offsets[:-1]
+
+    ids = [1]
+    parent, depth = [np.array([-1])], [np.array([0])]
+    node_counts = [counts.sum(axis=0)[None]]
+    feature, cut, left = np.full(1, -1), np.full(1, -1), np.full(1, -1)
+    node_of = np.zeros(len(codes), dtype=np.int64)
+    rows = np.arange(len(codes))
+    frontier, n_nodes, level = np.array([0]), 1, 0
+    while len(frontier):
+        c = node_counts[-1]
+        splittable = (c.sum(axis=1) >= min_split) & (c.min(axis=1) > 0)
+        slot = np.full(n_nodes, -1)
+        slot[frontier[splittable]] = np.arange(splittable.sum())
+        rows = rows[slot[node_of[rows]] >= 0]
+        if not len(rows):
+            break
+        frontier, c = frontier[splittable], c[splittable]
+        m = len(frontier)
+
+        idx = (slot[node_of[rows]][:, None] * n_total + flat[rows]).ravel()
+        hist = np.stack([
+            np.bincount(idx, np.repeat(counts[rows, k], n_feat), m * n_total) for k in (0, 1)
+        ], axis=-1).reshape(m, n_total, 2)
+        cum = hist.cumsum(axis=1)
+        base = np.concatenate([np.zeros((m, 1, 2)), cum[:, offsets[1:-1] - 1]], axis=1)
+        left_c = cum - base[:, feat_of_bin]
+        right_c = c[:, None, :] - left_c
+        n_left, n_right = left_c.sum(axis=2), right_c.sum(axis=2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            score = (left_c ** 2).sum(axis=2) / n_left + (right_c ** 2).sum(axis=2) / n_right
+        score[(n_left == 0) | (n_right == 0) | last_bin] = -np.inf
+        best = score.argmax(axis=1)
+        gain = score[np.arange(m), best] - (c ** 2).sum(axis=1) / c.sum(axis=1)
+        split = gain > 1e-9
+        if not split.any():
+            break
+
+        # Children of the k-th splitting node are nodes n_nodes + 2k (left) and + 2k + 1
+        nodes, best = frontier[split], best[split]
+        k = len(nodes)
+        feat = feat_of_bin[best]
+        feature[nodes], cut[nodes] = feat, best - offsets[feat]
+        left[nodes] = n_nodes + 2 * np.arange(k)
+        feature, cut, left = (np.concatenate([a, np.full(2 * k, -1)]) for a in (feature, cut, left))
+        ids += [child for i in nodes for child in (2 * ids[i], 2 * ids[i] + 1)]
+        parent.append(np.repeat(nodes, 2))
+        depth.append(np.full(2 * k, level + 1))
+        node_counts.append(np.stack([left_c[split, best], right_c[split, best]], axis=1).reshape(2 * k, 2))
+
+        rows = rows[np.isin(node_of[rows], nodes)]
+        at = node_of[rows]
+        go_left = codes[rows, feature[at]] <= cut[at]
+        node_of[rows] = left[at] + ~go_left
+        frontier = np.arange(n_nodes, n_nodes + 2 * k)
+        n_nodes += 2 * k
+        level += 1
+
+    internal = left >= 0
+    tree = {
+        "id": np.array(ids, dtype=object),
+        "parent": np.concatenate(parent),
+        "depth": np.concatenate(depth),
+        "feature": feature,
+        "bin": cut,
+        "left": left,
+        "right": np.where(internal, left + 1, -1),
+        "counts": np.concatenate(node_counts).astype(np.float64),
+    }
+    tree["by_depth"] = [np.flatnonzero(tree["depth"] == d) for d in range(tree["depth"].max() + 1)]
+    return tree
+
+
+def route(tree, codes, collapsed=None):
+    # Node each row ends in, descending one level per pass; collapsed nodes are leaves
+    internal = tree["left"] >= 0
+    if collapsed is not None:
+        internal &= ~collapsed
+    node = np.zeros(len(codes), dtype=np.int64)
+    rows = np.arange(len(codes))
+    while len(rows):
+        rows = rows[internal[node[rows]]]
+        at = node[rows]
+        go_left = codes[rows, tree["feature"][at]] <= tree["bin"][at]
+        node[rows] = np.where(go_left, tree["left"][at], tree["right"][at])
+    return node
+
+
+def _active(tree, collapsed):
+    # Nodes of the subtree left after collapsing (not below a collapsed node)
+    active = np.ones(len(collapsed), dtype=bool)
+    for idx in tree["by_depth"][1:]:
+        parent = tree["parent"][idx]
+        active[idx] = active[parent] & ~collapsed[parent]
+    return active
+
+
+def _up(tree, values, active):
+    # Sums values of active nodes into their ancestors, deepest level first
+    out = values.copy()
+    for idx in reversed(tree["by_depth"][1:]):
+        idx = idx[active[idx]]
+        np.add.at(out, tree["parent"][idx], out[idx])
+    return out
+
+
+def prune_sequence(tree):
+    # Minimal cost-complexity pruning (weakest link): each step collapses the internal
+    # nodes whose removal costs the fewest learning errors per leaf saved. Returns the
+    # nested subtrees as (alpha, collapsed nodes), from the full tree to the root alone.
+    internal = tree["left"] >= 0
+    err = tree["counts"].sum(axis=1) - tree["counts"].max(axis=1)
+    collapsed = np.zeros(len(err), dtype=bool)
+    out = [(0.0, collapsed)]
+    while internal[0] and not collapsed[0]:
+        active = _active(tree, collapsed)
+        leaf = active & (~internal | collapsed)
+        sub_err = _up(tree, np.where(leaf, err, 0), active)
+        n_leaf = _up(tree, leaf.astype(np.float64), active)
+        cand = active & internal & ~collapsed
+        g = np.full(len(err), np.inf)
+        g[cand] = (err[cand] - sub_err[cand]) / (n_leaf[cand] - 1)
+        alpha = g.min()
+        collapsed = collapsed | (cand & (g <= alpha + 1e-9))
+        out.append((alpha, collapsed))
+    return out
+
+
+def _conditions(tree, bins, nodes):
+    # Each node's bin interval per feature, as crtrees' st_code conditions
+    names = list(bins)
+    n_bins = np.array([len(v) for v, _ in bins.values()])
+    lo = np.zeros((len(tree["left"]), len(names)), dtype=np.int64)
+    hi = np.tile(n_bins - 1, (len(tree["left"]), 1))
+    for idx in tree["by_depth"][1:]:
+        parent = tree["parent"][idx]
+        lo[idx], hi[idx] = lo[parent], hi[parent]
+        feat, cut = tree["feature"][parent], tree["bin"][parent]
+        is_left = tree["left"][parent] == idx
+        hi[idx[is_left], feat[is_left]] = np.minimum(hi[idx[is_left], feat[is_left]], cut[is_left])
+        lo[idx[~is_left], feat[~is_left]] = cut[~is_left] + 1
+
+    def fmt(v):
+        return str(int(v)) if float(v).is_integer() else f"{v:g}"
+
+    rules = []
+    for i in nodes:
+        parts = []
+        for j, col in enumerate(names):
+            values, exact = bins[col]
+            a, b = lo[i, j], hi[i, j]
+            if a == 0 and b == n_bins[j] - 1:
+                continue
+            if not exact:
+                parts += [f"{col} > {fmt(values[a - 1])}"] * int(a > 0) + [f"{col} <= {fmt(values[b])}"] * int(b < n_bins[j] - 1)
+            elif a == b:
+                parts.append(f"{col} == {fmt(values[a])}")
+            elif a == 0:
+                parts.append(f"{col} <= {fmt(values[b])}")
+            elif b == n_bins[j] - 1:
+                parts.append(f"{col} >= {fmt(values[a])}")
+            else:
+                parts.append(f"inrange({col}, {fmt(values[a])}, {fmt(values[b])})")
+        rules.append(" & ".join(parts))
+    return rules
+
+
+def fit_cart(codes, y, keep, bins, seed, rules=RULES, min_split=MIN_SPLIT, learn_share=LEARN_SHARE):
+    # One crtrees fit for every rule: the kept rows are split into learning and test
+    # samples by seed, then grown, pruned and selected as in select_subtrees
+    learn = keep & (np.random.default_rng(seed).random(len(keep)) < learn_share)
+    fit = select_subtrees(codes, y, np.flatnonzero(learn), np.flatnonzero(keep & ~learn), bins, rules, min_split)
+    return {"seed": seed, **fit, "learn": learn, "test": keep & ~learn}
+
+
+def select_subtrees(codes, y, learn, test, bins, rules=RULES, min_split=MIN_SPLIT):
+    # The tree grown and pruned on the learning rows and, for each rule, the smallest
+    # subtree whose error on the test rows is within rule standard errors of the lowest.
+    # learn and test are row numbers; a row may appear more than once (resamples).
+    n_bins = [len(v) for v, _ in bins.values()]
+    combos, counts, _ = _compress(codes, y, learn, n_bins)
+    tree = grow_tree(combos, counts, n_bins, min_split)
+
+    pred = (tree["counts"][:, 1] > tree["counts"][:, 0]).astype(np.int64)
+    test_counts = np.zeros_like(tree["counts"])
+    np.add.at(test_counts, (route(tree, codes[test]), y[test].astype(np.int64)), 1)
+    test_counts = _up(tree, test_counts, np.ones(len(pred), dtype=bool))
+    test_err = test_counts[np.arange(len(pred)), 1 - pred]
+    learn_err = tree["counts"][np.arange(len(pred)), 1 - pred]
+
+    internal = tree["left"] >= 0
+    subtrees = []
+    for alpha, collapsed in prune_sequence(tree):
+        leaf = _active(tree, collapsed) & (~internal | collapsed)
+        subtrees.append((alpha, collapsed, leaf, test_err[leaf].sum(), learn_err[leaf].sum()))
+    n_test, n_learn = max(len(test), 1), max(len(learn), 1)
+    risk = np.array([s[3] for s in subtrees]) / n_test
+    se = np.sqrt(risk.min() * (1 - risk.min()) / n_test)
+
+    fits = {}
+    for rule in rules:
+        k = int(np.flatnonzero(risk <= risk.min() + rule * se + 1e-12).max())
+        alpha, collapsed, leaf, t_err, l_err = subtrees[k]
+        idx = np.flatnonzero(leaf)
+        c, tc = tree["counts"][idx], test_counts[idx]
+        fits[rule] = {
+            "collapsed": collapsed,
+            "alpha": alpha,
+            "n_leaves": len(idx),
+            "learn_accuracy": 1 - l_err / n_learn,
+            "test_accuracy": 1 - t_err / n_test,
+            "leaves": pd.DataFrame({
+                "node": tree["id"][idx],
+                "rule": _conditions(tree, bins, idx),
+                "n_learn": c.sum(axis=1).astype(np.int64),
+                "hardcopy_learn": c[:, 1] / c.sum(axis=1),
+                "n_test": tc.sum(axis=1).astype(np.int64),
+                "hardcopy_test": np.divide(tc[:, 1], tc.sum(axis=1), out=np.full(len(idx), np.nan), where=tc.sum(axis=1) > 0),
+                "predicted": pred[idx],
+            }),
+        }
+    return {"tree": tree, "fits": fits}
+
+
+def predict_cart(fit, rule, codes):
+    # (leaf node id, predicted class) of every row under the subtree chosen for rule; codes
+    # are cart_grid's, or the fit's own features when it did not come from cart_grid
+    tree = fit["tree"]
+    if "columns" in fit:
+        codes = codes[:, fit["columns"]]
+    node = route(tree, codes, fit["fits"][rule]["collapsed"])
+    pred = (tree["counts"][:, 1] > tree["counts"][:, 0]).astype(np.int64)
+    return tree["id"][node], pred[node]
+
+
+def _run_fit(data_dir, name, cols, seed, bins, rules, min_split, learn_share):
+    codes = np.load(data_dir / "codes.npy", mmap_mode="r")
+    codes = np.ascontiguousarray(codes[:, cols]) if len(cols) < codes.shape[1] else np.asarray(codes)
+    y = np.load(data_dir / "y.npy")
+    keep = np.load(data_dir / f"keep_{name}.npy")
+    return fit_cart(codes, y, keep, bins, seed, rules, min_split, learn_share)
+
+
+def cart_grid(df, feature_sets=None, y="hardcopy", rules=RULES, seeds=(123,), workers=None,
+              max_bins=MAX_BINS, min_split=MIN_SPLIT, learn_share=LEARN_SHARE, tmp_dir=None):
+    # Fits every (feature set, seed) in parallel on one binned matrix shared through
+    # memory-mapped files; rows missing y or a feature of the set are left out, as
+    # e(sample). Returns ({(set, seed): fit_cart result}, codes); predict_cart labels the
+    # rows of codes with any fit.
+    feature_sets = feature_sets or CART_FEATURES
+    features = list(dict.fromkeys(f for fs in feature_sets.values() for f in fs))
+    codes, bins, _ = bin_features(df, features, max_bins)
+    yv = _num(df[y])
+    target = yv == 1
+    present = {f: ~np.isnan(_num(df[f])) for f in features}
+
+    jobs = []
+    for name, fs in feature_sets.items():
+        keep = ~np.isnan(yv)
+        for f in fs:
+            keep &= present[f]
+        for seed in seeds:
+            jobs.append((name, seed, [features.index(f) for f in fs], {f: bins[f] for f in fs}, keep))
+
+    workers = workers or os.cpu_count()
+    if workers == 1 or len(jobs) == 1:
+        results = {
+            (name, seed): fit_cart(codes[:, cols], target, keep, fs_bins, seed, rules, min_split, learn_share)
+            for name, seed, cols, fs_bins, keep in jobs
+        }
+        return _with_columns(results, jobs), codes
+
+    keeps = {name: keep for name, _, _, _, keep in jobs}
+    if tmp_dir is None:
+        tmp_dir = scratch_dir(codes.nbytes + target.nbytes * (1 + len(keeps)))
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as data_dir:
+        data_dir = Path(data_dir)
+        np.save(data_dir / "codes.npy", codes)
+        np.save(data_dir / "y.npy", target)
+        for name, keep in keeps.items():
+            np.save(data_dir / f"keep_{name}.npy", keep)
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            futures = {
+                (name, seed): pool.submit(_run_fit, data_dir, name, cols, seed, fs_bins, rules, min_split, learn_share)
+                for name, seed, cols, fs_bins, _ in jobs
+            }
+            results = {key: f.result() for key, f in futures.items()}
+    return _with_columns(results, jobs), codes
+
+
+def _with_columns(results, jobs):
+    for name, seed, cols, _, _ in jobs:
+        results[(name, seed)]["columns"] = cols
+    return results
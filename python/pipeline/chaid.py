@@ -0,0 +1,277 @@
+# pipeline/chaid.py
+import os
+from concurrent.futures import ProcessPoolExecutor
+from math import comb, exp, factorial, lgamma, log, log1p
+import numpy as np
+import pandas as pd
+from pipeline.cart import _compress
+
+# 4.1 CHAID Trees: chaid hardcopy, unordered(...) ordered(...). Rows are compressed to
+# unique predictor combinations with their hardcopy counts, every node's predictor x
+# hardcopy tables come from one bincount per tree level over those combinations, and
+# category merging updates the tables and pairwise tests in place instead of rescanning.
+CHAID_INDIV = {
+    "unordered": ["female", "race", "close_cpf", "emp_status"],
+    "ordered": ["topup_all_num_cat", "xtage", "xttopup_all_amt_tot", "xtosra_bal_amt", "xtmltp_lst_con_wge"],
+}
+CHAID_TRNS = {
+    "unordered": ["relationship_code", "cash", "acct_tp"],
+    "ordered": ["trns_mth", "xttopup_amt"],
+}
+# Categories merge while their pairwise test has p above ALPHA_MERGE; a node splits on the
+# predictor with the smallest Bonferroni-adjusted p when it is at most ALPHA_SPLIT
+ALPHA_MERGE = .05
+ALPHA_SPLIT = .05
+# Nodes smaller than MIN_SPLIT are not split; groups smaller than MIN_NODE are merged into
+# their most similar neighbour. MAX_DEPTH None grows until nothing is significant.
+MIN_SPLIT = 100
+MIN_NODE = 50
+MAX_DEPTH = None
+
+
+def _log_chi2_sf(x, df):
+    # log P(chi2(df) > x), from the regularised upper incomplete gamma Q(df/2, x/2): series
+    # below a + 1, continued fraction above. In logs, so the tiny p-values of tables with
+    # millions of rows still rank.
+    a, y = df / 2, x / 2
+    if y <= 0:
+        return 0.0
+    front = a * log(y) - y - lgamma(a)
+    if y < a + 1:
+        term = total = 1 / a
+        ap = a
+        for _ in range(10000):
+            ap += 1
+            term *= y / ap
+            total += term
+            if term < total * 1e-15:
+                break
+        return log1p(-min(exp(front) * total, 1.0)) if front < 700 else float("-inf")
+    tiny = 1e-300
+    b = y + 1 - a
+    c, d = 1 / tiny, 1 / b
+    h = d
+    for i in range(1, 10000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        h *= d * c
+        if abs(d * c - 1) < 1e-15:
+            break
+    return front + log(h)
+
+
+def _pearson(table):
+    # Pearson chi-square of a (groups x classes) table, ignoring empty margins
+    rows, cols = table.sum(axis=1), table.sum(axis=0)
+    rows, cols = rows[rows > 0], cols[cols > 0]
+    table = table[table.sum(axis=1) > 0][:, table.sum(axis=0) > 0]
+    if len(rows) < 2 or len(cols) < 2:
+        return 0.0, 0
+    expected = np.outer(rows, cols) / rows.sum()
+    return float(((table - expected) ** 2 / expected).sum()), (len(rows) - 1) * (len(cols) - 1)
+
+
+def _log_bonferroni(c, k, ordered):
+    # Ways of reducing c categories to k groups (Kass 1980): C(c-1, k-1) keeping order,
+    # the Stirling number S(c, k) without
+    if ordered:
+        return log(comb(c - 1, k - 1))
+    s = sum((-1) ** i * comb(k, i) * (k - i) ** c for i in range(k + 1)) // factorial(k)
+    return log(s)
+
+
+def merge_categories(table, ordered, alpha_merge=ALPHA_MERGE, min_node=MIN_NODE):
+    # CHAID merging of one predictor's (categories x classes) table at one node: the most
+    # similar pair (adjacent ones when ordered) merges while its test has p > alpha_merge,
+    # then groups under min_node merge into their most similar partner. Only the merged
+    # row and its pairs are recomputed. Returns (groups of category indices, merged table).
+    present = np.flatnonzero(table.sum(axis=1) > 0)
+    groups = [[int(i)] for i in present]
+    rows = [table[i].astype(np.float64) for i in present]
+
+    def pair(i, j):
+        return _pearson(np.stack([rows[i], rows[j]]))
+
+    def candidates(i):
+        return [i - 1, i + 1] if ordered else range(len(groups))
+
+    stats = {}
+    for i in range(len(groups)):
+        for j in candidates(i):
+            if 0 <= j < len(groups) and j > i:
+                stats[i, j] = pair(i, j)
+
+    def merge(i, j):
+        # j into i (i < j); keys above j shift down by one
+        groups[i] += groups.pop(j)
+        rows[i] = rows[i] + rows.pop(j)
+        shifted = {}
+        for (a, b), v in stats.items():
+            if j in (a, b) or i in (a, b):
+                continue
+            shifted[a - (a > j), b - (b > j)] = v
+        stats.clear()
+        stats.update(shifted)
+        for other in candidates(i):
+            if 0 <= other < len(groups) and other != i:
+                stats[min(i, other), max(i, other)] = pair(min(i, other), max(i, other))
+
+    while stats:
+        (i, j), (chi2, df) = min(stats.items(), key=lambda kv: kv[1][0])
+        if df and _log_chi2_sf(chi2, df) <= log(alpha_merge):
+            break
+        merge(i, j)
+    while len(groups) > 1:
+        sizes = [r.sum() for r in rows]
+        small = int(np.argmin(sizes))
+        if sizes[small] >= min_node:
+            break
+        (i, j), _ = min(((k, v) for k, v in stats.items() if small in k), key=lambda kv: kv[1][0])
+        merge(i, j)
+    return groups, np.stack(rows) if rows else np.zeros((0, table.shape[1]))
+
+
+def evaluate_predictor(table, ordered, alpha_merge=ALPHA_MERGE, min_node=MIN_NODE):
+    # -> (Bonferroni-adjusted log p, chi2, df, groups) of splitting a node on one predictor
+    groups, merged = merge_categories(table, ordered, alpha_merge, min_node)
+    chi2, df = _pearson(merged)
+    if len(groups) < 2 or not df:
+        return 0.0, chi2, df, groups
+    n_cats = sum(map(len, groups))
+    log_p = _log_chi2_sf(chi2, df) + _log_bonferroni(n_cats, len(groups), ordered)
+    return min(log_p, 0.0), chi2, df, groups
+
+
+def _evaluate_many(tasks):
+    return [evaluate_predictor(*task) for task in tasks]
+
+
+def _encode(df, predictors):
+    # Category codes (sorted values, so ordered predictors keep their order) and labels
+    codes = np.zeros((len(df), len(predictors)), dtype=np.int16)
+    keep = np.ones(len(df), dtype=bool)
+    labels = {}
+    for j, col in enumerate(predictors):
+        c, values = pd.factorize(df[col], sort=True)
+        codes[:, j] = c
+        keep &= c >= 0
+        labels[col] = list(values)
+    return codes, labels, keep
+
+
+def _condition(col, values, ordered):
+    def fmt(v):
+        return str(int(v)) if isinstance(v, (float, np.floating)) and float(v).is_integer() else str(v)
+    if len(values) == 1:
+        return f"{col} == {fmt(values[0])}"
+    if ordered:
+        return f"inrange({col}, {fmt(values[0])}, {fmt(values[-1])})"
+    return f"inlist({col}, {', '.join(map(fmt, values))})"
+
+
+def chaid(df, y="hardcopy", unordered=(), ordered=(), alpha_merge=ALPHA_MERGE, alpha_split=ALPHA_SPLIT,
+          min_split=MIN_SPLIT, min_node=MIN_NODE, max_depth=MAX_DEPTH, workers=None):
+    # CHAID tree of y (0/1) on the unordered and ordered predictors, one level at a time;
+    # the (node, predictor) evaluations of each level run in a pool of workers. Rows
+    # missing y or a predictor are left out. Returns {"nodes", "leaves", "cluster"}:
+    # every node with its split, the leaves (clusters) with their conditions, and each
+    # row's cluster (_CHAID; missing outside the sample).
+    predictors = list(unordered) + list(ordered)
+    is_ordered = [col in ordered for col in predictors]
+    codes, labels, keep = _encode(df, predictors)
+    yv = pd.to_numeric(df[y]).to_numpy(dtype=np.float64, na_value=np.nan)
+    keep &= ~np.isnan(yv)
+    rows = np.flatnonzero(keep)
+    n_cats = [max(len(labels[col]), 1) for col in predictors]
+    combos, counts, inverse = _compress(codes, (yv == 1).astype(np.int64), rows, n_cats)
+
+    offsets = np.concatenate([[0], np.cumsum(n_cats)]).astype(np.int64)
+    flat = combos.astype(np.int64) + offsets[:-1]
+    nodes = [{"node": 1, "parent": 0, "depth": 0, "condition": "", "counts": counts.sum(axis=0)}]
+    node_of = np.zeros(len(combos), dtype=np.int64)
+    frontier = [0]
+    workers = workers or os.cpu_count()
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        while frontier:
+            frontier = [
+                i for i in frontier
+                if nodes[i]["counts"].sum() >= min_split and nodes[i]["counts"].min() > 0
+                and (max_depth is None or nodes[i]["depth"] < max_depth)
+            ]
+            if not frontier:
+                break
+            slot = np.full(len(nodes), -1)
+            slot[frontier] = np.arange(len(frontier))
+            at = np.flatnonzero(slot[node_of] >= 0)
+            idx = (slot[node_of[at]][:, None] * offsets[-1] + flat[at]).ravel()
+            tables = np.stack([
+                np.bincount(idx, np.repeat(counts[at, k], len(predictors)), len(frontier) * offsets[-1])
+                for k in (0, 1)
+            ], axis=-1).reshape(len(frontier), offsets[-1], 2)
+
+            tasks = [
+                (tables[s, offsets[j]:offsets[j + 1]], is_ordered[j], alpha_merge, min_node)
+                for s in range(len(frontier)) for j in range(len(predictors))
+            ]
+            if pool is None:
+                results = _evaluate_many(tasks)
+            else:
+                size = -(-len(tasks) // workers)
+                results = [r for part in pool.map(_evaluate_many, [tasks[i:i + size] for i in range(0, len(tasks), size)]) for r in part]
+
+            children = []
+            group_of = np.full((len(nodes), max(n_cats)), -1)
+            split_on = np.full(len(nodes), -1)
+            for s, i in enumerate(frontier):
+                evals = results[s * len(predictors):(s + 1) * len(predictors)]
+                j = min(range(len(predictors)), key=lambda j: evals[j][0])
+                log_p, chi2, df_, groups = evals[j]
+                if len(groups) < 2 or log_p > log(alpha_split):
+                    continue
+                col = predictors[j]
+                nodes[i].update(split=col, chi2=chi2, df=df_, p_adj=exp(log_p))
+                split_on[i] = j
+                for g in groups:
+                    g = sorted(g)
+                    group_of[i, g] = len(nodes)
+                    children.append(len(nodes))
+                    nodes.append({
+                        "node": len(nodes) + 1,
+                        "parent": nodes[i]["node"],
+                        "depth": nodes[i]["depth"] + 1,
+                        "condition": _condition(col, [labels[col][c] for c in g], is_ordered[j]),
+                        "counts": tables[s, offsets[j] + np.array(g)].sum(axis=0),
+                    })
+            moving = np.flatnonzero(np.isin(node_of, [i for i in frontier if split_on[i] >= 0]))
+            j = split_on[node_of[moving]]
+            node_of[moving] = group_of[node_of[moving], combos[moving, j]]
+            frontier = children
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    # Conditions of each node from the root down; leaves numbered 1.. as clusters
+    tree = pd.DataFrame(nodes)
+    rule = {0: ""}
+    for n in tree.itertuples():
+        parent = rule.get(n.parent, "")
+        rule[n.node] = f"{parent} & {n.condition}" if parent and n.condition else parent or n.condition
+    tree["rule"] = tree["node"].map(rule)
+    tree["n"] = [int(c.sum()) for c in tree["counts"]]
+    tree[f"{y}_share"] = [c[1] / c.sum() for c in tree["counts"]]
+    tree = tree.drop(columns=["counts", "condition"])
+    is_leaf = ~tree["node"].isin(tree["parent"])
+    leaves = tree.loc[is_leaf, ["node", "rule", "n", f"{y}_share"]].reset_index(drop=True)
+    leaves.insert(0, "cluster", np.arange(1, len(leaves) + 1))
+
+    cluster_of = np.zeros(len(nodes) + 1, dtype=np.int64)
+    cluster_of[leaves["node"].to_numpy()] = leaves["cluster"].to_numpy()
+    cluster = np.full(len(df), np.nan)
+    cluster[rows] = cluster_of[node_of[inverse] + 1]
+    return {"nodes": tree, "leaves": leaves, "cluster": cluster}
@@ -1,212 +1,479 @@
 # pipeline/clean_topup.py
+import warnings
 import pandas as pd
 import numpy as np
-
-def clean_topup_columns(df):
-    df = df.copy()
+from pipeline.profiling import run_stage, step, traced
+from pipeline.schema import apply_schema
+
+# strftime format of trns_dte/perd_id in the raw files; None infers it from the first value
+# (as pd.to_datetime does). A dict gives each column its own format.
+DATE_FORMAT = None
+
+
+def parse_dates(values, date_format=DATE_FORMAT, name="date"):
+    # Parses each distinct string once and broadcasts back through the factorized codes.
+    # Values that do not match the format fall back to per-value day-first parsing; anything
+    # still unparseable is coerced to NaT and reported. Returns (dates, year, month).
+    codes, uniques = pd.factorize(values)
+    fmt = {"format": date_format} if date_format else {}
+    parsed = pd.to_datetime(pd.Series(uniques, dtype=object), errors='coerce', dayfirst=True, **fmt)
+    failed = parsed.isna().to_numpy()
+    if failed.any():
+        parsed[failed] = pd.to_datetime(
+            pd.Series(uniques[failed], dtype=object), dayfirst=True, format='mixed', errors='coerce'
+        ).to_numpy()
+        failed = parsed.isna().to_numpy()
+        if failed.any():
+            n_rows = int(np.isin(codes, np.flatnonzero(failed)).sum())
+            warnings.warn(f"{n_rows} {name} values ({failed.sum()} distinct) could not be parsed and were set to NaT", stacklevel=2)
+
+    # Year and month from integer month counts, computed per distinct value only
+    parsed = parsed.to_numpy()
+    months = parsed.astype('datetime64[M]').astype(np.int64)
+    year = np.where(failed, np.nan, months // 12 + 1970)
+    month = np.where(failed, np.nan, months % 12 + 1)
+
+    dates = np.append(parsed, np.datetime64('NaT'))[codes]
+    year = np.append(year, np.nan)[codes]
+    month = np.append(month, np.nan)[codes]
+    if not np.isnan(year).any():
+        year, month = year.astype(np.int32), month.astype(np.int32)
+    return dates, year, month
+
+
+def clean_topup_columns(df, inplace=False, drop_zero=True, date_format=DATE_FORMAT):
+    if not inplace:
+        df = df.copy()
 
     # Dates
-    df['trns_dte'] = pd.to_datetime(df['trns_dte'], dayfirst=True, errors='coerce')
-    df['trns_yr'] = df['trns_dte'].dt.year
-    df['trns_mth'] = df['trns_dte'].dt.month
-
-    df['perd_dte'] = pd.to_datetime(df['perd_id'], dayfirst=True, errors='coerce')
-    df['perd_yr'] = df['perd_dte'].dt.year
-    df['perd_mth'] = df['perd_dte'].dt.month
+    formats = date_format if isinstance(date_format, dict) else {'trns_dte': date_format, 'perd_id': date_format}
+    with step("parse_dates:trns_dte", len(df)):
+        df['trns_dte'], df['trns_yr'], df['trns_mth'] = parse_dates(df['trns_dte'], formats.get('trns_dte'), 'trns_dte')
+    with step("parse_dates:perd_id", len(df)):
+        df['perd_dte'], df['perd_yr'], df['perd_mth'] = parse_dates(df['perd_id'], formats.get('perd_id'), 'perd_id')
     df.drop(columns=['perd_id'], errors='ignore', inplace=True)
 
     # Account type
     if 'acct_tp_cde' in df.columns:
-        df['acct_tp'] = df['acct_tp_cde'].astype('category').cat.codes
-        df.drop(columns=['acct_tp_cde'], inplace=True)
+        with step("account_type", len(df)):
+            df['acct_tp'] = df['acct_tp_cde'].astype('category').cat.codes
+            df.drop(columns=['acct_tp_cde'], inplace=True)
 
     # Top-up amounts
-    for col in ['csh_topup_amt', 'cpf_trnf_amt']:
-        df[col] = df[col].fillna(0)
-    df['topup_amt'] = df['csh_topup_amt'] + df['cpf_trnf_amt']
-    df = df[df['topup_amt'] != 0]
+    with step("amounts", len(df)) as s:
+        for col in ['csh_topup_amt', 'cpf_trnf_amt']:
+            df[col] = df[col].fillna(0)
+        df['topup_amt'] = df['csh_topup_amt'] + df['cpf_trnf_amt']
+        if drop_zero:
+            df = df[df['topup_amt'] != 0]
+        s["rows_out"] = len(df)
 
     # Type flags
-    df['cash'] = df['csh_topup_amt'] > 0
-    df['cpf'] = df['cpf_trnf_amt'] > 0
+    with step("flags", len(df)):
+        df['cash'] = df['csh_topup_amt'] > 0
+        df['cpf'] = df['cpf_trnf_amt'] > 0
 
-    # Reinstatement tag
-    df.loc[(df['rnst_tag'] != "R") & (df['cpf_trnf_amt'] < 0), 'rnst_tag'] = "R"
-    df['r_tag'] = (df['rnst_tag'] == "R").astype(int)
-    df['topup_amt2'] = df['topup_amt'].abs()
+        # Reinstatement tag (a compact categorical rnst_tag may not have seen an R yet)
+        if isinstance(df['rnst_tag'].dtype, pd.CategoricalDtype) and "R" not in df['rnst_tag'].cat.categories:
+            df['rnst_tag'] = df['rnst_tag'].cat.add_categories("R")
+        df.loc[(df['rnst_tag'] != "R") & (df['cpf_trnf_amt'] < 0), 'rnst_tag'] = "R"
+        df['r_tag'] = (df['rnst_tag'] == "R").astype(int)
+        df['topup_amt2'] = df['topup_amt'].abs()
 
     return df
 
 
-def categorize_mode_and_relationships(df):
-    df = df.copy()
+# Classification tables. Keys are (topup_by_tag, second code); "*" matches any second code.
+RELATIONSHIP_CODES = {
+    ("O", ""): 1, ("O", "E"): 2, ("O", "F"): 3,
+    ("S", "*"): 4, ("T", "*"): 5, ("V", "*"): 6, ("W", "*"): 7, ("X", "*"): 8,
+}
+# (topup_by_tag, in_laws_topup_cde) overrides on top of relationship_code
+RELATIONSHIP_DETAILED_CODES = {("T", "I"): 9, ("T", "G"): 10}
+
+# topup_mde_cde values per mode_detail code
+MODE_DETAIL_CODES = {
+    1: ["MSSD052", "MSSD053@", "MTPD008", "MTPD009@"],
+    2: ["MSSM118", "MSSM119@", "MTPM006", "MTPM007@"],
+    3: ["MSSD064", "MSSD065@", "MTPD015", "MTPD016@"],
+    4: ["MTPD077@", "PNWRAPMT", "MTPD083@", "PNWSAPMT"],
+    5: ["MSSD116", "MSSD117@", "MTPD029", "MTPD030@"],
+    6: ["DCMSE002"],
+    7: ["MTPD107@", "MTPD106@"],
+    8: ["OATOSA"],
+}
+
+# Mode mapping versions. New versions are added here rather than as new functions:
+#   codes        mode_detail -> topup_mde_cde values
+#   default      mode_detail for codes not listed
+#   mode_dtype   dtype of the resulting mode_detail column
+#   drop         mode_detail values whose rows are removed
+#   hardcopy     mode_detail -> hardcopy; hardcopy_default fills everything else
+MODE_MAPPINGS = {
+    "v1": {
+        "codes": MODE_DETAIL_CODES,
+        "default": 9,
+        "mode_dtype": "float64",
+        "drop": [],
+        "hardcopy": {5: 1, 9: 1},
+        "hardcopy_default": 0,
+    },
+    "v2": {
+        "codes": {**MODE_DETAIL_CODES, 9: [""]},
+        "default": 10,
+        "mode_dtype": "int64",
+        "drop": [6, 7, 8, 9],
+        "hardcopy": {1: 0, 3: 0, 4: 0, 2: 1, 5: 1, 10: 1},
+        "hardcopy_default": np.nan,
+    },
+}
+
+
+def register_mode_mapping(name, codes, default, hardcopy, drop=(), hardcopy_default=np.nan, mode_dtype="int64"):
+    MODE_MAPPINGS[name] = {
+        "codes": codes,
+        "default": default,
+        "mode_dtype": mode_dtype,
+        "drop": list(drop),
+        "hardcopy": hardcopy,
+        "hardcopy_default": hardcopy_default,
+    }
 
-    # Relationship codes
-    df['relationship_code'] = np.nan
-    df.loc[(df['topup_by_tag'] == "O") & (df['csh_topup_cde'] == ""), 'relationship_code'] = 1
-    df.loc[(df['topup_by_tag'] == "O") & (df['csh_topup_cde'] == "E"), 'relationship_code'] = 2
-    df.loc[(df['topup_by_tag'] == "O") & (df['csh_topup_cde'] == "F"), 'relationship_code'] = 3
-    df.loc[df['topup_by_tag'] == "S", 'relationship_code'] = 4
-    df.loc[df['topup_by_tag'] == "T", 'relationship_code'] = 5
-    df.loc[df['topup_by_tag'] == "V", 'relationship_code'] = 6
-    df.loc[df['topup_by_tag'] == "W", 'relationship_code'] = 7
-    df.loc[df['topup_by_tag'] == "X", 'relationship_code'] = 8
-
-    df['relationship_detailed_code'] = df['relationship_code']
-    df.loc[(df['topup_by_tag'] == "T") & (df['in_laws_topup_cde'] == "I"), 'relationship_detailed_code'] = 9
-    df.loc[(df['topup_by_tag'] == "T") & (df['in_laws_topup_cde'] == "G"), 'relationship_detailed_code'] = 10
 
-    # Mode detail → hardcopy flag
-    df['mode_detail'] = np.nan
-    mode_map = {
-        1: ["MSSD052", "MSSD053@", "MTPD008", "MTPD009@"],
-        2: ["MSSM118", "MSSM119@", "MTPM006", "MTPM007@"],
-        3: ["MSSD064", "MSSD065@", "MTPD015", "MTPD016@"],
-        4: ["MTPD077@", "PNWRAPMT", "MTPD083@", "PNWSAPMT"],
-        5: ["MSSD116", "MSSD117@", "MTPD029", "MTPD030@"],
-        6: ["DCMSE002"],
-        7: ["MTPD107@", "MTPD106@"],
-        8: ["OATOSA"]
-    }
-    for code, values in mode_map.items():
-        df.loc[df["topup_mde_cde"].isin(values), "mode_detail"] = code
-    df["mode_detail"].fillna(9, inplace=True)
-    df["hardcopy"] = df["mode_detail"].isin([5, 9]).astype(int)
+def _lookup(df, cols, table, default=np.nan):
+    # Factorize each key column, resolve every distinct key combination against the table
+    # once, then broadcast back through the integer codes in a single take.
+    codes, uniques = [], []
+    for col in cols:
+        c, u = pd.factorize(df[col])
+        codes.append(c + 1)
+        uniques.append([np.nan] + list(u))
 
-    return df
+    shape = [len(u) for u in uniques]
+    lut = np.full(shape, default, dtype=np.float64)
+    for pos in np.ndindex(*shape):
+        key = tuple(u[i] for u, i in zip(uniques, pos))
+        wildcard = key[:1] + ("*",) * (len(key) - 1)
+        lut[pos] = table.get(key, table.get(wildcard, default))
 
+    return lut[tuple(codes)]
 
-def handle_reinstatements(df):
-    df = df.copy()
-
-    # Within-year reinstatement
-    group_cols = ['tppr_acct_num', 'tppe_acct_num', 'topup_amt2', 'trns_yr']
-    df['has_r_tag'] = df.groupby(group_cols)['r_tag'].transform('max')
-    df['dup'] = df.groupby(group_cols)['r_tag'].transform('size')
-    df = df[~((df['dup'] == 2) & (df['has_r_tag'] == 1))]
-
-    df['tag'] = df.groupby(group_cols).cumcount() == 0
-    df['tag'] = df['tag'] & (df['has_r_tag'] == 1)
-    df['temp'] = df.groupby(group_cols)['tag'].transform('sum')
-    df = df[~((df['tag']) & (df['temp'] == 2))]
-
-    # Cross-year reinstatement
-    group_cols = ['tppr_acct_num', 'tppe_acct_num', 'topup_amt2']
-    df['has_reinstatement'] = df.groupby(group_cols)['r_tag'].transform('max')
-    df['reinstatement_year'] = df['trns_yr'].where(df['r_tag'] == 1)
-    df['max_reinstatement_year'] = df.groupby(group_cols)['reinstatement_year'].transform('max')
-    df['has_reinstatement'] = df['has_reinstatement'].where(df['trns_yr'] <= df['max_reinstatement_year'], 0)
-
-    df['group_size'] = df.groupby(group_cols)['r_tag'].transform('size')
-    df = df[~((df['has_reinstatement'] == 1) & (df['group_size'] == 2))]
-
-    df['tag'] = (df.groupby(group_cols + ['r_tag', 'has_reinstatement']).cumcount() == 0).astype(int)
-    df['tag'] = df['tag'].where(df['has_reinstatement'] == 1, 0)
-    df['tag_count'] = df.groupby(group_cols)['tag'].transform('sum')
-    df = df[~((df['tag'] == 1) & (df['tag_count'] == 2))]
-
-    df = df[df['r_tag'] == 0]
-    return df.drop(columns=[
-        'has_r_tag', 'dup', 'tag', 'temp',
-        'has_reinstatement', 'reinstatement_year', 'max_reinstatement_year',
-        'group_size', 'tag_count'
-    ])
-    
 
-def clean_topup_data(df):
-    df = clean_topup_columns(df)
-    df = categorize_mode_and_relationships(df)
-    df = handle_reinstatements(df)
+def _mode_lookup(version):
+    mapping = MODE_MAPPINGS[version]
+    return {(value,): code for code, values in mapping["codes"].items() for value in values}
+
+
+@traced
+def apply_mode_mapping(df, version="v1"):
+    mapping = MODE_MAPPINGS[version]
+    mode_detail = _lookup(df, ["topup_mde_cde"], _mode_lookup(version), mapping["default"])
+    df["mode_detail"] = mode_detail.astype(mapping["mode_dtype"])
+
+    if mapping["drop"]:
+        keep = ~np.isin(mode_detail, mapping["drop"])
+        df = df[keep].copy()
+        mode_detail = mode_detail[keep]
+
+    # mode_detail codes are small non-negative ints, so hardcopy is a direct array take
+    modes = list(mapping["hardcopy"]) + [mapping["default"]] + list(mapping["codes"])
+    hardcopy = np.full(max(modes) + 1, mapping["hardcopy_default"], dtype=np.float64)
+    hardcopy[list(mapping["hardcopy"])] = list(mapping["hardcopy"].values())
+    hardcopy = hardcopy[mode_detail.astype(np.int64)]
+
+    if pd.isna(mapping["hardcopy_default"]):
+        df["hardcopy"] = hardcopy
+    else:
+        df["hardcopy"] = hardcopy.astype(int)
     return df
 
-def remap_mode_detail(df):
-    mode_map = {
-        1: ["MSSD052", "MSSD053@", "MTPD008", "MTPD009@"],
-        2: ["MSSM118", "MSSM119@", "MTPM006", "MTPM007@"],
-        3: ["MSSD064", "MSSD065@", "MTPD015", "MTPD016@"],
-        4: ["MTPD077@", "PNWRAPMT", "MTPD083@", "PNWSAPMT"],
-        5: ["MSSD116", "MSSD117@", "MTPD029", "MTPD030@"],
-        6: ["DCMSE002"],
-        7: ["MTPD107@", "MTPD106@"],
-        8: ["OATOSA"],
-        9: [""]
-    }
 
-    df = df.copy()
-    df.drop(columns=["mode_detail"], errors="ignore", inplace=True)
-    df["mode_detail"] = np.nan
+def categorize_mode_and_relationships(df, version="v1", inplace=False):
+    if not inplace:
+        df = df.copy()
+
+    # Relationship codes
+    with step("relationship_codes", len(df)):
+        df['relationship_code'] = _lookup(df, ['topup_by_tag', 'csh_topup_cde'], RELATIONSHIP_CODES)
+        detailed = _lookup(df, ['topup_by_tag', 'in_laws_topup_cde'], RELATIONSHIP_DETAILED_CODES)
+        df['relationship_detailed_code'] = np.where(np.isnan(detailed), df['relationship_code'], detailed)
 
-    for code, values in mode_map.items():
-        df.loc[df["topup_mde_cde"].isin(values), "mode_detail"] = code
+    # Mode detail → hardcopy flag
+    return apply_mode_mapping(df, version)
+
+
+def _group_ids(df, cols, ids=None):
+    # Compact int64 group ids over cols (optionally refining existing ids), -1 where any
+    # key is missing, matching groupby's dropna behaviour
+    if ids is None:
+        ids = np.zeros(len(df), dtype=np.int64)
+    missing = ids < 0
+    for col in cols:
+        codes, uniques = pd.factorize(df[col])
+        missing |= codes < 0
+        ids = pd.factorize(ids * len(uniques) + codes)[0]
+    ids[missing] = -1
+    return ids
+
+
+def handle_reinstatements(df, keep=None):
+    # keep optionally masks out rows (e.g. zero amounts) as if they had already been dropped
+    r_tag = df['r_tag'].to_numpy() == 1
+    trns_yr = df['trns_yr'].to_numpy(dtype=np.float64)
+    alive = np.ones(len(df), dtype=bool) if keep is None else np.asarray(keep, dtype=bool).copy()
+
+    # Key ids: (payer, payee, amount) across years, refined by trns_yr for within-year pairs
+    with step("group_ids", len(df)):
+        pair_ids = _group_ids(df, ['tppr_acct_num', 'tppe_acct_num', 'topup_amt2'])
+        year_ids = _group_ids(df, ['trns_yr'], pair_ids)
+    pair_ids[~alive] = -1
+    year_ids[~alive] = -1
+
+    # Within-year reinstatement: drop both rows of any two-row group holding an R.
+    # (A second within-year pass tagging the first row of each R group can never tag two
+    # rows in one group, so it removes nothing and is not repeated here.)
+    with step("within_year", len(df)):
+        grouped = year_ids >= 0
+        n_year_groups = year_ids.max(initial=-1) + 1
+        dup = np.bincount(year_ids[grouped], minlength=n_year_groups)
+        has_r_tag = np.bincount(year_ids[grouped], weights=r_tag[grouped], minlength=n_year_groups) > 0
+        alive[grouped] &= ~((dup == 2) & has_r_tag)[year_ids[grouped]]
+
+    # Cross-year reinstatement works on contiguous pair segments; the stable sort keeps
+    # rows within each segment in their original order
+    with step("cross_year", len(df)):
+        order = np.argsort(pair_ids, kind='stable')
+        order = order[pair_ids[order] >= 0]
+        seg_ids = pair_ids[order]
+        new_seg = np.ones(len(order), dtype=bool)
+        new_seg[1:] = seg_ids[1:] != seg_ids[:-1]
+        starts = np.flatnonzero(new_seg)
+        seg = np.cumsum(new_seg) - 1
+        s_alive, s_r, s_yr = alive[order], r_tag[order], trns_yr[order]
+
+        def segment_reduce(ufunc, values):
+            return ufunc.reduceat(values, starts)[seg]
+
+        # Rows on or before the pair's latest R year are candidates for cancellation
+        reinstatement_year = np.where(s_alive & s_r & ~np.isnan(s_yr), s_yr, -np.inf)
+        has_reinstatement = s_yr <= segment_reduce(np.maximum, reinstatement_year)
+        group_size = segment_reduce(np.add, s_alive.astype(np.int64))
+        s_alive &= ~(has_reinstatement & (group_size == 2))
+
+        # Cancel the first R row against the first non-R row of each candidate pair segment
+        has_reinstatement &= s_alive
+        pos = np.arange(len(order))
+        tag = np.zeros(len(order), dtype=bool)
+        tag_count = np.zeros(len(order), dtype=np.int64)
+        for r in (False, True):
+            candidate = has_reinstatement & (s_r == r)
+            first = segment_reduce(np.minimum, np.where(candidate, pos, len(order)))
+            tag |= candidate & (pos == first)
+            tag_count += first < len(order)
+        s_alive &= ~(tag & (tag_count == 2))
+
+        alive[order] = s_alive
+    return df[alive & ~r_tag]
+    
 
-    df["mode_detail"] = df["mode_detail"].fillna(10).astype(int)
+# Columns handle_reinstatements reads; kept per row so later years can be appended
+REINSTATEMENT_COLS = ['tppr_acct_num', 'tppe_acct_num', 'topup_amt2', 'trns_yr', 'r_tag']
+
+
+def clean_topup_data(df, inplace=False, report=None, state=None, schema=None, date_format=DATE_FORMAT):
+    # Copies the input at most once; every stage then adds columns in place and the
+    # zero-amount and reinstatement filters are applied together in one final selection.
+    # With inplace=True the caller's frame is modified and not copied at all.
+    # Passing a dict as state fills it with what pipeline.incremental needs to append years.
+    # A schema (e.g. pipeline.schema.CLEANED_TOPUP_SCHEMA) compacts the added columns.
+    if not inplace:
+        df = df.copy()
+    if state is not None:
+        state['next_row'] = int(df.index.max()) + 1 if len(df) else 0
+        state['acct_tp_categories'] = (
+            df['acct_tp_cde'].astype('category').cat.categories if 'acct_tp_cde' in df.columns else None
+        )
+        state['schema'] = schema
+
+    df = run_stage(report, "clean_topup_columns", clean_topup_columns, df, inplace=True, drop_zero=False, date_format=date_format)
+    df = run_stage(report, "categorize_mode_and_relationships", categorize_mode_and_relationships, df, inplace=True)
+    if schema is not None:
+        df = run_stage(report, "apply_schema", apply_schema, df, schema)
+    nonzero = df['topup_amt'].to_numpy() != 0
+    cleaned = run_stage(report, "handle_reinstatements", handle_reinstatements, df, keep=nonzero)
+
+    if state is not None:
+        state['keys'] = df.loc[nonzero, REINSTATEMENT_COLS]
+        parked = nonzero & (df['r_tag'].to_numpy() == 0) & ~df.index.isin(cleaned.index)
+        state['parked'] = df[parked]
+    return cleaned
+
+def remap_mode_detail(df, version="v2", inplace=False):
+    if not inplace:
+        df = df.copy()
+    df.drop(columns=["mode_detail"], errors="ignore", inplace=True)
 
     if "hardcopy" in df.columns:
         df.rename(columns={"hardcopy": "hardcopy_v1"}, inplace=True)
 
-    df = df[~df["mode_detail"].between(6, 9)]
-    df["hardcopy"] = np.nan
-    df.loc[df["mode_detail"].isin([2, 5, 10]), "hardcopy"] = 1
-    df.loc[df["mode_detail"].isin([1, 3, 4]), "hardcopy"] = 0
+    return apply_mode_mapping(df, version)
 
-    return df
+COLLAPSE_KINDS = ["all", "hard", "soft", "giro", "ngiro"]
 
-def collapse_topup_data(df, year_range=(2017, 2020)):
-    df = df.copy()
-    df = df[df["trns_yr"].between(*year_range)]
 
-    df.sort_values(["tppr_acct_num", "hardcopy"], inplace=True)
+def _collapse_columns(year_range):
+    # (column, period, kind, stat) in the order the per-pass joins used to produce
+    def col(kind, stat, period=0, suffix=""):
+        name = f"topup_{kind}_num" if stat == "num" else f"topup_{kind}_amt_{stat}"
+        return (name + suffix, period, kind, stat)
 
-    # Overall counts and totals
-    topup_all = df.groupby("tppr_acct_num").agg(
-        topup_all_num=("topup_amt", "count"),
-        topup_all_amt_tot=("topup_amt", "sum")
-    )
+    cols = []
+    for kind in ["all", "hard", "soft"]:
+        cols += [col(kind, "num"), col(kind, "tot")]
+    cols += [col(kind, "mean") for kind in ["all", "hard", "soft"]]
+    for kind in ["giro", "ngiro"]:
+        cols += [col(kind, stat) for stat in ["num", "tot", "mean"]]
+
+    for period, year in enumerate(range(year_range[0], year_range[1] + 1), start=1):
+        for kind in COLLAPSE_KINDS:
+            cols += [col(kind, stat, period, f"_{year}") for stat in ["num", "tot", "mean"]]
+
+    return cols
+
+
+def _collapse_accounts(df):
+    # Factorize the account key once; NaN accounts are dropped as groupby would
+    acct_codes, accts = pd.factorize(df["tppr_acct_num"], sort=True)
+    return acct_codes, accts
+
+
+def _collapse_cells(acct, year, hard, giro, weights, n_accts, year_range):
+    # Reduce rows (or pre-grouped cells) into a dense (year, hard/soft/neither,
+    # giro/ngiro/neither, account) cube per statistic with one bincount each, then fold the
+    # cube into the five kinds: all, hard, soft, giro, ngiro. Accounts vary fastest so every
+    # output column is a contiguous slice.
+    n_years = year_range[1] - year_range[0] + 1
+    cell = ((year * 3 + hard) * 3 + giro) * n_accts + acct
+    kinds = {}
+    for stat, w in weights.items():
+        cube = np.bincount(cell, weights=w, minlength=n_years * 9 * n_accts)
+        kinds[stat] = _fold_kinds(cube.reshape(n_years, 3, 3, n_accts))
+    return kinds
+
+
+def _fold_kinds(cube):
+    # (year, hard state, giro state, account) cube -> (kind, year, account)
+    return np.stack([
+        cube.sum(axis=(1, 2)),
+        cube[:, 0].sum(axis=1),
+        cube[:, 1].sum(axis=1),
+        cube[:, :, 0].sum(axis=1),
+        cube[:, :, 1].sum(axis=1),
+    ])
 
-    # Hard / Soft splits
-    topup_hard = df[df["hardcopy"] == 1].groupby("tppr_acct_num")["topup_amt"].agg(["count", "sum"])
-    topup_soft = df[df["hardcopy"] == 0].groupby("tppr_acct_num")["topup_amt"].agg(["count", "sum"])
 
-    topup_hard.columns = ["topup_hard_num", "topup_hard_amt_tot"]
-    topup_soft.columns = ["topup_soft_num", "topup_soft_amt_tot"]
+def _collapse_frame(accts, kinds, year_range, int_amt):
+    n_accts = len(accts)
+    overall = {stat: k.sum(axis=1) for stat, k in kinds.items()}
+
+    # Cells an account never appears in were NaN-filled joins, so their columns go to float
+    data = {}
+    for name, period, kind, stat in _collapse_columns(year_range):
+        i = COLLAPSE_KINDS.index(kind)
+        cells = overall if period == 0 else {s: k[:, period - 1] for s, k in kinds.items()}
+        full = bool((cells["size"][i] > 0).all())
+        if stat == "mean":
+            num = cells["num"][i]
+            data[name] = np.divide(cells["tot"][i], num, out=np.zeros(n_accts), where=num > 0)
+        elif stat == "num":
+            data[name] = cells["num"][i].astype(np.int64 if full else np.float64)
+        else:
+            data[name] = cells["tot"][i].astype(np.int64 if full and int_amt else np.float64)
+
+    out = pd.DataFrame(data, index=accts.rename("tppr_acct_num"))
+    return out.reset_index()
 
-    out = topup_all.join([topup_hard, topup_soft], how="left").fillna(0)
 
-    for kind in ["all", "hard", "soft"]:
-        out[f"topup_{kind}_amt_mean"] = out[f"topup_{kind}_amt_tot"] / out[f"topup_{kind}_num"].replace(0, np.nan)
-
-    # GIRO / Non-GIRO logic
-    df["hard_giro"] = (df["mode_detail"] == 2).astype(int)
-    df["hard_ngiro"] = df["mode_detail"].isin([5, 10]).astype(int)
-
-    for label, flag_col in [("giro", "hard_giro"), ("ngiro", "hard_ngiro")]:
-        sub = df[df[flag_col] == 1].groupby("tppr_acct_num")["topup_amt"].agg(["count", "sum"]).fillna(0)
-        sub.columns = [f"topup_{label}_num", f"topup_{label}_amt_tot"]
-        sub[f"topup_{label}_amt_mean"] = sub[f"topup_{label}_amt_tot"] / sub[f"topup_{label}_num"].replace(0, np.nan)
-        out = out.join(sub, how="left").fillna(0)
-
-    # Year-wise stats
-    for year in range(year_range[0], year_range[1] + 1):
-        df_y = df[df["trns_yr"] == year]
-        base = df_y.groupby("tppr_acct_num")["topup_amt"].agg(
-            **{f"topup_all_num_{year}": "count", f"topup_all_amt_tot_{year}": "sum"}
-        )
-        base[f"topup_all_amt_mean_{year}"] = base[f"topup_all_amt_tot_{year}"] / base[f"topup_all_num_{year}"].replace(0, np.nan)
+def _hard_giro_states(hardcopy, mode_detail):
+    hard_state = np.select([hardcopy == 1, hardcopy == 0], [0, 1], 2)
+    giro_state = np.select([mode_detail == 2, np.isin(mode_detail, [5, 10])], [0, 1], 2)
+    return hard_state, giro_state
 
-        for kind, cond in [("hard", df_y["hardcopy"] == 1), ("soft", df_y["hardcopy"] == 0)]:
-            sub = df_y[cond].groupby("tppr_acct_num")["topup_amt"].agg(
-                **{f"topup_{kind}_num_{year}": "count", f"topup_{kind}_amt_tot_{year}": "sum"}
-            )
-            sub[f"topup_{kind}_amt_mean_{year}"] = sub[f"topup_{kind}_amt_tot_{year}"] / sub[f"topup_{kind}_num_{year}"].replace(0, np.nan)
-            base = base.join(sub, how="left").fillna(0)
 
-        for kind, cond in [("giro", df_y["hard_giro"] == 1), ("ngiro", df_y["hard_ngiro"] == 1)]:
-            sub = df_y[cond].groupby("tppr_acct_num")["topup_amt"].agg(
-                **{f"topup_{kind}_num_{year}": "count", f"topup_{kind}_amt_tot_{year}": "sum"}
-            )
-            sub[f"topup_{kind}_amt_mean_{year}"] = sub[f"topup_{kind}_amt_tot_{year}"] / sub[f"topup_{kind}_num_{year}"].replace(0, np.nan)
-            base = base.join(sub, how="left").fillna(0)
+def _float_values(s):
+    # Nullable compact ints (pipeline.schema) come back as float64 with NaN for missing
+    return s.to_numpy(dtype=np.float64, na_value=np.nan)
 
-        out = out.join(base, how="left").fillna(0)
 
-    return out.reset_index()
+def _row_weights(df, keep):
+    amt = _float_values(df["topup_amt"])[keep]
+    valid = ~pd.isna(amt)
+    return {"size": np.ones(len(amt)), "num": valid.astype(np.float64), "tot": np.where(valid, amt, 0)}
+
+
+def collapse_topup_data(df, year_range=(2017, 2020)):
+    with step("select_accounts", len(df)) as s:
+        df = df[df["trns_yr"].between(*year_range)]
+        acct, accts = _collapse_accounts(df)
+        keep = acct >= 0
+        s["rows_out"] = int(keep.sum())
+
+    with step("bincount_cells", int(keep.sum())):
+        year = df["trns_yr"].to_numpy()[keep].astype(np.int64) - year_range[0]
+        hard, giro = _hard_giro_states(_float_values(df["hardcopy"])[keep], _float_values(df["mode_detail"])[keep])
+        kinds = _collapse_cells(acct[keep], year, hard, giro, _row_weights(df, keep), len(accts), year_range)
+
+    with step("build_frame", len(accts)):
+        int_amt = pd.api.types.is_integer_dtype(df["topup_amt"])
+        return _collapse_frame(accts, kinds, year_range, int_amt)
+
+
+def collapse_topup_variants(df, versions=("v1", "v2"), year_range=(2017, 2020)):
+    # Collapses df under several mode mappings with the year filter, account factorization,
+    # code factorization and row weights shared; each version only re-labels the distinct
+    # topup_mde_cde values and runs its own bincount. Equivalent to
+    # collapse_topup_data(remap_mode_detail(df, version)) per version, and to
+    # collapse_topup_data(df) for the mapping df was categorized with.
+    with step("select_accounts", len(df)) as s:
+        df = df[df["trns_yr"].between(*year_range)]
+        acct, accts = _collapse_accounts(df)
+        keep = acct >= 0
+        acct = acct[keep]
+
+        codes, uniques = pd.factorize(df["topup_mde_cde"])
+        codes = codes[keep] + 1
+        mde = pd.DataFrame({"topup_mde_cde": [np.nan] + list(uniques)})
+        year = df["trns_yr"].to_numpy()[keep].astype(np.int64) - year_range[0]
+        weights = _row_weights(df, keep)
+        int_amt = pd.api.types.is_integer_dtype(df["topup_amt"])
+        s["rows_out"] = len(acct)
+
+    out = {}
+    for version in versions:
+        with step(f"collapse_{version}", len(acct)) as s:
+            out[version] = _collapse_version(
+                version, acct, accts, codes, mde, year, weights, int_amt, year_range,
+            )
+            s["rows_out"] = len(out[version])
+    return out
+
+
+def _collapse_version(version, acct, accts, codes, mde, year, weights, int_amt, year_range):
+    mapping = MODE_MAPPINGS[version]
+    mode_detail = _lookup(mde, ["topup_mde_cde"], _mode_lookup(version), mapping["default"])
+    hardcopy = pd.Series(mode_detail).map(mapping["hardcopy"]).fillna(mapping["hardcopy_default"])
+    hard, giro = _hard_giro_states(hardcopy.to_numpy(), mode_detail)
+
+    # Accounts whose rows are all dropped by this version leave its table
+    kept = ~np.isin(mode_detail, mapping["drop"])[codes]
+    if kept.all():
+        present, acct_idx = np.ones(len(accts), dtype=bool), acct
+    else:
+        present = np.bincount(acct[kept], minlength=len(accts)) > 0
+        acct_idx = (np.cumsum(present) - 1)[acct[kept]]
+    code = codes[kept]
+    kinds = _collapse_cells(
+        acct_idx, year[kept], hard[code], giro[code],
+        {stat: w[kept] for stat, w in weights.items()}, int(present.sum()), year_range,
+    )
+    return _collapse_frame(accts[present], kinds, year_range, int_amt)
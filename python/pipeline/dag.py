@@ -0,0 +1,186 @@
+# pipeline/dag.py
+import glob
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+# Stages declared by the artifacts they read and write, as paths under the data directory
+# (inputs may be glob patterns). The stage that lists an artifact as an output produces
+# it, which gives the dependency graph: a stage starts as soon as the stages producing its
+# inputs are done, alongside every other ready stage, on a bounded pool of processes.
+# Stages pass nothing but files, so each one runs in any worker. As with make, a stage
+# whose outputs are all newer than its inputs is skipped unless something upstream reran.
+# An exclusive stage (one that starts its own pool of processes) runs with no other stage
+# and is given the whole worker budget as workers=, so processes never exceed it.
+
+
+def stage(func, inputs=(), outputs=(), exclusive=False, **params):
+    # func(data_dir, **params) must write every output; exclusive stages are called with
+    # workers= as well
+    return {"func": func, "inputs": list(inputs), "outputs": list(outputs), "exclusive": exclusive, "params": params}
+
+
+def _producers(stages):
+    producer = {}
+    for name, s in stages.items():
+        for out in s["outputs"]:
+            if out in producer:
+                raise ValueError(f"{out} is written by both {producer[out]} and {name}")
+            producer[out] = name
+    return producer
+
+
+def build_graph(stages):
+    # -> {stage: stages it waits for}
+    producer = _producers(stages)
+    deps = {name: {producer[i] for i in s["inputs"] if i in producer} - {name} for name, s in stages.items()}
+    topological_order(deps)
+    return deps
+
+
+def topological_order(deps):
+    # Stages in an order that runs every stage after those it waits for (by name among
+    # stages that are ready together); raises on a cycle
+    order, done, pending = [], set(), dict(deps)
+    while pending:
+        ready = sorted(n for n, d in pending.items() if d <= done)
+        if not ready:
+            raise ValueError(f"dependency cycle among {sorted(pending)}")
+        for n in ready:
+            del pending[n]
+        order += ready
+        done.update(ready)
+    return order
+
+
+def select_stages(stages, deps, targets):
+    # The targets (stage names or artifacts) and every stage they depend on
+    producer = _producers(stages)
+    todo = []
+    for t in targets:
+        if t in stages:
+            todo.append(t)
+        elif t in producer:
+            todo.append(producer[t])
+        else:
+            raise KeyError(f"no stage or artifact named {t}")
+    needed = set()
+    while todo:
+        n = todo.pop()
+        if n not in needed:
+            needed.add(n)
+            todo += deps[n]
+    return needed
+
+
+def _paths(data_dir, patterns):
+    out = []
+    for p in patterns:
+        out += [Path(m) for m in sorted(glob.glob(str(data_dir / p)))] if glob.has_magic(p) else [data_dir / p]
+    return out
+
+
+def is_fresh(s, data_dir):
+    # Every output exists and none is older than an input
+    outputs = _paths(data_dir, s["outputs"])
+    if not outputs or not all(p.exists() for p in outputs):
+        return False
+    inputs = [p for p in _paths(data_dir, s["inputs"]) if p.exists()]
+    newest = max((p.stat().st_mtime for p in inputs), default=0)
+    return min(p.stat().st_mtime for p in outputs) >= newest
+
+
+def _missing_sources(stages, needed, data_dir):
+    # Inputs no stage produces that are not on disk
+    producer = _producers(stages)
+    missing = set()
+    for name in needed:
+        for i in stages[name]["inputs"]:
+            if i not in producer and not any(p.exists() for p in _paths(data_dir, [i])):
+                missing.add(i)
+    return sorted(missing)
+
+
+def _run(name, s, data_dir, workers):
+    # Runs one stage and stamps its outputs (directories included), so their times say
+    # when the stage last completed -> seconds taken
+    start = time.perf_counter()
+    s["func"](data_dir, **s["params"], **({"workers": workers} if s["exclusive"] else {}))
+    now = time.time()
+    for p in _paths(data_dir, s["outputs"]):
+        if not p.exists():
+            raise FileNotFoundError(f"stage {name} did not write {p}")
+        os.utime(p, (now, now))
+    return time.perf_counter() - start
+
+
+def _any_exclusive(stages, running):
+    return any(stages[n]["exclusive"] for n in running.values())
+
+
+def run_pipeline(stages, data_dir, targets=None, workers=None, force=False, dry_run=False, report=None, log=None):
+    # Runs targets (every stage by default) and what they depend on, each stage once the
+    # stages it waits for are done, at most workers at a time (None: every core; 1 runs
+    # them one after another in this process) and exclusive stages alone. report gets a
+    # row per stage (ran, skipped or, with dry_run, would run) as it finishes and log(row)
+    # is called with it. On a failure nothing new starts and the stages already running
+    # are waited for.
+    data_dir = Path(data_dir)
+    deps = build_graph(stages)
+    needed = select_stages(stages, deps, targets or list(stages))
+    missing = _missing_sources(stages, needed, data_dir)
+    if missing and not dry_run:
+        raise FileNotFoundError(f"missing inputs: {', '.join(missing)}")
+    report = [] if report is None else report
+    waiting = {n: deps[n] & needed for n in needed}
+    done, ran, running = set(), set(), {}
+
+    def finish(name, status, seconds):
+        row = {"stage": name, "status": status, "seconds": round(seconds, 3)}
+        report.append(row)
+        done.add(name)
+        if status != "skipped":
+            ran.add(name)
+        if log is not None:
+            log(row)
+
+    workers = workers or os.cpu_count()
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 and not dry_run else None
+    try:
+        while waiting or running:
+            ready = [n for n in sorted(waiting) if waiting[n] <= done]
+            for name in ready:
+                s = stages[name]
+                stale = force or bool(waiting[name] & ran) or not is_fresh(s, data_dir)
+                if running and stale and not dry_run and (s["exclusive"] or _any_exclusive(stages, running)):
+                    break
+                del waiting[name]
+                if not stale:
+                    finish(name, "skipped", 0)
+                elif dry_run:
+                    finish(name, "would run", 0)
+                elif pool is None:
+                    finish(name, "ran", _run(name, s, data_dir, workers))
+                else:
+                    running[pool.submit(_run, name, s, data_dir, workers)] = name
+                    if s["exclusive"]:
+                        break
+            if not running:
+                if waiting and not ready:
+                    raise RuntimeError(f"stages never became ready: {sorted(waiting)}")
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for f in finished:
+                name = running.pop(f)
+                try:
+                    seconds = f.result()
+                except Exception as e:
+                    waiting.clear()
+                    wait(running)
+                    raise RuntimeError(f"stage {name} failed") from e
+                finish(name, "ran", seconds)
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True)
+    return report
@@ -1,41 +1,157 @@
-from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 import pandas as pd
+from pipeline.schema import TOPUP_DTYPES, read_dtypes, apply_schema, concat_frames
 
-def load_topup_data(start_year, end_year, clean_dir, raw_dir):
-    dfs = []
-    for y in range(start_year, end_year + 1):
-        csv_path = clean_dir / f"topup_{y}.csv"
-        if csv_path.exists():
-            df = pd.read_csv(csv_path)
-            dfs.append(df)
-    df_all = pd.concat(dfs, ignore_index=True)
+def _read_csv(csv_path, schema=None, measure=False):
+    # With a schema (pipeline.schema) each file is compacted as soon as it is parsed;
+    # returns (frame, memory report entries if measured)
+    if schema is None:
+        return pd.read_csv(csv_path), []
+    report = [] if measure else None
+    df = pd.read_csv(csv_path, dtype=read_dtypes(schema))
+    return apply_schema(df, schema, report, table=csv_path.stem), report or []
+
+def load_topup_data(start_year, end_year, clean_dir, raw_dir, workers=None, schema=None, report=None):
+    paths = [clean_dir / f"topup_{y}.csv" for y in range(start_year, end_year + 1)]
+    paths = [p for p in paths if p.exists()]
+    measure = report is not None
+    if workers and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_read_csv, paths, [schema] * len(paths), [measure] * len(paths)))
+    else:
+        results = [_read_csv(p, schema, measure) for p in paths]
+    if report is not None:
+        for _, entries in results:
+            report.extend(entries)
+    df_all = concat_frames([df for df, _ in results], ignore_index=True)
     df_all.to_pickle(raw_dir / "topup.pkl")
     return df_all
 
-def extract_member_ids(df, output_path):
+def _inferred_ids(chunk):
+    # Ids are read nullable so no chunk fails to parse, then given the dtype read_csv infers
+    # for a whole file: int64, or float64 where ids are missing. Chunks concatenate to
+    # load_topup_data's frame.
+    for col, dtype in TOPUP_DTYPES.items():
+        if dtype == "Int64" and col in chunk.columns:
+            s = chunk[col]
+            chunk[col] = s.astype("float64") if s.isna().any() else s.astype("int64")
+    return chunk
+
+def stream_topup_data(start_year, end_year, clean_dir, raw_dir, chunksize=1_000_000, schema=None, report=None):
+    # Yields fixed-size chunks and writes each one to raw_dir/topup_parts as it goes
+    part_dir = raw_dir / "topup_parts"
+    part_dir.mkdir(parents=True, exist_ok=True)
+    for old in part_dir.glob("topup_*.pkl"):
+        old.unlink()
+    (raw_dir / "topup.pkl").unlink(missing_ok=True)
+
+    for y in range(start_year, end_year + 1):
+        csv_path = clean_dir / f"topup_{y}.csv"
+        if not csv_path.exists():
+            continue
+        dtype = TOPUP_DTYPES if schema is None else read_dtypes(schema)
+        reader = pd.read_csv(csv_path, dtype=dtype, chunksize=chunksize)
+        for i, chunk in enumerate(reader):
+            if schema is not None:
+                chunk = apply_schema(chunk, schema, report, table=csv_path.stem)
+            else:
+                chunk = _inferred_ids(chunk)
+            chunk.to_pickle(part_dir / f"topup_{y}_{i:04d}.pkl")
+            yield chunk
+
+def read_topup_partitions(raw_dir):
+    for path in sorted((raw_dir / "topup_parts").glob("topup_*.pkl")):
+        yield pd.read_pickle(path)
+
+def read_topup_data(raw_dir):
+    if (raw_dir / "topup.pkl").exists():
+        return pd.read_pickle(raw_dir / "topup.pkl")
+    return concat_frames(read_topup_partitions(raw_dir), ignore_index=True)
+
+def _id_array(values):
+    # Non-missing ids as a sorted unique int64 array
+    values = pd.Series(values).dropna()
+    return np.unique(values.to_numpy(dtype=np.int64))
+
+def extract_member_ids(df, output_path, csv=True):
+    # Accepts the full frame or any iterable of chunks (e.g. stream_topup_data). Ids are
+    # merged into one sorted unique array as chunks arrive and saved next to output_path
+    # as .npy (see load_member_ids); csv also writes output_path for Stata.
     acct_cols = ["tppr_acct_num", "tppe_acct_num"]
-    mbr_list = []
+    chunks = [df] if isinstance(df, pd.DataFrame) else df
+    seen = np.empty(0, dtype=np.int64)
 
-    for col in acct_cols:
-        if col in df.columns:
-            mbr_list.append(df[[col]].rename(columns={col: "MBR_NUM"}))
+    for chunk in chunks:
+        for col in acct_cols:
+            if col in chunk.columns:
+                seen = np.union1d(seen, _id_array(chunk[col].unique()))
+
+    if len(seen) and seen[0] >= 0:
+        seen = seen.astype(np.min_scalar_type(seen[-1]))
+    np.save(output_path.with_suffix(".npy"), seen)
+    if csv:
+        pd.DataFrame({"MBR_NUM": seen}).to_csv(output_path, index=False)
+    return seen
+
+def load_member_ids(path):
+    # Memory-maps the sorted ids written by extract_member_ids
+    return np.load(path.with_suffix(".npy"), mmap_mode="r")
 
-    if mbr_list:
-        topup_mbr_num = pd.concat(mbr_list, ignore_index=True).drop_duplicates()
-        topup_mbr_num.to_csv(output_path, index=False)
+def is_member(ids, values):
+    # Membership of values in a sorted id array by binary search
+    values = np.asarray(values)
+    if not len(ids):
+        return np.zeros(values.shape, dtype=bool)
+    pos = np.searchsorted(ids, values)
+    pos[pos == len(ids)] = 0
+    return ids[pos] == values
 
-def load_monthly_member_data(start_year, end_year, clean_dir, raw_dir):
+def _read_member_csv(csv_path, schema=None, measure=False):
+    if schema is not None:
+        return _read_csv(csv_path, schema, measure)
+    df = pd.read_csv(csv_path)
+    for col in ["dth_dte", "adrs_ovrs_tag"]:
+        if col in df.columns:
+            df[col] = df[col].astype(str)
+    return df, []
+
+def _member_csv_paths(start_year, end_year, clean_dir):
+    paths = {}
     for y in range(start_year, end_year + 1):
-        monthly_dfs = []
-        for m in range(1, 13):
-            m_str = f"{m:02d}"
-            csv_path = clean_dir / f"topup_mbr_{y}_{m_str}.csv"
-            if csv_path.exists():
-                df = pd.read_csv(csv_path)
-                for col in ["dth_dte", "adrs_ovrs_tag"]:
-                    if col in df.columns:
-                        df[col] = df[col].astype(str)
-                monthly_dfs.append(df)
-        if monthly_dfs:
-            annual_df = pd.concat(monthly_dfs, ignore_index=True)
+        year_paths = [clean_dir / f"topup_mbr_{y}_{m:02d}.csv" for m in range(1, 13)]
+        year_paths = [p for p in year_paths if p.exists()]
+        if year_paths:
+            paths[y] = year_paths
+    return paths
+
+def load_monthly_member_data(start_year, end_year, clean_dir, raw_dir, workers=None, schema=None, report=None):
+    paths = _member_csv_paths(start_year, end_year, clean_dir)
+    measure = report is not None
+    report = [] if report is None else report
+    if not (workers and workers > 1):
+        for y, year_paths in paths.items():
+            results = [_read_member_csv(p, schema, measure) for p in year_paths]
+            for _, entries in results:
+                report.extend(entries)
+            annual_df = concat_frames([df for df, _ in results], ignore_index=True)
             annual_df.to_pickle(raw_dir / f"topup_mbr_{y}.pkl")
+        return
+
+    # Parse every month concurrently; write a year's pickle once all of its months are back
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(_read_member_csv, p, schema, measure): (y, i)
+            for y, year_paths in paths.items()
+            for i, p in enumerate(year_paths)
+        }
+        done = {y: {} for y in paths}
+        for fut in as_completed(futures):
+            y, i = futures[fut]
+            done[y][i], entries = fut.result()
+            report.extend(entries)
+            if len(done[y]) == len(paths[y]):
+                monthly_dfs = [done[y][j] for j in range(len(paths[y]))]
+                annual_df = concat_frames(monthly_dfs, ignore_index=True)
+                annual_df.to_pickle(raw_dir / f"topup_mbr_{y}.pkl")
+                del done[y]
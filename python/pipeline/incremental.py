@@ -0,0 +1,127 @@
+# pipeline/incremental.py
+import pandas as pd
+import numpy as np
+from pipeline.clean_topup import (
+    REINSTATEMENT_COLS, _collapse_columns, clean_topup_columns, categorize_mode_and_relationships,
+    handle_reinstatements, remap_mode_detail, collapse_topup_data,
+)
+from pipeline.schema import TOPUP_SCHEMA, read_dtypes, apply_schema, concat_frames
+
+PAIR_COLS = ['tppr_acct_num', 'tppe_acct_num', 'topup_amt2']
+
+
+# State layout (built by clean_topup_data(..., state={})):
+#   keys                REINSTATEMENT_COLS of every non-zero cleaned row, indexed by raw row number
+#   parked              non-R rows that reinstatements cancelled; they can be needed again
+#   next_row            raw row number the next appended file starts at
+#   acct_tp_categories  categories behind the acct_tp codes
+#   schema              schema the cleaned columns were compacted with, or None
+
+
+def _pair_isin(df, pairs):
+    return pd.MultiIndex.from_frame(df[PAIR_COLS]).isin(pairs)
+
+
+def _concat(frames):
+    nonempty = [f for f in frames if len(f)]
+    return concat_frames(nonempty).sort_index() if nonempty else frames[0]
+
+
+def _recode_acct_tp(df, old, new):
+    if 'acct_tp' not in df.columns:
+        return df
+    codes = df['acct_tp'].to_numpy()
+    values = np.where(codes >= 0, np.asarray(old, dtype=object)[codes], np.nan)
+    df['acct_tp'] = pd.Categorical(values, categories=new).codes
+    return df
+
+
+def append_topup_year(new_raw, cleaned, state):
+    # Cleans only new_raw and re-resolves reinstatements for the (payer, payee, amount)
+    # pairs it touches; every other pair's outcome is unaffected by the new rows.
+    # Returns the updated cleaned frame, the updated state and the payer accounts whose
+    # cleaned rows may have changed.
+    start = state['next_row']
+    new = new_raw.set_axis(pd.RangeIndex(start, start + len(new_raw)))
+    old_cats = state['acct_tp_categories']
+    new_cats = old_cats
+    if old_cats is not None and 'acct_tp_cde' in new.columns:
+        new_cats = old_cats.union(pd.Index(new['acct_tp_cde'].dropna().unique()))
+        acct_tp_cde = new['acct_tp_cde'].to_numpy()
+
+    new = clean_topup_columns(new)
+    new = categorize_mode_and_relationships(new, inplace=True)
+    if new_cats is not None and 'acct_tp_cde' in new_raw.columns:
+        new['acct_tp'] = pd.Categorical(acct_tp_cde[new.index - start], categories=new_cats).codes
+    if state.get('schema') is not None:
+        new = apply_schema(new, state['schema'])
+
+    parked = state['parked']
+    if new_cats is not None and not new_cats.equals(old_cats):
+        cleaned = _recode_acct_tp(cleaned.copy(), old_cats, new_cats)
+        parked = _recode_acct_tp(parked.copy(), old_cats, new_cats)
+
+    # Re-run reinstatement handling over every row of the touched pairs, in raw row order
+    pairs = pd.MultiIndex.from_frame(new[PAIR_COLS].dropna()).unique()
+    keys = _concat([state['keys'], new[REINSTATEMENT_COLS]])
+    touched = _pair_isin(keys, pairs) | keys.index.isin(new.index)
+    kept = handle_reinstatements(keys[touched]).index
+
+    in_cleaned = _pair_isin(cleaned, pairs)
+    in_parked = _pair_isin(parked, pairs)
+    pool = _concat([cleaned[in_cleaned], parked[in_parked], new[new['r_tag'] == 0]])
+    is_kept = pool.index.isin(kept)
+
+    accounts = pd.unique(pool['tppr_acct_num'])
+    cleaned = _concat([cleaned[~in_cleaned], pool[is_kept]])
+    state = {
+        'keys': keys,
+        'parked': _concat([parked[~in_parked], pool[~is_kept]]),
+        'next_row': start + len(new_raw),
+        'acct_tp_categories': new_cats,
+        'schema': state.get('schema'),
+    }
+    return cleaned, state, accounts
+
+
+def update_collapsed(indiv, cleaned, accounts, year_range=(2017, 2020), version=None):
+    # Re-collapses only the given payer accounts and splices them into indiv; version
+    # applies remap_mode_detail first (e.g. "v2" for topup_indivv2)
+    sub = cleaned[cleaned['tppr_acct_num'].isin(accounts)]
+    if version is not None:
+        sub = remap_mode_detail(sub, version)
+    fresh = collapse_topup_data(sub, year_range)
+
+    out = pd.concat([indiv[~indiv['tppr_acct_num'].isin(accounts)], fresh])
+    out = out.sort_values('tppr_acct_num', kind='stable').reset_index(drop=True)
+
+    # Counts/totals are integer only when every account appears in the cell, as in a full collapse
+    int_amt = pd.api.types.is_integer_dtype(cleaned['topup_amt'])
+    for name, period, kind, stat in _collapse_columns(year_range):
+        num = name.replace('_amt_tot', '_num').replace('_amt_mean', '_num')
+        full = bool((out[num] > 0).all())
+        if stat == 'num':
+            out[name] = out[name].astype(np.int64 if full else np.float64)
+        elif stat == 'tot':
+            out[name] = out[name].astype(np.int64 if full and int_amt else np.float64)
+    return out
+
+
+def append_year(year, clean_dir, temp_dir, year_range=(2017, 2020)):
+    # Appends clean_dir/topup_{year}.csv to the outputs of scripts/1_clean_data.py in place
+    state = pd.read_pickle(temp_dir / "topup_state.pkl")
+    cleaned = pd.read_pickle(temp_dir / "topup_trns.pkl")
+    csv_path = clean_dir / f"topup_{year}.csv"
+    if state.get('schema') is None:
+        new_raw = pd.read_csv(csv_path)
+    else:
+        new_raw = apply_schema(pd.read_csv(csv_path, dtype=read_dtypes(TOPUP_SCHEMA)), TOPUP_SCHEMA)
+
+    cleaned, state, accounts = append_topup_year(new_raw, cleaned, state)
+    cleaned.to_pickle(temp_dir / "topup_trns.pkl")
+    pd.to_pickle(state, temp_dir / "topup_state.pkl")
+
+    for name, version in [("topup_indiv.pkl", None), ("topup_indivv2.pkl", "v2")]:
+        indiv = pd.read_pickle(temp_dir / name)
+        update_collapsed(indiv, cleaned, accounts, year_range, version).to_pickle(temp_dir / name)
+    return cleaned
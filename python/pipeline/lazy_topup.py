@@ -0,0 +1,256 @@
+# pipeline/lazy_topup.py
+import numpy as np
+import pandas as pd
+from pipeline.clean_topup import (
+    DATE_FORMAT, MODE_MAPPINGS, RELATIONSHIP_CODES, RELATIONSHIP_DETAILED_CODES,
+    _collapse_cells, _collapse_frame, _hard_giro_states, clean_topup_data, collapse_topup_variants, parse_dates,
+)
+from pipeline.import_utils import _read_csv
+from pipeline.schema import TOPUP_SCHEMA, apply_schema, concat_frames
+from pipeline.sharded import _guess_date_format
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+# Polars version of clean_topup_data -> remap_mode_detail -> collapse_topup_data. The
+# yearly CSVs are scanned lazily and every step is an expression on one LazyFrame, so
+# polars plans the whole run at once: only the columns the outputs need are read, and
+# it runs multi-threaded. Reinstatements look at every year of a (payer, payee, amount)
+# pair, so the collapse year filter is applied after them, not pushed into the scan.
+# Select it per call with clean_and_collapse_files(..., backend="polars").
+
+PAIR_KEYS = ["tppr_acct_num", "tppe_acct_num", "topup_amt2"]
+# Columns cleaning adds, in the order clean_topup_data adds them
+ADDED_COLUMNS = [
+    "trns_yr", "trns_mth", "perd_dte", "perd_yr", "perd_mth", "acct_tp", "topup_amt", "cash", "cpf",
+    "r_tag", "topup_amt2", "relationship_code", "relationship_detailed_code", "mode_detail", "hardcopy",
+]
+
+
+def _require_polars():
+    if pl is None:
+        raise ImportError("backend='polars' needs polars (pip install polars)")
+
+
+def _polars_dtype(kind):
+    # ids are read as floats too (files holding missing ids write them as 1.0e8-style
+    # floats) and cast back to integers in the scan
+    return pl.Float64 if kind in ("id", "amount") else pl.String
+
+
+def scan_topup_files(start_year, end_year, clean_dir):
+    _require_polars()
+    paths = [clean_dir / f"topup_{y}.csv" for y in range(start_year, end_year + 1)]
+    paths = [p for p in paths if p.exists()]
+    schema = {col: _polars_dtype(kind) for col, kind in TOPUP_SCHEMA.items()}
+    ids = [col for col, kind in TOPUP_SCHEMA.items() if kind == "id"]
+    frames = [pl.scan_csv(p, schema_overrides=schema) for p in paths]
+    lf = pl.concat(frames, how="diagonal_relaxed").with_row_index("row")
+    return lf.with_columns(pl.col(ids).cast(pl.Int64))
+
+
+def _infer_date_format(lf, col):
+    # Format of the column's first value, as parse_dates infers it
+    first = lf.select(pl.col(col).drop_nulls().first()).collect().to_series()
+    return _guess_date_format(pd.Series(first.to_list(), dtype=object))
+
+
+def _with_dates(lf, col, out, date_format):
+    # Polars parses the inferred format; the distinct values it misses are collected and
+    # parsed by parse_dates (pandas' per-value day-first fallback, warning about anything
+    # left unparseable), so both backends give the same dates
+    text = pl.col(col).str.strip_chars()
+    if date_format in (None, "mixed"):
+        parsed = pl.lit(None, dtype=pl.Datetime("ns"))
+    else:
+        parsed = text.str.to_datetime(date_format, strict=False, time_unit="ns")
+    missed = lf.select(pl.col(col).filter(parsed.is_null() & pl.col(col).is_not_null()).unique()).collect().to_series()
+    if len(missed):
+        dates, _, _ = parse_dates(pd.Series(missed.to_list(), dtype=object), date_format, col)
+        fallback = pl.col(col).replace_strict(missed, pl.Series(dates), default=None, return_dtype=pl.Datetime("ns"))
+        parsed = parsed.fill_null(fallback)
+    return lf.with_columns(parsed.alias(out))
+
+
+def _lookup(cols, table, default=None):
+    # when/then chain over the classification table; exact keys win over "*" wildcards
+    expr = pl.lit(default, dtype=pl.Float64)
+    for key, value in sorted(table.items(), key=lambda kv: "*" not in kv[0]):
+        cond = pl.lit(True)
+        for col, k in zip(cols, key):
+            if k != "*":
+                cond = cond & (pl.col(col) == k)
+        expr = pl.when(cond).then(pl.lit(value, dtype=pl.Float64)).otherwise(expr)
+    return expr
+
+
+def apply_mode_mapping_lazy(lf, version="v1"):
+    mapping = MODE_MAPPINGS[version]
+    lut = {code: mode for mode, codes in mapping["codes"].items() for code in codes}
+    mode = pl.col("topup_mde_cde").replace_strict(lut, default=mapping["default"], return_dtype=pl.Int64)
+    hardcopy = mode.replace_strict(
+        mapping["hardcopy"], default=None if pd.isna(mapping["hardcopy_default"]) else mapping["hardcopy_default"],
+        return_dtype=pl.Float64 if pd.isna(mapping["hardcopy_default"]) else pl.Int64,
+    )
+    lf = lf.with_columns(
+        mode.cast(pl.Float64 if mapping["mode_dtype"] == "float64" else pl.Int64).alias("mode_detail"),
+        hardcopy.alias("hardcopy"),
+    )
+    if mapping["drop"]:
+        lf = lf.filter(~pl.col("mode_detail").cast(pl.Float64).is_in([float(m) for m in mapping["drop"]]))
+    return lf
+
+
+def clean_topup_lazy(lf, date_format=DATE_FORMAT, version="v1"):
+    # Same rows and columns as clean_topup_data(df) (row keeps the input position)
+    formats = date_format if isinstance(date_format, dict) else {"trns_dte": date_format, "perd_id": date_format}
+    formats = {col: formats.get(col) or _infer_date_format(lf, col) for col in ["trns_dte", "perd_id"]}
+    csh, cpf = pl.col("csh_topup_amt").fill_null(0), pl.col("cpf_trnf_amt").fill_null(0)
+    rnst_tag = pl.when((pl.col("rnst_tag") != "R").fill_null(True) & (cpf < 0)).then(pl.lit("R")).otherwise(pl.col("rnst_tag"))
+
+    lf = _with_dates(lf, "trns_dte", "trns_dte", formats["trns_dte"])
+    lf = _with_dates(lf, "perd_id", "perd_dte", formats["perd_id"])
+    lf = lf.with_columns(
+        (pl.col("acct_tp_cde").rank("dense").cast(pl.Int16) - 1).fill_null(-1).cast(pl.Int8).alias("acct_tp"),
+        csh.alias("csh_topup_amt"),
+        cpf.alias("cpf_trnf_amt"),
+        rnst_tag.alias("rnst_tag"),
+    ).with_columns(
+        pl.col("trns_dte").dt.year().alias("trns_yr"),
+        pl.col("trns_dte").dt.month().cast(pl.Int32).alias("trns_mth"),
+        pl.col("perd_dte").dt.year().alias("perd_yr"),
+        pl.col("perd_dte").dt.month().cast(pl.Int32).alias("perd_mth"),
+        (pl.col("csh_topup_amt") + pl.col("cpf_trnf_amt")).alias("topup_amt"),
+        (pl.col("csh_topup_amt") > 0).alias("cash"),
+        (pl.col("cpf_trnf_amt") > 0).alias("cpf"),
+        (pl.col("rnst_tag") == "R").fill_null(False).cast(pl.Int64).alias("r_tag"),
+    ).with_columns(
+        pl.col("topup_amt").abs().alias("topup_amt2"),
+        _lookup(["topup_by_tag", "csh_topup_cde"], RELATIONSHIP_CODES).alias("relationship_code"),
+    ).with_columns(
+        _lookup(["topup_by_tag", "in_laws_topup_cde"], RELATIONSHIP_DETAILED_CODES)
+        .fill_null(pl.col("relationship_code")).alias("relationship_detailed_code"),
+    ).drop("perd_id", "acct_tp_cde")
+    lf = _handle_reinstatements_lazy(apply_mode_mapping_lazy(lf, version))
+    kept = [col for col in lf.collect_schema().names() if col not in ADDED_COLUMNS]
+    return lf.select(kept + ADDED_COLUMNS)
+
+
+def _handle_reinstatements_lazy(lf):
+    # handle_reinstatements as window expressions over (payer, payee, amount) pair ids and
+    # pair-year ids, computed once so no window regroups the three keys; rows with a
+    # missing key or a zero amount take part in no group, as in the pandas path
+    pair, year = "pair_id", "pair_year"
+    r = pl.col("r_tag") == 1
+    yr = pl.col("trns_yr")
+
+    lf = lf.with_columns(
+        pair_id=pl.struct(PAIR_KEYS).rank("dense"),
+        in_pair=(pl.col("topup_amt") != 0) & pl.all_horizontal(pl.col(c).is_not_null() for c in PAIR_KEYS)
+        & pl.col("topup_amt2").is_not_nan(),
+    ).with_columns(
+        pair_year=pl.col("pair_id").cast(pl.Int64) * 10_000 + yr,
+        in_year=pl.col("in_pair") & yr.is_not_null(),
+    )
+
+    # Within-year: both rows of a two-row group holding an R go
+    lf = lf.with_columns(
+        alive=(pl.col("topup_amt") != 0) & ~(
+            pl.col("in_year")
+            & (pl.col("in_year").sum().over(year) == 2)
+            & ((pl.col("in_year") & r).sum().over(year) > 0)
+        ),
+    )
+
+    # Cross-year: rows on or before the pair's latest R year are candidates; pairs of
+    # exactly two live rows go, otherwise the first R row cancels the first non-R row
+    latest_r = pl.when(pl.col("in_pair") & pl.col("alive") & r & yr.is_not_null()).then(yr.cast(pl.Float64))
+    lf = lf.with_columns(
+        candidate=pl.col("in_pair") & (yr.cast(pl.Float64) <= latest_r.max().over(pair)).fill_null(False),
+        group_size=(pl.col("in_pair") & pl.col("alive")).sum().over(pair),
+    ).with_columns(
+        alive=pl.col("alive") & ~(pl.col("candidate") & (pl.col("group_size") == 2)),
+    ).with_columns(candidate=pl.col("candidate") & pl.col("alive"))
+
+    firsts = []
+    for tagged in (False, True):
+        cand = pl.col("candidate") & (r == tagged)
+        first = pl.when(cand).then(pl.col("row")).min().over(pair)
+        firsts.append((cand & (pl.col("row") == first), (cand.sum().over(pair) > 0).cast(pl.Int8)))
+    tag = firsts[0][0] | firsts[1][0]
+    both = (firsts[0][1] + firsts[1][1]) == 2
+    lf = lf.with_columns(alive=pl.col("alive") & ~(tag & both))
+    return lf.filter(pl.col("alive") & ~r).drop("pair_id", "pair_year", "in_pair", "in_year", "alive", "candidate", "group_size")
+
+
+def remap_mode_detail_lazy(lf, version="v2"):
+    return apply_mode_mapping_lazy(lf.rename({"hardcopy": "hardcopy_v1"}), version)
+
+
+def collapse_topup_lazy(lf, year_range=(2017, 2020)):
+    # Rows reduced to (account, year, hardcopy, mode_detail) cells with their counts and
+    # totals; _collapse_result folds the cells with the pandas collapse helpers
+    lf = lf.filter(pl.col("trns_yr").is_between(*year_range) & pl.col("tppr_acct_num").is_not_null())
+    keys = ["tppr_acct_num", "trns_yr", "hardcopy", "mode_detail"]
+    return lf.group_by(keys).agg(
+        pl.len().alias("size"),
+        pl.col("topup_amt").count().alias("num"),
+        pl.col("topup_amt").sum().alias("tot"),
+    )
+
+
+def _collapse_result(cells, year_range, int_amt, acct_dtype):
+    # Same columns, order and dtypes as collapse_topup_data
+    acct, accts = pd.factorize(_column(cells["tppr_acct_num"]).astype(acct_dtype), sort=True)
+    year = cells["trns_yr"].to_numpy().astype(np.int64) - year_range[0]
+    hard, giro = _hard_giro_states(
+        cells["hardcopy"].cast(pl.Float64).to_numpy(), cells["mode_detail"].cast(pl.Float64).to_numpy(),
+    )
+    weights = {stat: cells[stat].cast(pl.Float64).to_numpy() for stat in ["size", "num", "tot"]}
+    kinds = _collapse_cells(acct, year, hard, giro, weights, len(accts), year_range)
+    return _collapse_frame(pd.Index(accts), kinds, year_range, int_amt)
+
+
+def _column(s):
+    # Through numpy rather than to_pandas (which needs pyarrow); missing strings are NaN
+    # as read_csv leaves them
+    values = s.to_numpy()
+    if values.dtype == object:
+        values[s.is_null().to_numpy()] = np.nan
+    return values
+
+
+def _to_pandas_cleaned(df):
+    index = pd.Index(df["row"].to_numpy().astype(np.int64))
+    return pd.DataFrame({col: _column(df[col]) for col in df.columns if col != "row"}, index=index)
+
+
+def clean_and_collapse_files(start_year, end_year, clean_dir, versions=("v1", "v2"),
+                             year_range=(2017, 2020), backend="polars", schema=None,
+                             date_format=DATE_FORMAT):
+    # Reads topup_{y}.csv for the years in clean_dir and returns (cleaned, {version: indiv})
+    # as clean_topup_data followed by collapse_topup_variants would. backend="pandas" runs
+    # exactly that; "polars" runs it as one lazy query plan (see above).
+    if backend == "pandas":
+        paths = [clean_dir / f"topup_{y}.csv" for y in range(start_year, end_year + 1)]
+        df = concat_frames([_read_csv(p)[0] for p in paths if p.exists()], ignore_index=True)
+        cleaned = clean_topup_data(df, inplace=True, schema=schema, date_format=date_format)
+        return cleaned, collapse_topup_variants(cleaned, versions, year_range)
+    if backend != "polars":
+        raise ValueError(f"unknown backend {backend!r}")
+
+    cleaned = clean_topup_lazy(scan_topup_files(start_year, end_year, clean_dir), date_format)
+    plans = [cleaned] + [
+        collapse_topup_lazy(cleaned if v == "v1" else remap_mode_detail_lazy(cleaned, v), year_range)
+        for v in versions
+    ]
+    # Collected together so the shared scan and cleaning run once
+    results = pl.collect_all(plans)
+    out = _to_pandas_cleaned(results[0])
+    if schema is not None:
+        apply_schema(out, schema)
+    int_amt = pd.api.types.is_integer_dtype(out["topup_amt"])
+    acct_dtype = out["tppr_acct_num"].dtype
+    return out, {v: _collapse_result(cells, year_range, int_amt, acct_dtype) for v, cells in zip(versions, results[1:])}
@@ -0,0 +1,302 @@
+# pipeline/logit.py
+from math import erfc, sqrt
+import numpy as np
+import pandas as pd
+
+# 3. Logistic Regressions, on topup_merged_analysisv2. Terms are columns; "i." marks a
+# factor, entered as one indicator per level above the lowest (Stata's default base).
+BASE_VARS = ["i.female", "age"]
+RSTU_VARS = ["topup_all_amt_tot", "i.topup_all_num_cat"]
+EMPL_VARS = ["i.emp_status", "mltp_lst_con_wge"]
+CPFB_VARS = ["l_osra_bal_amt"]
+ADDR_VARS = ["i.close_cpf"]
+LOGIT_SPECS = {
+    "v1": BASE_VARS + ["i.race"] + RSTU_VARS + EMPL_VARS + CPFB_VARS + ADDR_VARS,
+    "v2": BASE_VARS + RSTU_VARS + EMPL_VARS + CPFB_VARS + ADDR_VARS,
+    "v3": BASE_VARS + RSTU_VARS + ["topup_all_amt_mean"] + EMPL_VARS + CPFB_VARS + ADDR_VARS,
+}
+_erfc = np.vectorize(erfc)
+
+
+def _num(s):
+    return pd.to_numeric(s).to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def add_log_balance(df):
+    # l_osra_bal_amt = ln(osra_bal_amt), missing where the balance is not positive
+    bal = _num(df["osra_bal_amt"])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df["l_osra_bal_amt"] = np.where(bal > 0, np.log(bal), np.nan)
+    return df
+
+
+def _level_name(level, col):
+    if isinstance(level, float) and level.is_integer():
+        level = int(level)
+    return f"{level}.{col}"
+
+
+def build_design(df, terms, y="hardcopy"):
+    # Compact design shared by every specification: continuous terms as columns of one
+    # float array, factors as small integer level codes (-1 missing). Indicator columns
+    # are never materialised; each fit folds its factors into one cross-classified cell id.
+    cont = [t for t in dict.fromkeys(terms) if not t.startswith("i.")]
+    factors = [t[2:] for t in dict.fromkeys(terms) if t.startswith("i.")]
+    dense = np.empty((len(df), len(cont)), order="F")
+    for j, col in enumerate(cont):
+        dense[:, j] = _num(df[col])
+    codes, levels = {}, {}
+    for col in factors:
+        c, lv = pd.factorize(pd.Series(_num(df[col])), sort=True)
+        codes[col] = c.astype(np.int8 if len(lv) < 127 else np.int32)
+        levels[col] = list(lv)
+    yv = _num(df[y])
+    return {"y": np.where(np.isnan(yv), np.nan, yv != 0), "dense": dense, "cont": cont, "codes": codes, "levels": levels}
+
+
+def _spec_data(design, terms):
+    # Rows with every term and y present (listwise deletion, as logit does), the spec's
+    # dense columns, and its cell id with the cell -> indicator-column map
+    cont = [t for t in terms if not t.startswith("i.")]
+    factors = [t[2:] for t in terms if t.startswith("i.")]
+    idx = [design["cont"].index(t) for t in cont]
+    keep = ~np.isnan(design["y"])
+    for j in idx:
+        keep &= ~np.isnan(design["dense"][:, j])
+    for col in factors:
+        keep &= design["codes"][col] >= 0
+    rows = np.flatnonzero(keep)
+
+    # Levels whose members all share one outcome predict it perfectly; as logit does, they
+    # are dropped with their rows, until no level does
+    omitted = []
+    while True:
+        y = design["y"][rows]
+        drop = np.zeros(len(rows), dtype=bool)
+        for col in factors:
+            c = design["codes"][col][rows]
+            count = np.bincount(c, minlength=len(design["levels"][col]))
+            hits = np.bincount(c, y, minlength=len(design["levels"][col]))
+            perfect = np.flatnonzero((count > 0) & ((hits == 0) | (hits == count)))
+            perfect = perfect[perfect > 0]
+            omitted += [_level_name(design["levels"][col][k], col) for k in perfect]
+            drop |= np.isin(c, perfect)
+        if not drop.any():
+            break
+        rows = rows[~drop]
+
+    # Cells in mixed radix over the factors' levels; rows are ordered by cell so per-cell
+    # sums are one reduceat over contiguous runs, and only cells that occur are kept
+    cell = np.zeros(len(rows), dtype=np.int64)
+    for col in factors:
+        cell = cell * len(design["levels"][col]) + design["codes"][col][rows]
+    # (stable sorts of 16-bit ints are radix sorts)
+    order = np.argsort(cell.astype(np.int16) if cell.max(initial=0) < 2**15 else cell, kind="stable")
+    rows, cell = rows[order], cell[order]
+    used, starts, counts = np.unique(cell, return_index=True, return_counts=True)
+
+    # Indicator columns (levels above the lowest that occur in the sample)
+    names, ind = ["_cons"], [np.ones(len(used))]
+    rest = used.copy()
+    digits = {}
+    for col in reversed(factors):
+        n_lv = len(design["levels"][col])
+        digits[col], rest = rest % n_lv, rest // n_lv
+    for col in factors:
+        for k, level in enumerate(design["levels"][col][1:], start=1):
+            if (digits[col] == k).any():
+                names.append(_level_name(level, col))
+                ind.append((digits[col] == k).astype(np.float64))
+    return {
+        "rows": rows,
+        "y": design["y"][rows].astype(np.float64),
+        "dense": np.column_stack([design["dense"][:, j].take(rows) for j in idx] or [np.empty((len(rows), 0))]),
+        "cont": cont,
+        "starts": starts,
+        "counts": counts,
+        "cell_x": np.column_stack(ind),
+        "cell_names": names,
+        "factors": factors,
+        "omitted": omitted,
+    }
+
+
+def _per_row(data, v):
+    # Per-cell values broadcast to the cell's rows
+    return np.repeat(v, data["counts"])
+
+
+def _per_cell(data, x):
+    return np.add.reduceat(x, data["starts"], axis=0)
+
+
+def _predict(data, beta):
+    # Linear index, probabilities and log likelihood from one exp:
+    # ln L = sum((y - 1) xb - ln(1 + e^-xb))
+    k = len(data["cont"])
+    xb = data["dense"] @ beta[:k] + _per_row(data, data["cell_x"] @ beta[k:])
+    with np.errstate(over="ignore"):
+        e = np.exp(-xb)
+    ll = float((data["y"] - 1) @ xb - np.log1p(e).sum())
+    return xb, 1 / (1 + e), ll
+
+
+def _score_hessian(data, p):
+    # X'(y - p) and X'WX with W = p(1 - p): dense blocks by matrix products, indicator
+    # blocks through per-cell sums
+    w = p * (1 - p)
+    dense, cell_x = data["dense"], data["cell_x"]
+    wd = dense * w[:, None]
+    cell_w = _per_cell(data, w)
+    cross = cell_x.T @ _per_cell(data, wd)
+    score = np.concatenate([dense.T @ (data["y"] - p), cell_x.T @ _per_cell(data, data["y"] - p)])
+    hess = np.block([
+        [dense.T @ wd, cross.T],
+        [cross, cell_x.T @ (cell_w[:, None] * cell_x)],
+    ])
+    return score, hess
+
+
+def _solve(hess, score):
+    try:
+        return np.linalg.solve(hess, score)
+    except np.linalg.LinAlgError:
+        return np.linalg.lstsq(hess, score, rcond=None)[0]
+
+
+def fit_logit(data, start=None, tol=1e-10, max_iter=50):
+    # Newton-Raphson (IRLS) from start (zeros by default) until the scaled gradient
+    # g'H^-1g is below tol; steps are halved while they lower the log likelihood
+    beta = np.zeros(len(data["cont"]) + len(data["cell_names"])) if start is None else start.copy()
+    xb, p, ll = _predict(data, beta)
+    for it in range(1, max_iter + 1):
+        score, hess = _score_hessian(data, p)
+        step = _solve(hess, score)
+        if score @ step < tol:
+            break
+        for _ in range(30):
+            new = _predict(data, beta + step)
+            if new[2] >= ll - 1e-12 * abs(ll):
+                break
+            step = step / 2
+        beta = beta + step
+        xb, p, ll = new
+    else:
+        _, hess = _score_hessian(data, p)
+    return beta, hess, xb, p, ll, it
+
+
+def _marginal_effects(data, beta, xb, p):
+    # dydx(*): continuous terms average p(1 - p) b; each factor level averages the change
+    # in probability from the base level with everything else at the observed values,
+    # for all levels of a factor in one (rows x levels) evaluation reusing e^-xb
+    k = len(data["cont"])
+    ame = dict(zip(data["cont"], np.mean(p * (1 - p)) * beta[:k]))
+    e = 1 / p - 1
+    for col in data["factors"]:
+        cols = [j for j, n in enumerate(data["cell_names"]) if n.endswith(f".{col}")]
+        if not cols:
+            continue
+        b = beta[k:][cols]
+        e_base = e * _per_row(data, np.exp(data["cell_x"][:, cols] @ b))
+        levels = 1 / (1 + e_base[:, None] * np.exp(-b)[None, :])
+        effect = levels.mean(axis=0) - np.mean(1 / (1 + e_base))
+        ame.update(zip([data["cell_names"][j] for j in cols], effect))
+    return ame
+
+
+def _fit_spec(design, terms, start=None, tol=1e-10):
+    # One specification on a design, from the starting values in start (column name ->
+    # value, zero for the rest) when given
+    data = _spec_data(design, terms)
+    columns = data["cont"] + data["cell_names"]
+    start = np.array([start.get(c, 0.0) for c in columns]) if start else None
+    beta, hess, xb, p, ll, iterations = fit_logit(data, start, tol)
+
+    cov = np.linalg.pinv(hess)
+    se = np.sqrt(np.clip(np.diag(cov), 0, None))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = beta / se
+    ame = _marginal_effects(data, beta, xb, p)
+    table = pd.DataFrame(
+        {"coef": beta, "se": se, "z": z, "p": _erfc(np.abs(z) / sqrt(2)), "ame": [ame.get(c, np.nan) for c in columns]},
+        index=pd.Index(columns, name="term"),
+    )
+    # Stata's order: terms as listed, constant last
+    order = [c for t in terms for c in ([t] if t in data["cont"] else
+             [n for n in data["cell_names"] if n.endswith(f".{t[2:]}")])]
+    table = table.loc[order + ["_cons"]]
+
+    # margins, atmeans: the prediction at the sample means of every column
+    n = len(data["y"])
+    means = np.concatenate([
+        data["dense"].mean(axis=0),
+        data["cell_x"].T @ data["counts"] / n,
+    ])
+    ybar = data["y"].mean()
+    ll_0 = n * (ybar * np.log(ybar) + (1 - ybar) * np.log(1 - ybar)) if 0 < ybar < 1 else 0.0
+    return {
+        "table": table,
+        "n": n,
+        "ll": ll,
+        "ll_0": ll_0,
+        "pseudo_r2": 1 - ll / ll_0 if ll_0 else np.nan,
+        "iterations": iterations,
+        "p_atmeans": 1 / (1 + np.exp(-means @ beta)),
+        "omitted": data["omitted"],
+    }
+
+
+def fit_logit_specs(df, specs=None, y="hardcopy", warm_start=True, tol=1e-10):
+    # Fits each specification (name -> terms) in order on one shared design, starting each
+    # from the previous fit's coefficients for the columns they share. Returns
+    # {name: {"table": coef/se/z/p/ame by column, "n", "ll", "ll_0", "pseudo_r2",
+    # "iterations", "p_atmeans", "omitted"}}, where omitted lists the perfect predictors.
+    specs = specs or LOGIT_SPECS
+    design = build_design(df, [t for terms in specs.values() for t in terms], y)
+    out = {}
+    prev = None
+    for name, terms in specs.items():
+        out[name] = _fit_spec(design, terms, prev if warm_start else None, tol)
+        prev = out[name]["table"]["coef"].to_dict()
+    return out
+
+
+def predict_logit(design, terms, coef, rows=None):
+    # Pr(y = 1) for rows of a design (all by default) from coefficients by column name;
+    # missing where a term is, or where a factor level above the base has no coefficient
+    # (omitted, or absent from the fit's sample)
+    rows = np.arange(len(design["y"])) if rows is None else rows
+    xb = np.full(len(rows), coef.get("_cons", 0.0))
+    for t in terms:
+        if t.startswith("i."):
+            col = t[2:]
+            b = np.array([0.0] + [coef.get(_level_name(lv, col), np.nan) for lv in design["levels"][col][1:]])
+            c = design["codes"][col].take(rows)
+            xb += np.where(c >= 0, b[c], np.nan)
+        else:
+            xb += coef.get(t, np.nan) * design["dense"][:, design["cont"].index(t)].take(rows)
+    return 1 / (1 + np.exp(-xb))
+
+
+def score_logit(df, terms, coef):
+    # Pr(y = 1) for the rows of any frame from coefficients by column name, without a
+    # design: factor levels with no coefficient (the base, or omitted) and terms with none
+    # add nothing; a missing term value gives a missing score
+    xb = np.full(len(df), coef.get("_cons", 0.0))
+    for t in terms:
+        if t.startswith("i."):
+            col = t[2:]
+            codes, levels = pd.factorize(pd.Series(_num(df[col])))
+            b = np.array([coef.get(_level_name(lv, col), 0.0) for lv in levels] + [np.nan])
+            xb += b[codes]
+        else:
+            xb += coef.get(t, 0.0) * _num(df[t])
+    return 1 / (1 + np.exp(-xb))
+
+
+def logit_table(results, stat="coef"):
+    # One column per specification with the constant dropped, as outreg2 ... nocons
+    table = pd.concat({name: r["table"][stat] for name, r in results.items()}, axis=1)
+    order = list(dict.fromkeys(t for r in results.values() for t in r["table"].index))
+    return table.reindex(order).drop(index="_cons", errors="ignore")
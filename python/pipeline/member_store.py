@@ -0,0 +1,135 @@
+# pipeline/member_store.py
+import re
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from pipeline.schema import concat_frames
+from pipeline.import_utils import _read_member_csv, _member_csv_paths
+
+# Layout: store_dir/{year}/{month:02d}/ holds one .npy file per column plus _meta.pkl.
+# Rows in a partition are sorted by member number, so a set of members maps to a few
+# contiguous row ranges and only those rows are read from the memory-mapped columns.
+MEMBER_KEY = "mbr_num"
+_PARTITION = re.compile(r"(\d{4})/(\d{2})$")
+
+
+def _encode(s):
+    # -> (array to save, how to restore it)
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return s.cat.codes.to_numpy(), ("category", s.cat.categories)
+    if s.dtype == object:
+        codes, uniques = pd.factorize(s)
+        return codes, ("object", pd.Index(uniques, dtype=object))
+    if isinstance(s.dtype, np.dtype):
+        return s.to_numpy(), ("numpy", None)
+    # Nullable extension dtypes are stored as float64 with NaN for missing
+    return s.to_numpy(dtype=np.float64, na_value=np.nan), (str(s.dtype), None)
+
+
+def _decode(values, how):
+    kind, categories = how
+    if kind == "category":
+        return pd.Categorical.from_codes(values, categories=categories)
+    if kind == "object":
+        return np.append(categories.to_numpy(), np.nan)[values]
+    if kind == "numpy":
+        return values
+    return pd.array(values, dtype=np.float64).astype(kind)
+
+
+def write_member_partition(df, store_dir, year, month):
+    part = store_dir / f"{year}" / f"{month:02d}"
+    part.mkdir(parents=True, exist_ok=True)
+    (part / "_meta.pkl").unlink(missing_ok=True)
+    df = df.sort_values(MEMBER_KEY, kind="stable")
+    meta = {"rows": len(df), "columns": {}}
+    for col in df.columns:
+        values, how = _encode(df[col])
+        np.save(part / f"{col}.npy", values)
+        meta["columns"][col] = how
+    # Written last: a partition without _meta.pkl is incomplete and is never read
+    pd.to_pickle(meta, part / "_meta.pkl")
+    return part
+
+
+def member_partitions(store_dir, years=None, months=None):
+    # (year, month, path) of every complete partition, pruned by year/month
+    out = []
+    for meta in sorted(store_dir.glob("*/*/_meta.pkl")):
+        m = _PARTITION.search(meta.parent.as_posix())
+        if m is None:
+            continue
+        y, mth = int(m.group(1)), int(m.group(2))
+        if (years is None or y in years) and (months is None or mth in months):
+            out.append((y, mth, meta.parent))
+    return out
+
+
+def _member_rows(keys, members):
+    # Row positions of the given members in a sorted key column: one binary search per
+    # member, so the cost follows the members asked for and not the partition size
+    lo = np.searchsorted(keys, members, side="left")
+    hi = np.searchsorted(keys, members, side="right")
+    lengths = hi - lo
+    found = lengths > 0
+    lo, lengths = lo[found], lengths[found]
+    starts = np.repeat(lo - np.cumsum(lengths) + lengths, lengths)
+    return starts + np.arange(lengths.sum())
+
+
+def read_member_partition(part, columns=None, members=None):
+    # columns projects the partition (only those .npy files are opened); members is a
+    # sorted array of member numbers whose rows are kept
+    meta = pd.read_pickle(part / "_meta.pkl")
+    columns = list(meta["columns"]) if columns is None else [c for c in columns if c in meta["columns"]]
+    rows = None
+    if members is not None:
+        keys = np.load(part / f"{MEMBER_KEY}.npy", mmap_mode="r")
+        rows = _member_rows(keys, members)
+
+    data = {}
+    for col in columns:
+        values = np.load(part / f"{col}.npy", mmap_mode="r")
+        values = np.asarray(values if rows is None else values[rows])
+        data[col] = _decode(values, meta["columns"][col])
+    return pd.DataFrame(data)
+
+
+def read_member_store(store_dir, years=None, months=None, columns=None, members=None):
+    # Member rows from the partitions of the given years/months, restricted to columns
+    # and (semi-join) to members, e.g. load_member_ids(TEMP / "topup_mbr_num.csv")
+    if members is not None:
+        members = np.asarray(members)
+        if (members[1:] <= members[:-1]).any():
+            members = np.unique(members)
+    frames = [
+        read_member_partition(part, columns, members).assign(yr=y, mth=m)
+        for y, m, part in member_partitions(store_dir, years, months)
+    ]
+    if not frames:
+        return pd.DataFrame(columns=(columns or []) + ["yr", "mth"])
+    return concat_frames(frames, ignore_index=True)
+
+
+def _store_member_csv(csv_path, store_dir, year, month, schema=None, measure=False):
+    df, report = _read_member_csv(csv_path, schema, measure)
+    write_member_partition(df, store_dir, year, month)
+    return report
+
+
+def build_member_store(start_year, end_year, clean_dir, store_dir, workers=None, schema=None, report=None):
+    # Writes every topup_mbr_{y}_{m}.csv as its own partition; months are independent,
+    # so with workers each one is parsed and written by a separate process
+    jobs = []
+    for y, year_paths in _member_csv_paths(start_year, end_year, clean_dir).items():
+        for p in year_paths:
+            jobs.append((p, store_dir, y, int(p.stem.rsplit("_", 1)[1]), schema, report is not None))
+
+    if workers and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_store_member_csv, *zip(*jobs))) if jobs else []
+    else:
+        results = [_store_member_csv(*job) for job in jobs]
+    if report is not None:
+        for entries in results:
+            report.extend(entries)
@@ -0,0 +1,183 @@
+# pipeline/merge_data.py
+import numpy as np
+import pandas as pd
+from pipeline.clean_topup import remap_mode_detail
+
+ACCT_KEYS = ["tppr_acct_num"]
+MONTH_KEYS = ["tppr_acct_num", "yr", "mth"]
+
+
+def _pack_keys(cols):
+    # (account[, year, month]) packed into one int64 that sorts like the tuple; -1 where
+    # any part is missing so it never matches
+    acct = pd.to_numeric(cols[0]).to_numpy(dtype=np.float64, na_value=np.nan)
+    key = acct.copy()
+    missing = np.isnan(acct)
+    if len(cols) == 3:
+        yr = pd.to_numeric(cols[1]).to_numpy(dtype=np.float64, na_value=np.nan)
+        mth = pd.to_numeric(cols[2]).to_numpy(dtype=np.float64, na_value=np.nan)
+        key = (acct * 10000 + yr) * 100 + mth
+        missing |= np.isnan(yr) | np.isnan(mth)
+    if np.nanmax(key, initial=0) >= 2**53:
+        raise ValueError("account numbers are too large to pack with year and month")
+    return np.where(missing, -1, key).astype(np.int64)
+
+
+def is_indexed(table):
+    return table.index.name == "merge_key" and table.index.is_monotonic_increasing and table.index.is_unique
+
+
+def index_member_table(df, keys):
+    # Sorts a member table by its keys and indexes it by the packed key (the key columns
+    # stay as columns), so merges binary-search the index instead of hashing or re-packing
+    # the whole panel. Tables that are already indexed are returned as they are; rows
+    # with a missing key can never match and are dropped.
+    if is_indexed(df):
+        return df
+    key = _pack_keys([df[col] for col in keys])
+    order = np.argsort(key, kind="stable")
+    order = order[key[order] >= 0]
+    key = key[order]
+    if (key[1:] == key[:-1]).any():
+        raise ValueError(f"member table is not unique on {keys}")
+    return df.iloc[order].set_axis(pd.Index(key, name="merge_key"))
+
+
+def lookup_member_rows(df, table, keys):
+    # Left join of df against an indexed member table: for each row of df, the table row
+    # with the same keys (all-missing when there is none). Columns df already has are kept
+    # from df, as Stata's merge does. Only the matched rows of table are copied.
+    table_key = table.index.to_numpy()
+    key = _pack_keys([df[col] for col in keys])
+    pos = np.searchsorted(table_key, key)
+    pos[pos == len(table_key)] = 0
+    matched = (table_key[pos] == key) & (key >= 0) if len(table_key) else np.zeros(len(df), dtype=bool)
+
+    cols = [c for c in table.columns if c not in df.columns]
+    found = table.iloc[pos[matched]][cols].set_axis(np.flatnonzero(matched))
+    found = found.reindex(np.arange(len(df))).set_axis(df.index)
+    return pd.concat([df, found], axis=1), matched
+
+
+def latest_transactions(cleaned, year_range=(2017, 2020), version=None):
+    # Each payer's last transaction in year_range (ties keep the later row), as the row
+    # Stata keeps when collapsing to one row per account; version applies
+    # remap_mode_detail first (e.g. "v2" for topup_indivv2)
+    sub = cleaned[cleaned["trns_yr"].between(*year_range) & cleaned["tppr_acct_num"].notna()]
+    if version is not None:
+        sub = remap_mode_detail(sub, version)
+    sub = sub.sort_values(["tppr_acct_num", "trns_dte"], kind="stable")
+    sub = sub.drop_duplicates("tppr_acct_num", keep="last")
+    return sub.rename(columns={"trns_yr": "yr", "trns_mth": "mth"})
+
+
+def merge_member_data(indiv, latest, constant, varying, con, keep_unmatched_members=False):
+    # 1. Merge Data: indiv (one row per payer, from collapse_topup_data) gains its latest
+    # transaction, then the constant member characteristics by account and the varying
+    # and contribution characteristics by (account, year, month) of that transaction.
+    # constant, varying and con must be indexed with index_member_table.
+    # keep_unmatched_members also keeps constant-table members without top-ups (v1).
+    out, _ = lookup_member_rows(indiv, index_member_table(latest, ACCT_KEYS), ACCT_KEYS)
+    out, matched = lookup_member_rows(out, constant, ACCT_KEYS)
+    out, _ = lookup_member_rows(out, varying, MONTH_KEYS)
+    out, _ = lookup_member_rows(out, con, MONTH_KEYS)
+
+    if keep_unmatched_members:
+        unmatched = np.ones(len(constant), dtype=bool)
+        used = np.searchsorted(constant.index.to_numpy(), _pack_keys([out.loc[matched, "tppr_acct_num"]]))
+        unmatched[used] = False
+        extra = constant[unmatched].reset_index(drop=True)
+        out = pd.concat([out, extra], ignore_index=True)
+        out = out.sort_values("tppr_acct_num", kind="stable", ignore_index=True)
+    return out
+
+
+# 1.1 Clean Merged Data: top-up counts and amounts filled with 0, and the variables the
+# summary statistics, trees and logits use
+FILL_KINDS = ["all", "hard", "soft"]
+QUARTILE_VARS = ["age", "topup_all_amt_tot", "osra_bal_amt", "mltp_lst_con_wge", "topup_all_amt_mean"]
+NUM_CAT_BINS = [1, 3, 5, 10]  # topup_all_num 2-3, 4-5, 6-10, 11+ -> 1-4
+
+
+def _num(s):
+    return pd.to_numeric(s).to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def xtile(s, n=4):
+    # Stata's xtile: group i holds values in (cut_{i-1}, cut_i], with the cuts at _pctile's
+    # default percentiles (the mean of two order statistics at exact positions)
+    x = _num(s)
+    valid = np.sort(x[~np.isnan(x)])
+    cuts = []
+    for k in range(1, n):
+        pos = len(valid) * k / n
+        i = int(pos)
+        cuts.append((valid[i - 1] + valid[i]) / 2 if pos == i else valid[i])
+    if not len(valid):
+        return np.full(len(x), np.nan)
+    return np.where(np.isnan(x), np.nan, np.searchsorted(cuts, x, side="left") + 1.0)
+
+
+def num_category(s):
+    # topup_all_num_cat from topup_all_num (below 2 kept as is)
+    num = _num(s)
+    cat = np.searchsorted(NUM_CAT_BINS, num, side="left").astype(np.float64)
+    return np.where(num >= 2, cat, num)
+
+
+def _age(df):
+    # Completed years at the transaction date
+    birth = pd.to_datetime(df["birth_date"])
+    day = pd.to_datetime(df["trns_dte"]).dt.day.to_numpy(dtype=np.float64, na_value=np.nan)
+    yr, mth = _num(df["yr"]), _num(df["mth"])
+    bmth = birth.dt.month.to_numpy(dtype=np.float64, na_value=np.nan)
+    bday = birth.dt.day.to_numpy(dtype=np.float64, na_value=np.nan)
+    before = (mth < bmth) | ((mth == bmth) & (day < bday))
+    age = yr - birth.dt.year.to_numpy(dtype=np.float64, na_value=np.nan) - before
+    return np.where(np.isnan(bmth) | np.isnan(day), np.nan, age)
+
+
+def clean_merged_data(merged, year_range=(2017, 2020)):
+    # topup_mergedv2 -> topup_merged_v1v2
+    dead = (pd.to_datetime(merged["trns_dte"]) > pd.to_datetime(merged["death_date"])).to_numpy()
+    df = merged.loc[~dead].drop(columns=["death_date", "topup_amt"], errors="ignore")
+
+    df["age"] = _age(df)
+    if "female" not in df.columns and "male" in df.columns:
+        df["female"] = 1 - _num(df["male"])
+
+    centre = _num(df["cpf_centre"])
+    centre[np.isnan(centre) & ~np.isnan(_num(df["postal_2d"]))] = 0
+    centre[_num(df["ad_overseas"]) == 1] = 0
+    df["cpf_centre"] = centre
+    df["close_cpf"] = np.where(np.isnan(centre), np.nan, centre > 0)
+    df["osra_bal_amt"] = df[["oa_bal_amt", "sa_bal_amt", "ra_bal_amt"]].sum(axis=1, min_count=0)
+
+    years = [f"_{y}" for y in range(year_range[0], year_range[1] + 1)]
+    fill = [f"topup_{kind}_num{y}" for kind in FILL_KINDS for y in [""] + years]
+    fill += [f"topup_{kind}_amt_{stat}{y}" for stat in ["mean", "tot"] for kind in FILL_KINDS for y in [""] + years]
+    df[fill] = df[fill].fillna(0)
+
+    df["topup_all_num_cat"] = num_category(df["topup_all_num"])
+
+    df["mltp_lst_con_wge"] = df["mltp_lst_con_wge"].fillna(0)
+    for col in QUARTILE_VARS:
+        df[f"xt{col}"] = xtile(df[col])
+    return df.reset_index(drop=True)
+
+
+def analysis_sample(df, mixed=False):
+    # Payers with more than one top-up, flagged only_hardcopy / only_softcopy
+    # (topup_merged_analysis_mixed when mixed), otherwise only those who used hardcopy only
+    # or softcopy only, with hard = 1 for hardcopy only (topup_merged_analysisv2)
+    df = df[_num(df["topup_all_num"]) > 1]
+    only_hard = _num(df["topup_soft_num"]) == 0
+    only_soft = _num(df["topup_hard_num"]) == 0
+    if mixed:
+        df = df.reset_index(drop=True)
+        df["only_hardcopy"] = only_hard.astype(np.float64)
+        df["only_softcopy"] = only_soft.astype(np.float64)
+        return df
+    df = df[only_hard | only_soft].reset_index(drop=True)
+    df["hard"] = np.where(only_soft[only_hard | only_soft], 0.0, 1.0)
+    return df
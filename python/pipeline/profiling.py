@@ -0,0 +1,161 @@
+# pipeline/profiling.py
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from pathlib import Path
+
+# Running peak (bytes) of each stage currently open, innermost last
+_open_peaks = []
+
+# Trace being recorded by start_trace, or None. Instrumented code checks it before
+# measuring anything, so with tracing off stages and steps run untouched.
+_trace = None
+_NO_STEP = nullcontext({})
+
+
+def _rows(out):
+    # Stages returning several frames (dict or tuple) report their total rows, stages that
+    # only write files none
+    if out is None:
+        return 0
+    if isinstance(out, dict):
+        return sum(map(_rows, out.values()))
+    if isinstance(out, tuple):
+        return sum(map(_rows, out))
+    return len(out)
+
+
+def _start(memory):
+    # -> what _stop needs to measure the block that starts now
+    started = base = None
+    if memory:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        if _open_peaks:
+            _open_peaks[-1] = max(_open_peaks[-1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        _open_peaks.append(base)
+    return started, base, time.perf_counter(), time.process_time()
+
+
+def _stop(token):
+    # Wall and CPU seconds and, when memory was traced, the peak allocated above the level
+    # at entry and what is still allocated at exit
+    started, base, wall, cpu = token
+    out = {"seconds": time.perf_counter() - wall, "cpu_seconds": time.process_time() - cpu}
+    if base is not None:
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(peak, _open_peaks.pop())
+        if _open_peaks:
+            _open_peaks[-1] = max(_open_peaks[-1], peak)
+        if started:
+            tracemalloc.stop()
+        out["peak_mb"] = (peak - base) / 2**20
+        out["retained_mb"] = (current - base) / 2**20
+    return out, wall
+
+
+def _record(name, category, measured, wall, args):
+    # One Chrome trace "complete" event; nested stages and steps nest by time
+    args = {**args, **{k: round(v, 3) for k, v in measured.items() if k != "seconds"}}
+    _trace["events"].append({
+        "name": name,
+        "cat": category,
+        "ph": "X",
+        "ts": round((wall - _trace["t0"]) * 1e6),
+        "dur": round(measured["seconds"] * 1e6),
+        "pid": os.getpid(),
+        "tid": threading.get_ident(),
+        "args": args,
+    })
+
+
+def start_trace(path, memory=True):
+    # Records every run_stage, @traced function and step() until stop_trace, which writes
+    # them to path as a Chrome trace (chrome://tracing or ui.perfetto.dev). memory=False
+    # skips tracemalloc, which slows stages that allocate many Python objects.
+    global _trace
+    _trace = {"path": Path(path), "memory": memory, "events": [], "t0": time.perf_counter()}
+
+
+def stop_trace():
+    # Writes the trace started by start_trace and returns its events
+    global _trace
+    trace, _trace = _trace, None
+    if trace is None:
+        return None
+    trace["path"].parent.mkdir(parents=True, exist_ok=True)
+    with open(trace["path"], "w") as f:
+        json.dump({"traceEvents": trace["events"], "displayTimeUnit": "ms"}, f)
+    return trace["events"]
+
+
+@contextmanager
+def _step(name, rows_in):
+    info = {}
+    token = _start(_trace["memory"])
+    try:
+        yield info
+    finally:
+        measured, wall = _stop(token)
+        if _trace is not None:
+            _record(name, "step", measured, wall, {"rows_in": rows_in, **info})
+
+
+def step(name, rows_in=None):
+    # Times a block inside a stage while a trace is being recorded:
+    #     with step("parse_dates", rows_in=len(df)) as s:
+    #         ...
+    #         s["rows_out"] = len(out)
+    if _trace is None:
+        return _NO_STEP
+    return _step(name, rows_in)
+
+
+def run_stage(report, name, func, /, *args, rows_in=None, **kwargs):
+    # Runs func(*args, **kwargs) and, when report is a list, appends rows in/out, wall and
+    # CPU time and the peak memory allocated above the level at stage entry. rows_in
+    # defaults to the length of the first argument when that is a frame or array; stages
+    # reading files (loaders) report none. The stage is also traced while start_trace is
+    # recording. Otherwise func runs untouched.
+    if report is None and _trace is None:
+        return func(*args, **kwargs)
+
+    token = _start(report is not None or _trace["memory"])
+    try:
+        out = func(*args, **kwargs)
+    finally:
+        measured, wall = _stop(token)
+
+    if rows_in is None and args and hasattr(args[0], "shape"):
+        rows_in = len(args[0])
+    rows = {"rows_in": rows_in, "rows_out": _rows(out)}
+    if _trace is not None:
+        _record(name, "stage", measured, wall, rows)
+    if report is not None:
+        report.append({
+            "stage": name,
+            **rows,
+            "seconds": round(measured["seconds"], 3),
+            "cpu_seconds": round(measured["cpu_seconds"], 3),
+            "peak_mb": round(measured["peak_mb"], 1),
+            "retained_mb": round(measured["retained_mb"], 1),
+        })
+    return out
+
+
+def traced(func):
+    # Decorator: calls of func are traced as stages named after it (first argument is the
+    # stage input); with no trace recording it costs one check per call
+    @wraps(func)
+    def wrapper(df, /, *args, **kwargs):
+        if _trace is None:
+            return func(df, *args, **kwargs)
+        return run_stage(None, func.__name__, func, df, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,208 @@
+# pipeline/resample.py
+import os
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from pipeline.cart import CART_FEATURES, LEARN_SHARE, MAX_BINS, MIN_SPLIT, RULES, bin_features, route, select_subtrees
+from pipeline.logit import LOGIT_SPECS, _fit_spec, build_design, fit_logit_specs, predict_logit
+from pipeline.sharded import scratch_dir
+
+# Bootstrap and cross-validation of the hardcopy logits and trees on the analysis sample.
+# The logit design, the binned tree features and hardcopy are written once as .npy files
+# (in /dev/shm when it has room); pool workers memory-map them and each replicate is sent
+# as its training and held-out row numbers only. Replicate metrics are yielded as the
+# workers finish them, so callers can write them out while the rest run.
+N_REPLICATES = 200
+N_FOLDS = 10
+# Bootstrap intervals are percentile intervals at this level
+LEVEL = .95
+_shared = {}  # data_dir -> memory-mapped arrays, opened once per worker process
+
+
+def resamples(n, kind="bootstrap", replicates=N_REPLICATES, folds=N_FOLDS, seed=123):
+    # (replicate, training rows, held-out rows): bootstrap draws n rows with replacement
+    # and holds out the rows never drawn; cv holds out each of folds random folds in turn
+    rng = np.random.default_rng(seed)
+    if kind == "bootstrap":
+        for r in range(replicates):
+            train = rng.integers(0, n, n, dtype=np.int64)
+            drawn = np.zeros(n, dtype=bool)
+            drawn[train] = True
+            yield r, np.sort(train), np.flatnonzero(~drawn)
+    elif kind == "cv":
+        fold = rng.permutation(np.arange(n) % folds)
+        for r in range(folds):
+            yield r, np.flatnonzero(fold != r), np.flatnonzero(fold == r)
+    else:
+        raise ValueError(f"kind must be bootstrap or cv, not {kind}")
+
+
+def _auc(y, score):
+    # Mann-Whitney AUC with average ranks for ties
+    _, inverse, counts = np.unique(score, return_inverse=True, return_counts=True)
+    ends = np.cumsum(counts)
+    ranks = (ends - (counts - 1) / 2)[inverse]
+    n_pos = y.sum()
+    n_neg = len(y) - n_pos
+    if not n_pos or not n_neg:
+        return np.nan
+    return (ranks[y].sum() - n_pos * (n_pos + 1) / 2) / (n_pos * n_neg)
+
+
+def _metrics(y, p):
+    # Held-out accuracy (at Pr = .5), log loss, Brier score and AUC
+    y = y.astype(bool)
+    q = np.clip(p, 1e-15, 1 - 1e-15)
+    return {
+        "n_test": len(y),
+        "accuracy": np.mean((p >= .5) == y) if len(y) else np.nan,
+        "log_loss": -np.mean(np.where(y, np.log(q), np.log1p(-q))) if len(y) else np.nan,
+        "brier": np.mean((p - y) ** 2) if len(y) else np.nan,
+        "auc": _auc(y, p),
+    }
+
+
+def _take(design, rows):
+    return {
+        "y": design["y"].take(rows),
+        "dense": design["dense"].take(rows, axis=0),
+        "cont": design["cont"],
+        "codes": {col: c.take(rows) for col, c in design["codes"].items()},
+        "levels": design["levels"],
+    }
+
+
+def _fit_replicate(shared, meta, replicate, train, test):
+    # Every model on one replicate -> long rows (model, stat, term, value)
+    out = []
+    design = {**meta["design"], "y": shared["y"], "dense": shared["dense"], "codes": {
+        col: shared[f"code_{col}"] for col in meta["design"]["levels"]
+    }}
+    sub = _take(design, train)
+    y_test = design["y"].take(test)
+    for name, terms in meta["specs"].items():
+        fit = _fit_spec(sub, terms, meta["start"][name])
+        table = fit["table"]
+        out += [(name, stat, term, v) for stat in ["coef", "ame"] for term, v in table[stat].items()]
+        p = predict_logit(design, terms, table["coef"].to_dict(), test)
+        ok = ~np.isnan(p) & ~np.isnan(y_test)
+        metrics = {"n_train": fit["n"], **_metrics(y_test[ok], p[ok])}
+        out += [(name, stat, "", v) for stat, v in metrics.items()]
+
+    target = shared["target"]
+    for name, cols in meta["cart_columns"].items():
+        keep = shared[f"keep_{name}"]
+        codes = np.ascontiguousarray(shared["cart_codes"][:, cols])
+        rows, held = train[keep[train]], test[keep[test]]
+        # crtrees' own learning/test split of the training rows picks the subtree; rows
+        # drawn more than once stay on one side
+        learn = (np.random.default_rng(meta["seed"] + replicate).random(len(keep)) < meta["learn_share"])[rows]
+        fit = select_subtrees(codes, target, rows[learn], rows[~learn], meta["cart_bins"][name], meta["rules"],
+                              meta["min_split"])
+        tree = fit["tree"]
+        share = tree["counts"][:, 1] / tree["counts"].sum(axis=1)
+        for rule, r in fit["fits"].items():
+            node = route(tree, codes[held], r["collapsed"])
+            metrics = {"n_train": len(rows), "n_leaves": r["n_leaves"], **_metrics(target[held], share[node])}
+            out += [(f"{name}_{rule}", stat, "", v) for stat, v in metrics.items()]
+    return replicate, out
+
+
+def _run_replicate(data_dir, meta, replicate, train, test):
+    if data_dir not in _shared:
+        _shared.clear()
+        _shared[data_dir] = {p.stem: np.load(p, mmap_mode="r") for p in Path(data_dir).glob("*.npy")}
+    return _fit_replicate(_shared[data_dir], meta, replicate, train, test)
+
+
+def _frame(kind, replicate, rows):
+    out = pd.DataFrame(rows, columns=["model", "stat", "term", "value"])
+    out.insert(0, "replicate", replicate)
+    out.insert(0, "kind", kind)
+    return out
+
+
+def resample_models(df, kind="bootstrap", specs=None, feature_sets=None, y="hardcopy", replicates=N_REPLICATES,
+                    folds=N_FOLDS, seed=123, workers=None, rules=RULES, max_bins=MAX_BINS, min_split=MIN_SPLIT,
+                    learn_share=LEARN_SHARE, tmp_dir=None):
+    # Refits every logit specification and tree feature set on each replicate of df and
+    # yields one long frame per replicate (kind, replicate, model, stat, term, value), in
+    # the order replicates finish: coef and ame by term for logits, and for every model
+    # n_train and held-out n_test, accuracy, log_loss, brier and auc (trees score rows by
+    # their leaf's hardcopy share, as one model per rule). Logits start from the full
+    # sample fit; trees use the full sample's bins.
+    specs = LOGIT_SPECS if specs is None else specs
+    feature_sets = CART_FEATURES if feature_sets is None else feature_sets
+    design = build_design(df, [t for terms in specs.values() for t in terms], y)
+    full = fit_logit_specs(df, specs, y) if specs else {}
+    features = list(dict.fromkeys(f for fs in feature_sets.values() for f in fs))
+    cart_codes, bins, _ = bin_features(df, features, max_bins)
+    present = {f: df[f].notna().to_numpy() for f in features}
+
+    shared = {
+        "y": design["y"].astype(np.float64),
+        "dense": design["dense"],
+        "target": design["y"] == 1,
+        "cart_codes": cart_codes,
+        **{f"code_{col}": c for col, c in design["codes"].items()},
+    }
+    for name, fs in feature_sets.items():
+        keep = ~np.isnan(shared["y"])
+        for f in fs:
+            keep &= present[f]
+        shared[f"keep_{name}"] = keep
+    meta = {
+        "design": {"cont": design["cont"], "levels": design["levels"]},
+        "specs": specs,
+        "start": {name: r["table"]["coef"].to_dict() for name, r in full.items()},
+        "cart_columns": {name: [features.index(f) for f in fs] for name, fs in feature_sets.items()},
+        "cart_bins": {name: {f: bins[f] for f in fs} for name, fs in feature_sets.items()},
+        "rules": rules,
+        "min_split": min_split,
+        "learn_share": learn_share,
+        "seed": seed,
+    }
+    plan = resamples(len(df), kind, replicates, folds, seed)
+
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        for replicate, train, test in plan:
+            yield _frame(kind, *_fit_replicate(shared, meta, replicate, train, test))
+        return
+
+    if tmp_dir is None:
+        tmp_dir = scratch_dir(sum(values.nbytes for values in shared.values()))
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as data_dir:
+        for name, values in shared.items():
+            np.save(Path(data_dir) / f"{name}.npy", values)
+        del shared
+        # At most two replicates per worker are queued, so the index arrays of the whole
+        # plan never sit in memory at once
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            for replicate, train, test in plan:
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for f in done:
+                        yield _frame(kind, *f.result())
+                pending.add(pool.submit(_run_replicate, data_dir, meta, replicate, train, test))
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for f in done:
+                    yield _frame(kind, *f.result())
+
+
+def summarize_replicates(replicates, level=LEVEL):
+    # Per (kind, model, stat, term): replicates, mean, standard deviation (the bootstrap
+    # standard error) and percentile interval
+    g = replicates.groupby(["kind", "model", "stat", "term"], sort=False)["value"]
+    a = (1 - level) / 2
+    return pd.DataFrame({
+        "replicates": g.count(),
+        "mean": g.mean(),
+        "sd": g.std(),
+        "lo": g.quantile(a),
+        "hi": g.quantile(1 - a),
+    }).reset_index()
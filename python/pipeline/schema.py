@@ -0,0 +1,165 @@
+# pipeline/schema.py
+import numpy as np
+import pandas as pd
+
+# Column kinds:
+#   id      account/member numbers -> smallest unsigned int that fits (nullable if missing)
+#   code    short codes and tags -> categorical (read as strings so leading zeros survive)
+#   date    raw date strings -> categorical; parse_dates then parses each category once
+#   amount  money -> float32
+#   flag    0/1 and small integer codes -> smallest int that fits (nullable if missing)
+TOPUP_SCHEMA = {
+    "tppr_acct_num": "id",
+    "tppe_acct_num": "id",
+    "trns_dte": "date",
+    "perd_id": "date",
+    "acct_tp_cde": "code",
+    "csh_topup_amt": "amount",
+    "cpf_trnf_amt": "amount",
+    "rnst_tag": "code",
+    "topup_by_tag": "code",
+    "csh_topup_cde": "code",
+    "in_laws_topup_cde": "code",
+    "topup_mde_cde": "code",
+}
+
+# Columns clean_topup_data adds or keeps; dates are already datetime64 by then
+CLEANED_TOPUP_SCHEMA = {
+    **{col: kind for col, kind in TOPUP_SCHEMA.items() if kind != "date"},
+    "topup_amt": "amount",
+    "topup_amt2": "amount",
+    "acct_tp": "flag",
+    "cash": "flag",
+    "cpf": "flag",
+    "r_tag": "flag",
+    "relationship_code": "flag",
+    "relationship_detailed_code": "flag",
+    "mode_detail": "flag",
+    "hardcopy": "flag",
+    "hardcopy_v1": "flag",
+}
+
+MEMBER_SCHEMA = {
+    "mbr_num": "id",
+    "perd_id": "date",
+    "brth_dte": "date",
+    "dth_dte": "date",
+    "lst_con_dte": "date",
+    "gndr_cde": "code",
+    "rc_grp_cde": "code",
+    "ctzn_grp_cde": "code",
+    "empl_sts_cde": "code",
+    "ee_cum_sem_tag": "code",
+    "adrs_ovrs_tag": "code",
+    "adrs_sctr_cde": "flag",
+    "lst_con_rm": "id",
+    "lst_con_ssic": "code",
+    "lst_con_ern": "amount",
+    "mltp_lst_con_wge": "amount",
+}
+
+# Declared top-up schema for chunked reads, so every chunk of every year parses the same way
+# (stream_topup_data casts the nullable ids back to what load_topup_data's read infers)
+TOPUP_DTYPES = {
+    "tppr_acct_num": "Int64",
+    "tppe_acct_num": "Int64",
+    "trns_dte": str,
+    "perd_id": str,
+    "acct_tp_cde": str,
+    "csh_topup_amt": "float64",
+    "cpf_trnf_amt": "float64",
+    "rnst_tag": str,
+    "topup_by_tag": str,
+    "csh_topup_cde": str,
+    "in_laws_topup_cde": str,
+    "topup_mde_cde": str,
+}
+
+_INT_DTYPES = ["uint8", "int8", "uint16", "int16", "uint32", "int32", "uint64", "int64"]
+
+
+def read_dtypes(schema):
+    # dtype= for pd.read_csv: codes and dates stay strings, the rest is compacted afterwards
+    return {col: str for col, kind in schema.items() if kind in ("code", "date")}
+
+
+def _compact_int(s):
+    if pd.api.types.is_bool_dtype(s):
+        return s
+    values = pd.to_numeric(s)
+    nonnull = values.dropna()
+    if len(nonnull) and not (nonnull == np.round(nonnull)).all():
+        return values
+    lo, hi = (nonnull.min(), nonnull.max()) if len(nonnull) else (0, 0)
+    dtype = next((t for t in _INT_DTYPES if np.iinfo(t).min <= lo and hi <= np.iinfo(t).max), "float64")
+    if values.isna().any() and dtype != "float64":
+        dtype = dtype.replace("uint", "UInt").replace("int", "Int")
+    return values.astype(dtype)
+
+
+def _compact(s, kind):
+    if kind in ("code", "date"):
+        return s.astype("category")
+    if kind == "amount":
+        return s.astype(np.float32)
+    try:
+        return _compact_int(s)
+    except (ValueError, TypeError):
+        # Non-numeric ids are kept as categories rather than failing the load
+        return s.astype("category")
+
+
+def memory_by_column(df):
+    return df.memory_usage(index=False, deep=True) / 2**20
+
+
+def apply_schema(df, schema, report=None, table=None):
+    # Converts the schema's columns present in df in place and returns df. A report list
+    # gets one entry per converted column with its dtype and MB before and after.
+    before = memory_by_column(df) if report is not None else None
+    old_dtypes = df.dtypes
+    for col, kind in schema.items():
+        if col in df.columns:
+            df[col] = _compact(df[col], kind)
+
+    if report is not None:
+        after = memory_by_column(df)
+        for col in schema:
+            if col in df.columns:
+                report.append({
+                    "table": table,
+                    "column": col,
+                    "dtype_before": str(old_dtypes[col]),
+                    "dtype_after": str(df[col].dtype),
+                    "mb_before": before[col],
+                    "mb_after": after[col],
+                })
+    return df
+
+
+def concat_frames(frames, **kwargs):
+    # pd.concat that keeps categoricals categorical when frames (e.g. files or chunks) saw
+    # different codes: categories are unioned, in sorted order, before concatenating
+    frames = list(frames)
+    for col in frames[0].columns if frames else []:
+        dtypes = [f[col].dtype for f in frames if col in f.columns]
+        if not all(isinstance(t, pd.CategoricalDtype) for t in dtypes) or all(t == dtypes[0] for t in dtypes):
+            continue
+        cats = pd.Index([]).append([t.categories for t in dtypes]).unique()
+        cats = cats.sort_values() if len(cats) else cats
+        frames = [
+            f.assign(**{col: f[col].cat.set_categories(cats)}) if col in f.columns else f
+            for f in frames
+        ]
+    return pd.concat(frames, **kwargs)
+
+
+def summarize_memory(report):
+    # Per-column totals over every file/chunk in a report filled by apply_schema
+    out = pd.DataFrame(report).groupby("column", sort=False).agg(
+        dtype_before=("dtype_before", "first"),
+        dtype_after=("dtype_after", "first"),
+        mb_before=("mb_before", "sum"),
+        mb_after=("mb_after", "sum"),
+    )
+    return out.reset_index()
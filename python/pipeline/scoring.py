@@ -0,0 +1,150 @@
+# pipeline/scoring.py
+import numpy as np
+import pandas as pd
+from pipeline.clean_topup import (
+    DATE_FORMAT, MODE_MAPPINGS, REINSTATEMENT_COLS, _collapse_frame, _fold_kinds, _hard_giro_states, _lookup,
+    _mode_lookup, clean_topup_columns, handle_reinstatements,
+)
+from pipeline.logit import score_logit
+from pipeline.merge_data import num_category
+
+# Online scoring of payer accounts from micro-batches of raw top-ups. An AccountStore keeps
+# collapse_topup_data's counts and totals per account as (year, hardcopy state, GIRO
+# state) cells, with the reinstatement keys and outcome of every non-zero row. A batch is
+# cleaned with clean_topup_columns and the store's mode mapping, reinstatements are
+# re-resolved over the rows of the (payer, payee, amount) pairs it touches (no other pair's
+# outcome can change, as in pipeline.incremental), and only rows whose outcome changed are
+# added to or taken from their account's cells. Features and scores are then built for
+# the affected accounts alone.
+_STATS = ["size", "num", "tot"]
+# Stored per row
+_ROW_COLUMNS = {
+    "tppr_acct_num": np.float64, "tppe_acct_num": np.float64, "topup_amt2": np.float64, "trns_yr": np.float64,
+    "r_tag": np.int64, "topup_amt": np.float64, "acct": np.int64, "cell": np.int64, "alive": bool,
+}
+_PAIR_COLS = ["tppr_acct_num", "tppe_acct_num", "topup_amt2"]
+# Raw columns cleaning needs for the aggregates; the rest of a batch is never copied
+_RAW_COLUMNS = [
+    "tppr_acct_num", "tppe_acct_num", "trns_dte", "perd_id", "csh_topup_amt", "cpf_trnf_amt", "rnst_tag",
+    "topup_mde_cde",
+]
+
+
+def _values(s):
+    return pd.to_numeric(s).to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+class AccountStore:
+    # terms and coef (column -> coefficient, e.g. a fit_logit_specs table's coef) are the
+    # scoring model; members holds its terms that are not top-up aggregates, indexed by
+    # tppr_acct_num. Without coef, scores are the features alone.
+    def __init__(self, version="v2", year_range=(2017, 2020), terms=None, coef=None, members=None,
+                 date_format=DATE_FORMAT):
+        self.version = version
+        self.year_range = year_range
+        self.terms = terms
+        self.coef = None if coef is None else dict(coef)
+        self.members = members
+        self.date_format = date_format
+        self.n_rows = 0
+        self.rows = {col: np.empty(0, dtype=dtype) for col, dtype in _ROW_COLUMNS.items()}
+        self.pairs = {}  # (payer, payee, amount) -> row numbers, in arrival order
+        self.accounts = {}  # account -> row of cells
+        self.n_years = year_range[1] - year_range[0] + 1
+        self.cells = np.zeros((0, len(_STATS), self.n_years * 9))
+
+    def _reserve(self, n_rows, n_accounts):
+        # Row and account capacity grows by doubling, so appends are amortised O(batch)
+        if n_rows > len(self.rows["alive"]):
+            size = max(n_rows, 2 * len(self.rows["alive"]))
+            for col, values in self.rows.items():
+                self.rows[col] = np.resize(values, size)
+        if n_accounts > len(self.cells):
+            grown = np.zeros((max(n_accounts, 2 * len(self.cells)),) + self.cells.shape[1:])
+            grown[:len(self.cells)] = self.cells
+            self.cells = grown
+
+    def _cells(self, df):
+        # Cell of each cleaned row under the store's mode mapping: (year, hardcopy state,
+        # GIRO state), or -1 outside year_range or for modes the mapping drops
+        mapping = MODE_MAPPINGS[self.version]
+        mode_detail = _lookup(df, ["topup_mde_cde"], _mode_lookup(self.version), mapping["default"])
+        hardcopy = pd.Series(mode_detail).map(mapping["hardcopy"]).fillna(mapping["hardcopy_default"]).to_numpy()
+        hard, giro = _hard_giro_states(hardcopy, mode_detail)
+        year = _values(df["trns_yr"]) - self.year_range[0]
+        ok = (year >= 0) & (year < self.n_years) & ~np.isin(mode_detail, mapping["drop"])
+        return np.where(ok, (np.where(ok, year, 0).astype(np.int64) * 3 + hard) * 3 + giro, -1)
+
+    def _add(self, rows, sign):
+        self.rows["alive"][rows] = sign > 0
+        acct, cell = self.rows["acct"][rows], self.rows["cell"][rows]
+        ok = (acct >= 0) & (cell >= 0)
+        acct, cell, sign = acct[ok], cell[ok], sign[ok]
+        np.add.at(self.cells, (acct, 0, cell), sign)
+        np.add.at(self.cells, (acct, 1, cell), sign)  # cleaned amounts are never missing
+        np.add.at(self.cells, (acct, 2, cell), sign * self.rows["topup_amt"][rows][ok])
+
+    def update(self, raw):
+        # Adds a batch of raw top-up rows (in file order, after every earlier batch) and
+        # returns the payer accounts whose aggregates may have changed
+        new = clean_topup_columns(raw[_RAW_COLUMNS].reset_index(drop=True), inplace=True, date_format=self.date_format)
+        n = len(new)
+        ids = np.arange(self.n_rows, self.n_rows + n)
+        keys = {col: _values(new[col]) for col in REINSTATEMENT_COLS}
+
+        # The earlier rows of every pair in the batch, re-resolved with it in row order
+        batch_pairs = pd.DataFrame({col: keys[col] for col in _PAIR_COLS}).groupby(_PAIR_COLS, sort=False).indices
+        old = [self.pairs[k] for k in batch_pairs if k in self.pairs]
+        old = np.sort(np.concatenate(old)) if old else np.empty(0, dtype=np.int64)
+        touched = pd.DataFrame(
+            {col: np.concatenate([self.rows[col][old], keys[col]]) for col in REINSTATEMENT_COLS},
+            index=np.concatenate([old, ids]),
+        )
+        alive = touched.index.isin(handle_reinstatements(touched).index)
+
+        payer = keys["tppr_acct_num"]
+        first_seen = pd.unique(payer[~np.isnan(payer)])
+        for acct in first_seen:
+            self.accounts.setdefault(acct, len(self.accounts))
+        self._reserve(self.n_rows + n, len(self.accounts))
+        for col in REINSTATEMENT_COLS:
+            self.rows[col][ids] = keys[col]
+        self.rows["topup_amt"][ids] = _values(new["topup_amt"])
+        self.rows["acct"][ids] = [self.accounts.get(a, -1) for a in payer]
+        self.rows["cell"][ids] = self._cells(new)
+        self.rows["alive"][ids] = False
+        self.n_rows += n
+        for k, pos in batch_pairs.items():
+            self.pairs[k] = np.concatenate([self.pairs[k], ids[pos]]) if k in self.pairs else ids[pos]
+
+        # Only rows that changed outcome move the aggregates
+        was = np.concatenate([self.rows["alive"][old], np.zeros(n, dtype=bool)])
+        changed = touched.index.to_numpy()[was != alive]
+        self._add(changed, np.where(alive[was != alive], 1.0, -1.0))
+        return pd.unique(self.rows["tppr_acct_num"][changed])
+
+    def features(self, accounts):
+        # collapse_topup_data's columns for accounts (zeros for accounts never seen), with
+        # topup_all_num_cat and the members' columns
+        accounts = pd.Index(accounts, name="tppr_acct_num")
+        pos = np.array([self.accounts.get(a, -1) for a in accounts], dtype=np.int64)
+        cells = self.cells[np.maximum(pos, 0)] * (pos >= 0)[:, None, None]
+        cube = np.moveaxis(cells.reshape(len(pos), len(_STATS), self.n_years, 3, 3), 0, -1)
+        kinds = {stat: _fold_kinds(cube[i]) for i, stat in enumerate(_STATS)}
+        out = _collapse_frame(accounts, kinds, self.year_range, False)
+        out["topup_all_num_cat"] = num_category(out["topup_all_num"])
+        if self.members is not None:
+            extra = self.members.reindex(accounts).drop(columns=out.columns, errors="ignore")
+            out = pd.concat([out, extra.reset_index(drop=True)], axis=1)
+        return out
+
+    def score(self, accounts):
+        # features(accounts) with the model's Pr(hardcopy) as score
+        out = self.features(accounts)
+        if self.coef is not None:
+            out["score"] = score_logit(out, self.terms, self.coef)
+        return out
+
+    def apply(self, raw):
+        # update(raw), then the changed accounts' scores
+        return self.score(self.update(raw))
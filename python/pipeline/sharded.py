@@ -0,0 +1,127 @@
+# pipeline/sharded.py
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+from pipeline.clean_topup import DATE_FORMAT, clean_topup_data, collapse_topup_variants
+from pipeline.member_store import _encode, _decode
+from pipeline.schema import concat_frames
+
+# Every key in handle_reinstatements and the collapse starts with the payer account, so
+# rows are hash-partitioned on it and each shard is cleaned and collapsed independently.
+# Columns are handed to the workers as memory-mapped .npy files (in /dev/shm where it
+# has room), so each worker reads only its own rows and nothing large is pickled to it.
+SHARD_KEY = "tppr_acct_num"
+_NAT_STRINGS = {"", "NaT", "nat", "NAT", "nan", "NaN", "NAN"}
+
+
+def scratch_dir(nbytes):
+    # /dev/shm when it has room for nbytes with headroom to spare; otherwise the system
+    # temp directory (Docker's default /dev/shm is only 64 MB)
+    shm = Path("/dev/shm")
+    if shm.is_dir() and shutil.disk_usage(shm).free > 2 * nbytes:
+        return str(shm)
+    return tempfile.gettempdir()
+
+
+def shard_of(df, n_shards):
+    hashes = pd.util.hash_pandas_object(df[SHARD_KEY], index=False).to_numpy()
+    return (hashes % np.uint64(n_shards)).astype(np.int64)
+
+
+def _guess_date_format(s, block=10_000):
+    # The format pd.to_datetime would infer from the whole column's first value, so every
+    # shard parses dates the way the serial path does ("mixed" when nothing is inferred)
+    for start in range(0, len(s), block):
+        for value in s.iloc[start:start + block].dropna():
+            if not isinstance(value, str):
+                return None
+            if value not in _NAT_STRINGS:
+                return guess_datetime_format(value, dayfirst=True) or "mixed"
+    return None
+
+
+def _write_columns(df, data_dir, categorical=()):
+    meta = {}
+    for col in df.columns:
+        values, how = _encode(df[col].astype("category") if col in categorical else df[col])
+        np.save(data_dir / f"{col}.npy", values)
+        meta[col] = how
+    pd.to_pickle(meta, data_dir / "_meta.pkl")
+
+
+def _read_rows(data_dir, rows):
+    meta = pd.read_pickle(data_dir / "_meta.pkl")
+    data = {}
+    for col, how in meta.items():
+        values = np.load(data_dir / f"{col}.npy", mmap_mode="r")
+        data[col] = _decode(np.asarray(values[rows]), how)
+    return pd.DataFrame(data, index=rows)
+
+
+def _run_shard(data_dir, start, stop, with_state, params):
+    rows = np.load(data_dir / "_rows.npy", mmap_mode="r")[start:stop]
+    df = _read_rows(data_dir, np.asarray(rows))
+    state = {} if with_state else None
+    cleaned = clean_topup_data(
+        df, inplace=True, state=state, schema=params["schema"], date_format=params["date_format"],
+    )
+    indiv = collapse_topup_variants(cleaned, params["versions"], params["year_range"])
+    return cleaned, indiv, state
+
+
+def _restore(frames, df):
+    # Shard rows are indexed by position: put them back in input order and labels
+    out = concat_frames(frames).sort_index()
+    return out.set_axis(df.index[out.index.to_numpy()])
+
+
+def clean_and_collapse_sharded(df, workers=None, n_shards=None, versions=("v1", "v2"),
+                               year_range=(2017, 2020), state=None, schema=None,
+                               date_format=DATE_FORMAT, tmp_dir=None):
+    # Equivalent to clean_topup_data(df, state=state, schema=schema) followed by
+    # collapse_topup_variants(cleaned, versions, year_range), run over n_shards account
+    # shards on a pool of workers. Returns (cleaned, {version: indiv}).
+    if not len(df):
+        cleaned = clean_topup_data(df, state=state, schema=schema, date_format=date_format)
+        return cleaned, collapse_topup_variants(cleaned, versions, year_range)
+    workers = workers or os.cpu_count()
+    n_shards = n_shards or workers
+    if date_format is None:
+        date_format = {col: _guess_date_format(df[col]) for col in ["trns_dte", "perd_id"] if col in df.columns}
+
+    shard = shard_of(df, n_shards)
+    order = np.argsort(shard, kind="stable")
+    bounds = np.searchsorted(shard[order], np.arange(n_shards + 1))
+    params = {"schema": schema, "date_format": date_format, "versions": versions, "year_range": year_range}
+
+    if tmp_dir is None:
+        # Object columns are written as int64 codes, so the shallow size is a fair estimate
+        tmp_dir = scratch_dir(df.memory_usage(index=False).sum() + order.nbytes)
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as data_dir:
+        data_dir = Path(data_dir)
+        # acct_tp codes index the categories of the whole table, not of a shard
+        _write_columns(df, data_dir, categorical=["acct_tp_cde"])
+        np.save(data_dir / "_rows.npy", order)
+        jobs = [(bounds[i], bounds[i + 1]) for i in range(n_shards) if bounds[i + 1] > bounds[i]]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_run_shard, data_dir, lo, hi, state is not None, params) for lo, hi in jobs]
+            results = [f.result() for f in futures]
+
+    cleaned = _restore([r[0] for r in results], df)
+    indiv = {}
+    for version in versions:
+        out = pd.concat([r[1][version] for r in results], ignore_index=True)
+        indiv[version] = out.sort_values(SHARD_KEY, kind="stable", ignore_index=True)
+
+    if state is not None:
+        state['next_row'] = int(df.index.max()) + 1 if len(df) else 0
+        state['acct_tp_categories'] = results[0][2]['acct_tp_categories']
+        state['schema'] = schema
+        state['keys'] = _restore([r[2]['keys'] for r in results], df)
+        state['parked'] = _restore([r[2]['parked'] for r in results], df)
+    return cleaned, indiv
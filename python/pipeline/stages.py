@@ -0,0 +1,124 @@
+# pipeline/stages.py
+import os
+import subprocess
+import sys
+from pathlib import Path
+import pandas as pd
+from pipeline.clean_topup import clean_topup_data, collapse_topup_data, remap_mode_detail
+from pipeline.dag import stage
+from pipeline.import_utils import (
+    _member_csv_paths, extract_member_ids, load_monthly_member_data, load_topup_data, read_topup_data,
+)
+from pipeline.member_store import build_member_store
+from pipeline.schema import CLEANED_TOPUP_SCHEMA, MEMBER_SCHEMA, TOPUP_SCHEMA
+
+# The steps of scripts/0_import_data.py and 1_clean_data.py as pipeline.dag stages, split
+# where they are independent: each member year, the member ids and cleaning, and the v1
+# and v2 collapses. The later numbered scripts run whole, as one stage each. Paths are
+# relative to the data directory (project_folder/data).
+ROOT = Path(__file__).resolve().parents[1]
+SCRIPTS = ROOT / "scripts"
+
+
+def _import_topup(data_dir, years, schema):
+    load_topup_data(years[0], years[1], data_dir / "clean", data_dir / "raw", schema=schema)
+
+
+def _member_ids(data_dir):
+    extract_member_ids(read_topup_data(data_dir / "raw"), data_dir / "temp" / "topup_mbr_num.csv")
+
+
+def _member_year(data_dir, year, schema, member_store):
+    if member_store:
+        build_member_store(year, year, data_dir / "clean", data_dir / "raw" / "member_store", schema=schema)
+    else:
+        load_monthly_member_data(year, year, data_dir / "clean", data_dir / "raw", schema=schema)
+
+
+def _clean_topup(data_dir, schema):
+    # The state lets scripts/append_year.py add later years without reprocessing history
+    state = {}
+    cleaned = clean_topup_data(read_topup_data(data_dir / "raw"), inplace=True, state=state, schema=schema)
+    cleaned.to_pickle(data_dir / "temp" / "topup_trns.pkl")
+    pd.to_pickle(state, data_dir / "temp" / "topup_state.pkl")
+
+
+def _collapse(data_dir, version, output, year_range):
+    # Cleaning categorizes modes under v1; other versions remap them first
+    cleaned = pd.read_pickle(data_dir / "temp" / "topup_trns.pkl")
+    if version != "v1":
+        cleaned = remap_mode_detail(cleaned, version, inplace=True)
+    collapse_topup_data(cleaned, year_range).to_pickle(data_dir / "temp" / output)
+
+
+def _script(data_dir, script, workers=None):
+    # The numbered scripts read and write project_folder/data under the working directory,
+    # so each runs as its own process from there; workers (exclusive stages) is passed on
+    # as PIPELINE_WORKERS, which the scripts with process pools use as their WORKERS
+    if Path(data_dir).parts[-2:] != ("project_folder", "data"):
+        raise ValueError(f"{script} needs the data directory at project_folder/data, not {data_dir}")
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(ROOT), env.get("PYTHONPATH")]))
+    if workers is not None:
+        env["PIPELINE_WORKERS"] = str(workers)
+    subprocess.run([sys.executable, str(SCRIPTS / script)], cwd=Path(data_dir).resolve().parents[1], env=env, check=True)
+
+
+def pipeline_stages(data_dir, years=(2013, 2020), year_range=(2017, 2020), member_store=False, compact=False):
+    # {name: stage} for the yearly CSVs present in data_dir/clean. member_store and compact
+    # are the import and clean scripts' MEMBER_STORE and COMPACT.
+    data_dir = Path(data_dir)
+    topup_schema, member_schema, cleaned_schema = (
+        (TOPUP_SCHEMA, MEMBER_SCHEMA, CLEANED_TOPUP_SCHEMA) if compact else (None, None, None)
+    )
+    for d in ["raw", "temp", "clean"]:
+        (data_dir / d).mkdir(parents=True, exist_ok=True)
+    topup_csvs = [f"clean/topup_{y}.csv" for y in range(years[0], years[1] + 1)
+                  if (data_dir / "clean" / f"topup_{y}.csv").exists()]
+
+    stages = {
+        "import_topup": stage(_import_topup, topup_csvs, ["raw/topup.pkl"], years=years, schema=topup_schema),
+        "member_ids": stage(_member_ids, ["raw/topup.pkl"], ["temp/topup_mbr_num.csv", "temp/topup_mbr_num.npy"]),
+        "clean_topup": stage(_clean_topup, ["raw/topup.pkl"], ["temp/topup_trns.pkl", "temp/topup_state.pkl"],
+                             schema=cleaned_schema),
+        "collapse_v1": stage(_collapse, ["temp/topup_trns.pkl"], ["temp/topup_indiv.pkl"],
+                             version="v1", output="topup_indiv.pkl", year_range=year_range),
+        "collapse_v2": stage(_collapse, ["temp/topup_trns.pkl"], ["temp/topup_indivv2.pkl"],
+                             version="v2", output="topup_indivv2.pkl", year_range=year_range),
+    }
+    for y in _member_csv_paths(years[0], years[1], data_dir / "clean"):
+        output = f"raw/member_store/{y}" if member_store else f"raw/topup_mbr_{y}.pkl"
+        stages[f"members_{y}"] = stage(_member_year, [f"clean/topup_mbr_{y}_*.csv"], [output],
+                                       year=y, schema=member_schema, member_store=member_store)
+
+    # The analysis scripts; member tables (temp/mbr_1719_*.pkl) come from the Stata member
+    # cleaning, outside this pipeline
+    analysis = "temp/topup_merged_analysisv2.pkl"
+    member_tables = ["mbr_1719_constant", "mbr_1719_varying_monthly", "mbr_1719_con_monthly"]
+    scripts = {
+        "merge_data": ("2_merge_data.py", [f"temp/{t}.pkl" for t in member_tables] + [
+            "temp/topup_trns.pkl", "temp/topup_indiv.pkl", "temp/topup_indivv2.pkl",
+        ], [f"temp/{t}_indexed.pkl" for t in member_tables] + [
+            "temp/topup_merged.pkl", "temp/topup_mergedv2.pkl", "temp/topup_merged_v1v2.pkl", analysis,
+            "temp/topup_merged_analysis_mixed.pkl",
+        ]),
+        "summary_statistics": ("2_1_summary_statistics.py", [
+            "temp/topup_trns.pkl", "temp/topup_merged_v1v2.pkl", analysis, "temp/topup_merged_analysis_mixed.pkl",
+        ], ["sumstats/tabstat_var.csv", "sumstats/tabstat_var_m.csv", "sumstats/hard_yr.csv"]),
+        "logistic_regressions": ("3_logistic_regressions.py", [analysis], [
+            "reg/v2logit_indiv_1720.csv", "reg/v2logit_indiv_1720_ame.csv",
+        ]),
+        "trees": ("4_trees.py", [analysis], ["log/cart_1720_rules.csv", "temp/topup_merged_cart.pkl"]),
+        "chaid_trees": ("4_1_chaid_trees.py", ["temp/topup_trns.pkl", analysis], [
+            "log/chaid_trns_1720.csv", "log/chaid_indiv_1720.csv", "temp/topup_merged_analysisv2_chaid.pkl",
+            "sumstats/chaid_indiv_sumstats.csv",
+        ]),
+        "resample_models": ("5_resample_models.py", [analysis], [
+            "reg/resample_bootstrap_1720_summary.csv", "reg/resample_cv_1720_summary.csv",
+        ]),
+    }
+    # These start a process pool of their own, so they run alone on the runner's budget
+    pooled = {"trees", "chaid_trees", "resample_models"}
+    for name, (script, inputs, outputs) in scripts.items():
+        stages[name] = stage(_script, inputs, outputs, exclusive=name in pooled, script=script)
+    return stages
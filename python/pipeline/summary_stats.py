@@ -0,0 +1,214 @@
+# pipeline/summary_stats.py
+from functools import reduce
+import numpy as np
+import pandas as pd
+
+# 2. Summary Statistics as mergeable partial aggregates. Per group a partial keeps the
+# number of rows and, per variable, the count, sum, sum of squared deviations from the mean
+# (m2), min, max and a quantile sketch: counts in logarithmic buckets whose relative
+# width is the accuracy, so any quantile is within that relative error (exact when its
+# bucket holds one distinct value, as with counts and indicators). Partials of disjoint partitions (years,
+# shards) merge without the rows, and a partial grouped by several keys rolls up to any
+# subset of them, so new years and coarser groupings never rescan the data.
+SKETCH_ACCURACY = .005
+# tabstat ..., stat(n mean median min max)
+TABSTAT_STATS = ["count", "mean", "p50", "min", "max"]
+_BIAS = 2**20  # bucket numbers are shifted by this so zero and signs get their own ranges
+
+
+def _gamma(accuracy):
+    return (1 + accuracy) / (1 - accuracy)
+
+
+def _buckets(x, accuracy):
+    # 0 for zero, +-(ceil(log_gamma |x|) + _BIAS) by sign otherwise
+    with np.errstate(divide="ignore"):
+        k = np.ceil(np.log(np.abs(x)) / np.log(_gamma(accuracy)))
+    k = np.where(x == 0, 0, np.sign(x) * (np.clip(k, 1 - _BIAS, _BIAS - 1) + _BIAS))
+    return k.astype(np.int64)
+
+
+def _bucket_values(b, accuracy):
+    # Midpoint (in relative terms) of each bucket
+    g = _gamma(accuracy)
+    k = np.abs(b) - _BIAS
+    return np.where(b == 0, 0.0, np.sign(b) * 2 * g ** k / (g + 1))
+
+
+def summarize(df, by, variables, accuracy=SKETCH_ACCURACY):
+    # Partial aggregate of df's variables per group of the by columns (missing group
+    # values are groups of their own; by=[] is the whole frame), in one pass per variable
+    by = list(by)
+    values = df[variables].apply(pd.to_numeric).astype(np.float64)
+    keys = [df[c] for c in by] or [pd.Series(0, index=df.index, name="_all")]
+    grouped = values.groupby(keys, observed=True, dropna=False, sort=True)
+    agg = grouped.agg(["count", "sum", "var", "min", "max"])
+    groups = agg.index
+    moments = agg.stack(level=0, future_stack=True)
+    moments.index = moments.index.set_names(groups.names + ["variable"])
+    moments["m2"] = (moments.pop("var") * (moments["count"] - 1)).fillna(0.0)
+
+    rows = grouped.size().rename("rows")
+    gid = grouped.ngroup().to_numpy()
+    sketch = []
+    for var in variables:
+        x = values[var].to_numpy()
+        ok = ~np.isnan(x)
+        x = x[ok]
+        key = gid[ok] * (4 * _BIAS) + _buckets(x, accuracy) + 2 * _BIAS
+        order = np.argsort(key, kind="stable")
+        key, x = key[order], x[order]
+        key, starts, counts = np.unique(key, return_index=True, return_counts=True)
+        part = groups[key // (4 * _BIAS)].to_frame(index=False)
+        part["variable"] = var
+        part["bucket"] = key % (4 * _BIAS) - 2 * _BIAS
+        part["count"] = counts
+        part["lo"] = np.minimum.reduceat(x, starts) if len(x) else x
+        part["hi"] = np.maximum.reduceat(x, starts) if len(x) else x
+        sketch.append(part)
+    out = {
+        "by": by,
+        "variables": list(variables),
+        "accuracy": accuracy,
+        "rows": rows,
+        "moments": moments,
+        "sketch": pd.concat(sketch, ignore_index=True),
+    }
+    return rollup(out, []) if not by else out
+
+
+def _combine(moments, keys):
+    # Moments of groups combined over everything but keys (Chan et al.): counts, sums and
+    # extremes add up, m2 gains each part's count times its squared distance to the new mean
+    g = moments.groupby(level=keys, sort=True, dropna=False)
+    mean = moments["sum"] / moments["count"]
+    total_mean = g["sum"].transform("sum") / g["count"].transform("sum")
+    spread = (moments["count"] * (mean - total_mean) ** 2).fillna(0.0)
+    out = pd.DataFrame({
+        "count": g["count"].sum(),
+        "sum": g["sum"].sum(),
+        "m2": (moments["m2"] + spread).groupby(level=keys, sort=True, dropna=False).sum(),
+        "min": g["min"].min(),
+        "max": g["max"].max(),
+    })
+    return out
+
+
+def _sum_rows(rows, by):
+    if not by:
+        return pd.Series([rows.sum()], index=pd.Index([0], name="_all"), name="rows")
+    return rows.groupby(level=by, sort=True, dropna=False).sum()
+
+
+def _merge_sketch(sketch, keys):
+    g = sketch.groupby(keys + ["bucket"], sort=True, dropna=False, as_index=False)
+    return g.agg(count=("count", "sum"), lo=("lo", "min"), hi=("hi", "max"))
+
+
+def merge_summaries(*parts):
+    # Partial aggregate of the union of disjoint partitions summarised with the same by
+    parts = [p for p in parts if p is not None]
+    by, variables, accuracy = parts[0]["by"], parts[0]["variables"], parts[0]["accuracy"]
+    if any((p["by"], p["variables"], p["accuracy"]) != (by, variables, accuracy) for p in parts):
+        raise ValueError("summaries must share by, variables and accuracy to merge")
+    rows = pd.concat([p["rows"] for p in parts])
+    moments = pd.concat([p["moments"] for p in parts])
+    sketch = pd.concat([p["sketch"] for p in parts], ignore_index=True)
+    keys = by + ["variable"]
+    return {
+        "by": by,
+        "variables": variables,
+        "accuracy": accuracy,
+        "rows": _sum_rows(rows, by),
+        "moments": _combine(moments, keys),
+        "sketch": _merge_sketch(sketch, keys),
+    }
+
+
+def summarize_partitions(frames, by, variables, accuracy=SKETCH_ACCURACY):
+    # One streaming pass over an iterable of frames (years, chunks, shards), holding only
+    # the running partial
+    return reduce(lambda acc, df: merge_summaries(acc, summarize(df, by, variables, accuracy)), frames, None)
+
+
+def rollup(summary, by):
+    # The partial for a subset of summary's by columns, from the partial alone
+    by = list(by)
+    if not set(by) <= set(summary["by"]):
+        raise ValueError(f"{by} is not a subset of {summary['by']}")
+    keys = by + ["variable"]
+    return {
+        "by": by,
+        "variables": summary["variables"],
+        "accuracy": summary["accuracy"],
+        "rows": _sum_rows(summary["rows"], by),
+        "moments": _combine(summary["moments"], keys),
+        "sketch": _merge_sketch(summary["sketch"], keys),
+    }
+
+
+def _key_ids(a, b):
+    # Shared integer ids for the key rows of two frames (missing values match each other,
+    # which index alignment on NaN labels does not guarantee)
+    ids_a, ids_b = np.zeros(len(a), dtype=np.int64), np.zeros(len(b), dtype=np.int64)
+    for col in a.columns:
+        codes, uniq = pd.factorize(pd.concat([a[col], b[col]], ignore_index=True), use_na_sentinel=False)
+        ids_a = ids_a * len(uniq) + codes[:len(a)]
+        ids_b = ids_b * len(uniq) + codes[len(a):]
+    return ids_a, ids_b
+
+
+def _quantiles(summary, qs):
+    # Sketch quantiles per (group, variable) in the order of the moments' rows, by Stata's
+    # percentile definition: with P = n * q, the mean of the values at ranks P and P + 1
+    # when P is a whole number, else the value at rank ceil(P); each value is that of the
+    # bucket holding the rank, within the bucket's observed range. Missing for groups
+    # with no non-missing values (they have no sketch rows).
+    keys = summary["by"] + ["variable"]
+    sk = summary["sketch"]
+    row_ids, sk_ids = _key_ids(summary["moments"].index.to_frame(index=False)[keys], sk[keys])
+    value = np.clip(_bucket_values(sk["bucket"].to_numpy(), summary["accuracy"]), sk["lo"], sk["hi"]).to_numpy()
+    order = np.lexsort((value, sk_ids))
+    sk_ids, value = sk_ids[order], value[order]
+    cum = np.cumsum(sk["count"].to_numpy()[order]).astype(np.int64)
+    groups, starts = np.unique(sk_ids, return_index=True)
+    before = np.concatenate([[0], cum[starts[1:] - 1]]).astype(np.int64)
+    n = np.diff(np.concatenate([before, cum[-1:]]))
+    at = np.minimum(np.searchsorted(groups, row_ids), max(len(groups) - 1, 0))
+    found = (groups[at] == row_ids) if len(groups) else np.zeros(len(row_ids), dtype=bool)
+    out = {}
+    for q in qs:
+        # Whole percents keep P = n * pct / 100 exact
+        pct = round(q * 100)
+        whole = n * pct % 100 == 0
+        lo = np.clip(np.where(whole, n * pct // 100, -(-n * pct // 100)) - 1, 0, n - 1)
+        hi = np.where(whole, np.minimum(lo + 1, n - 1), lo)
+        mid = (value[np.searchsorted(cum, before + lo, side="right")]
+               + value[np.searchsorted(cum, before + hi, side="right")]) / 2
+        values = np.full(len(row_ids), np.nan)
+        values[found] = mid[at[found]]
+        out[f"p{pct}"] = values
+    return out
+
+
+def finalize_summary(summary, stats=TABSTAT_STATS):
+    # tabstat-style table: one row per group, (variable, stat) columns. stats are any of
+    # count, sum, mean, var, sd, min, max and pNN percentiles (sketch estimates, clipped to
+    # the exact min and max).
+    m = summary["moments"].copy()
+    m["mean"] = m["sum"] / m["count"]
+    m["var"] = m["m2"] / (m["count"] - 1)
+    m["sd"] = np.sqrt(m["var"])
+    qs = [int(s[1:]) / 100 for s in stats if s.startswith("p")]
+    for name, values in _quantiles(summary, qs).items():
+        m[name] = np.clip(values, m["min"], m["max"])
+    table = m[list(stats)]
+    if not summary["by"]:
+        return table.stack().to_frame().T
+    return table.unstack("variable").swaplevel(axis=1).reindex(columns=summary["variables"], level=0)
+
+
+def frequencies(summary, row, col):
+    # tab row col, missing: rows per (row, col) cell, from a partial grouped by both or more
+    counts = rollup(summary, [row, col])["rows"]
+    return counts.unstack(col, fill_value=0)
@@ -0,0 +1,185 @@
+# pipeline/synthetic.py
+import numpy as np
+import pandas as pd
+from pipeline.clean_topup import MODE_DETAIL_CODES
+from pipeline.schema import TOPUP_SCHEMA, MEMBER_SCHEMA
+
+# Synthetic stand-ins for the confidential top-up and member extracts, with the same
+# columns and code values, for measuring and regression-testing pipeline speed.
+
+# Share of top-ups per mode_detail code; "blank" leaves topup_mde_cde empty and "other"
+# uses codes no mapping lists (both fall to the mapping default)
+MODE_SHARES = {1: .12, 2: .28, 3: .10, 4: .13, 5: .11, 6: .02, 7: .02, 8: .03, "blank": .15, "other": .04}
+OTHER_MODE_CODES = ["MSSD201", "MTPD301@", "PNWXAPMT"]
+
+# topup_by_tag shares, with the csh_topup_cde / in_laws_topup_cde values drawn for each tag
+TOPUP_BY_SHARES = {"O": .46, "S": .16, "T": .24, "V": .05, "W": .05, "X": .04}
+CSH_TOPUP_SHARES = {"": .6, "E": .25, "F": .15}
+IN_LAWS_SHARES = {"": .7, "I": .2, "G": .1}
+ACCT_TP_SHARES = {"SA": .7, "RA": .3}
+
+CASH_SHARE = .7
+# Share of top-ups later reversed by an R-tagged row, and of those how many post in the
+# following year rather than the same one
+REINSTATEMENT_RATE = .02
+CROSS_YEAR_SHARE = .3
+# Accounts are drawn as n_accounts * u**ACCOUNT_SKEW, so low account numbers are heavy users
+ACCOUNT_SKEW = 3.0
+ACCOUNT_BASE = 10**8
+
+TOPUP_COLUMNS = list(TOPUP_SCHEMA)
+MEMBER_COLUMNS = list(MEMBER_SCHEMA)
+
+
+def _choice(rng, shares, size):
+    keys = list(shares)
+    p = np.array(list(shares.values()), dtype=np.float64)
+    return np.asarray(keys, dtype=object)[rng.choice(len(keys), size, p=p / p.sum())]
+
+
+def _mode_codes(rng, size):
+    modes = _choice(rng, MODE_SHARES, size)
+    codes = np.empty(size, dtype=object)
+    for mode in MODE_SHARES:
+        hit = modes == mode
+        pool = {"blank": [""], "other": OTHER_MODE_CODES}.get(mode) or MODE_DETAIL_CODES[mode]
+        codes[hit] = np.asarray(pool, dtype=object)[rng.integers(0, len(pool), hit.sum())]
+    return codes
+
+
+def _dmy(dates, fmt="%d/%m/%Y"):
+    # strftime is per element, so each distinct day is formatted once
+    days, inverse = np.unique(np.asarray(dates, dtype="datetime64[D]"), return_inverse=True)
+    return pd.DatetimeIndex(days).strftime(fmt).to_numpy(dtype=object)[inverse]
+
+
+def _accounts(rng, n_accounts, size):
+    return ACCOUNT_BASE + (n_accounts * rng.random(size) ** ACCOUNT_SKEW).astype(np.int64)
+
+
+def topup_chunk(rng, size, n_accounts, start_year=2013, end_year=2020):
+    # size original top-ups plus their reinstatement (R) rows
+    years = np.arange(start_year, end_year + 1)
+    weights = np.linspace(1, 2, len(years))  # volumes grow over the years
+    year = rng.choice(years, size, p=weights / weights.sum())
+    day = rng.integers(0, 365, size)
+    dates = pd.to_datetime(year.astype(str), format="%Y").to_numpy() + day.astype("timedelta64[D]")
+
+    payer = _accounts(rng, n_accounts, size)
+    own = rng.random(size) < .4
+    payee = np.where(own, payer, _accounts(rng, n_accounts, size))
+    amt = np.clip(np.round(rng.lognormal(6.3, 0.9, size), -1), 10, 8000)
+    cash = rng.random(size) < CASH_SHARE
+    by = _choice(rng, TOPUP_BY_SHARES, size)
+
+    df = pd.DataFrame({
+        "tppr_acct_num": payer,
+        "tppe_acct_num": payee,
+        "trns_dte": dates,
+        "acct_tp_cde": _choice(rng, ACCT_TP_SHARES, size),
+        "csh_topup_amt": np.where(cash, amt, np.nan),
+        "cpf_trnf_amt": np.where(cash, np.nan, amt),
+        "rnst_tag": "",
+        "topup_by_tag": by,
+        "csh_topup_cde": np.where(by == "O", _choice(rng, CSH_TOPUP_SHARES, size), ""),
+        "in_laws_topup_cde": np.where(by == "T", _choice(rng, IN_LAWS_SHARES, size), ""),
+        "topup_mde_cde": _mode_codes(rng, size),
+    })
+
+    # Reversals repeat payer, payee and amount; CPF reversals are half the time posted as a
+    # negative transfer (tagged R by cleaning), the rest carry the R tag themselves
+    rev = df.iloc[np.flatnonzero(rng.random(size) < REINSTATEMENT_RATE)].copy()
+    rev["rnst_tag"] = "R"
+    negative = rev["cpf_trnf_amt"].notna().to_numpy() & (rng.random(len(rev)) < .5)
+    rev.loc[negative, "cpf_trnf_amt"] *= -1
+    rev.loc[negative, "rnst_tag"] = ""
+    orig = rev["trns_dte"].to_numpy()
+    later = orig + rng.integers(1, 90, len(rev)).astype("timedelta64[D]")
+    year = orig.astype("datetime64[Y]")
+    next_year = (rng.random(len(rev)) < CROSS_YEAR_SHARE) & (year.astype(int) + 1970 < end_year)
+    year = year + next_year.astype("timedelta64[Y]")
+    later[next_year] += np.timedelta64(365, "D")
+    # Same-year reversals stay within their year
+    year_end = (year + np.timedelta64(1, "Y")).astype("datetime64[ns]") - np.timedelta64(1, "D")
+    rev["trns_dte"] = np.minimum(later, year_end)
+    df = pd.concat([df, rev], ignore_index=True)
+
+    dates = df["trns_dte"].to_numpy()
+    df["trns_dte"] = _dmy(dates)
+    df["perd_id"] = _dmy(dates.astype("datetime64[M]"))
+    return df[TOPUP_COLUMNS]
+
+
+def _member_constants(mbr_num):
+    # Characteristics that never change, derived from the member number itself so every
+    # monthly file agrees on them
+    h = (mbr_num.astype(np.uint64) * np.uint64(2654435761)) % np.uint64(2**32)
+    u = (h.astype(np.float64) + .5) / 2**32
+    birth = np.datetime64("1935-01-01") + (u * 365 * 65).astype("timedelta64[D]")
+    race = np.asarray(["02", "00", "04", "O"], dtype=object)[np.searchsorted([.74, .87, .96], u * 7 % 1)]
+    ctzn = np.asarray(["S", "P", "F"], dtype=object)[np.searchsorted([.85, .97], u * 13 % 1)]
+    return {
+        "brth_dte": _dmy(birth),
+        "gndr_cde": np.where(u * 3 % 1 < .5, "M", "F"),
+        "rc_grp_cde": race,
+        "ctzn_grp_cde": ctzn,
+        "postal": 1 + (u * 11 % 1 * 82).astype(np.int64),
+    }
+
+
+def member_chunk(rng, mbr_num, year, month):
+    size = len(mbr_num)
+    const = _member_constants(mbr_num)
+    perd = np.datetime64(f"{year}-{month:02d}-01")
+    con = perd - rng.integers(0, 120, size).astype("timedelta64[D]")
+    wage = np.round(rng.lognormal(8.0, 0.7, size), 2)
+    no_con = rng.random(size) < .2
+    return pd.DataFrame({
+        "mbr_num": mbr_num,
+        "perd_id": _dmy(np.full(size, perd)),
+        "brth_dte": const["brth_dte"],
+        "dth_dte": np.where(rng.random(size) < .002, _dmy(np.full(size, perd)), ""),
+        "lst_con_dte": np.where(no_con, "", _dmy(con)),
+        "gndr_cde": const["gndr_cde"],
+        "rc_grp_cde": const["rc_grp_cde"],
+        "ctzn_grp_cde": const["ctzn_grp_cde"],
+        "empl_sts_cde": _choice(rng, {"A": .7, "S": .1, "I": .2}, size),
+        "ee_cum_sem_tag": _choice(rng, {"Y": .05, "N": .95}, size),
+        "adrs_ovrs_tag": _choice(rng, {"Y": .01, "N": .99}, size),
+        "adrs_sctr_cde": const["postal"],
+        "lst_con_rm": np.where(no_con, np.nan, _dmy(con, "%Y%m").astype(float)),
+        "lst_con_ssic": np.where(no_con, "", rng.integers(10000, 99999, size).astype(str)),
+        "lst_con_ern": np.where(no_con, np.nan, wage),
+        "mltp_lst_con_wge": np.where(no_con, np.nan, wage),
+    })[MEMBER_COLUMNS]
+
+
+def write_synthetic_data(out_dir, n_rows, start_year=2013, end_year=2020, n_accounts=None,
+                         member_rows=None, seed=0, chunksize=1_000_000):
+    # Writes topup_{y}.csv for each year and topup_mbr_{y}_{m:02d}.csv for each month in
+    # out_dir, in chunks so sizes up to ~10^8 rows never sit in memory at once. n_rows
+    # counts original top-ups (reinstatement rows come on top); member_rows is the number
+    # of members in each monthly file.
+    rng = np.random.default_rng(seed)
+    n_accounts = n_accounts or max(n_rows // 20, 100)
+    member_rows = member_rows or min(n_accounts, 1_000_000)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for y in range(start_year, end_year + 1):
+        (out_dir / f"topup_{y}.csv").unlink(missing_ok=True)
+
+    for start in range(0, n_rows, chunksize):
+        chunk = topup_chunk(rng, min(chunksize, n_rows - start), n_accounts, start_year, end_year)
+        year = chunk["trns_dte"].str[-4:].astype(int)
+        for y, part in chunk.groupby(year):
+            path = out_dir / f"topup_{y}.csv"
+            part.to_csv(path, mode="a", header=not path.exists(), index=False)
+
+    # Members: the top-up population plus members who never top up
+    for y in range(start_year, end_year + 1):
+        for m in range(1, 13):
+            path = out_dir / f"topup_mbr_{y}_{m:02d}.csv"
+            path.unlink(missing_ok=True)
+            mbr = np.sort(rng.choice(int(n_accounts * 1.2), member_rows, replace=False)) + ACCOUNT_BASE
+            for i in range(0, member_rows, chunksize):
+                part = member_chunk(rng, mbr[i:i + chunksize], y, m)
+                part.to_csv(path, mode="a", header=i == 0, index=False)
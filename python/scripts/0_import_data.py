@@ -1,5 +1,7 @@
 from pathlib import Path
-from pipeline.import_utils import load_topup_data, extract_member_ids, load_monthly_member_data
+from pipeline.schema import TOPUP_SCHEMA, MEMBER_SCHEMA, summarize_memory
+from pipeline.import_utils import load_topup_data, stream_topup_data, extract_member_ids, load_monthly_member_data
+from pipeline.member_store import build_member_store
 
 # Set up directories
 BASE_DIR = Path("project_folder/data")
@@ -7,14 +9,46 @@ RAW = BASE_DIR / "raw"
 TEMP = BASE_DIR / "temp"
 CLEAN = BASE_DIR / "clean"
 
+# Rows per chunk for bounded-memory ingestion; None reads each year whole
+CHUNKSIZE = None
+
+# Processes used to parse CSVs concurrently; None parses them one after another
+WORKERS = None
+
+# Store codes as categoricals, ids/flags as small ints and amounts as float32
+# (pipeline/schema.py), which saves memory but no longer writes the baseline's exact
+# dtypes and totals; False keeps pandas' inferred dtypes
+COMPACT = False
+topup_schema = TOPUP_SCHEMA if COMPACT else None
+member_schema = MEMBER_SCHEMA if COMPACT else None
+memory = {"topup": [], "member": []}
+
+# True writes member data as RAW/member_store, partitioned by year/month and sorted by
+# member number (read with pipeline.member_store.read_member_store), instead of the
+# yearly topup_mbr_{y}.pkl files the Stata and merge steps read; False keeps the pickles
+MEMBER_STORE = False
+
 for d in [RAW, TEMP, CLEAN]:
     d.mkdir(parents=True, exist_ok=True)
 
-# Step 1: Load and combine top-up data
-topup_all = load_topup_data(2013, 2020, CLEAN, RAW)
+# Step 1: Load and combine top-up data (streamed to RAW/topup_parts when chunked)
+if CHUNKSIZE:
+    topup_all = stream_topup_data(2013, 2020, CLEAN, RAW, chunksize=CHUNKSIZE, schema=topup_schema, report=memory["topup"])
+else:
+    topup_all = load_topup_data(2013, 2020, CLEAN, RAW, workers=WORKERS, schema=topup_schema, report=memory["topup"])
 
-# Step 2: Extract member IDs from top-up records
+# Step 2: Extract member IDs from top-up records (sorted, as topup_mbr_num.npy for
+# pipeline.import_utils.load_member_ids and as topup_mbr_num.csv for Stata)
 extract_member_ids(topup_all, TEMP / "topup_mbr_num.csv")
 
 # Step 3: Load and combine monthly member-level data
-load_monthly_member_data(2013, 2020, CLEAN, RAW)
+if MEMBER_STORE:
+    build_member_store(2013, 2020, CLEAN, RAW / "member_store", workers=WORKERS, schema=member_schema, report=memory["member"])
+else:
+    load_monthly_member_data(2013, 2020, CLEAN, RAW, workers=WORKERS, schema=member_schema, report=memory["member"])
+
+# Memory per column before and after compaction
+for table, entries in memory.items():
+    if entries:
+        print(table)
+        print(summarize_memory(entries).to_string(index=False))
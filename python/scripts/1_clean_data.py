@@ -1,21 +1,83 @@
 from pathlib import Path
 import pandas as pd
-from pipeline.clean_topup import clean_topup_data, collapse_topup_data, remap_mode_detail
+from pipeline.clean_topup import clean_topup_data, collapse_topup_variants
+from pipeline.import_utils import read_topup_data
+from pipeline.lazy_topup import clean_and_collapse_files
+from pipeline.profiling import run_stage, start_trace, stop_trace
+from pipeline.cache import StageCache
+from pipeline.schema import CLEANED_TOPUP_SCHEMA
+from pipeline.sharded import clean_and_collapse_sharded
 
 DATA_DIR = Path("project_folder/data")
 RAW = DATA_DIR / "raw"
 TEMP = DATA_DIR / "temp"
+CLEAN = DATA_DIR / "clean"
 
-# Load and clean
-df = pd.read_pickle(RAW / "topup.pkl")
-df_cleaned = clean_topup_data(df)
-df_cleaned.to_pickle(TEMP / "topup_trns.pkl")
+# Per-stage rows in/out, time and peak memory, e.g. []; None skips measuring (tracemalloc
+# slows stages down, so scripts/benchmark_stages.py is where this is on)
+report = None
+
+# Chrome trace (chrome://tracing, ui.perfetto.dev) of every stage and sub-step, e.g.
+# each date column parsed or each collapse version, e.g. TEMP / "trace_clean_data.json";
+# None records nothing
+TRACE = None
+if TRACE is not None:
+    start_trace(TRACE)
+
+# Directory to reuse stage results from when inputs, parameters and pipeline code are
+# unchanged, e.g. TEMP / "cache" (entries are full pickles of each stage's output, so
+# it can grow to CACHE_MAX_BYTES); None recomputes every stage
+CACHE = None
+CACHE_MAX_BYTES = 20 * 2**30
+cache = StageCache(CACHE, max_bytes=CACHE_MAX_BYTES) if CACHE is not None else None
+cached = cache.wrap if cache is not None else (lambda func: func)
+
+# Processes for account-sharded cleaning and collapse (same output as the serial path);
+# None runs both stages in this process
+SHARDS = None
 
-# Collapse to individual-level (original mapping)
-df_indiv = collapse_topup_data(df_cleaned)
-df_indiv.to_pickle(TEMP / "topup_indiv.pkl")
+# "polars" cleans and collapses straight from the yearly CSVs in data/clean as one lazy,
+# multi-threaded query (pipeline/lazy_topup.py, needs polars); it keeps no state for
+# scripts/append_year.py. "pandas" uses the frame 0_import_data.py saved.
+BACKEND = "pandas"
+
+# Compact dtypes for the columns cleaning adds (pipeline/schema.py); set together with
+# 0_import_data.py's COMPACT. False keeps the defaults (the baseline's exact outputs).
+COMPACT = False
+schema = CLEANED_TOPUP_SCHEMA if COMPACT else None
+
+# Load and clean (the loaded frame is not reused, so clean it in place)
+# The state lets scripts/append_year.py add later years without reprocessing history
+state = {}
+if BACKEND == "polars":
+    state = None
+    df_cleaned, indiv = run_stage(
+        report, "clean_and_collapse_files", clean_and_collapse_files, 2013, 2020, CLEAN, schema=schema,
+        backend="polars",
+    )
+elif SHARDS:
+    df = read_topup_data(RAW)
+    # Clean and collapse to individual-level per account shard in one pass
+    df_cleaned, indiv = run_stage(
+        report, "clean_and_collapse_sharded", cached(clean_and_collapse_sharded), df,
+        workers=SHARDS, versions=("v1", "v2"), state=state, schema=schema,
+    )
+    del df
+else:
+    df = read_topup_data(RAW)
+    df_cleaned = run_stage(report, "clean_topup_data", cached(clean_topup_data), df, inplace=True, report=report, state=state, schema=schema)
+    del df
+    # Collapse to individual-level under the original (v1) and remapped (v2) mode detail
+    # in one shared pass
+    indiv = run_stage(report, "collapse_topup_variants", cached(collapse_topup_variants), df_cleaned, versions=("v1", "v2"))
+df_cleaned.to_pickle(TEMP / "topup_trns.pkl")
+if state is not None:
+    pd.to_pickle(state, TEMP / "topup_state.pkl")
+del state
+indiv["v1"].to_pickle(TEMP / "topup_indiv.pkl")
+indiv["v2"].to_pickle(TEMP / "topup_indivv2.pkl")
 
-# Collapse with remapped mode detail
-df_remapped = remap_mode_detail(df_cleaned)
-df_indiv_v2 = collapse_topup_data(df_remapped)
-df_indiv_v2.to_pickle(TEMP / "topup_indivv2.pkl")
\ No newline at end of file
+if TRACE is not None:
+    stop_trace()
+if report is not None:
+    print(pd.DataFrame(report).to_string(index=False))
@@ -0,0 +1,67 @@
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from pipeline.cache import frame_fingerprint
+from pipeline.summary_stats import (
+    TABSTAT_STATS, summarize, merge_summaries, rollup, finalize_summary, frequencies,
+)
+
+DATA_DIR = Path("project_folder/data")
+TEMP = DATA_DIR / "temp"
+SUMSTATS = DATA_DIR / "sumstats"
+# Per-year partial aggregates of the transaction table, kept between runs
+PARTS = TEMP / "summary_parts"
+
+# Transaction-level partials: grouping and summarised variables. Rollups to any subset of
+# TRNS_BY come from the merged partial.
+TRNS_BY = ["trns_yr", "hardcopy", "mode_detail"]
+TRNS_VARS = ["topup_amt"]
+TABSTAT_VARS = ["age", "female", "osra_bal_amt", "topup_all_amt_tot", "topup_all_num", "mltp_lst_con_wge"]
+TAB_VARS = ["topup_all_num_cat", "close_cpf", "emp_status"]
+
+SUMSTATS.mkdir(parents=True, exist_ok=True)
+PARTS.mkdir(parents=True, exist_ok=True)
+
+# Transaction level: each year's partial is saved with a fingerprint of the rows it
+# summarises and redone when they differ, since appending a year can re-resolve
+# reinstatements in any earlier year and a rebuilt table can change every year
+cleaned = pd.read_pickle(TEMP / "topup_trns.pkl")[TRNS_BY + TRNS_VARS]
+years = sorted(cleaned["trns_yr"].dropna().unique().astype(int))
+parts = []
+for year in years:
+    rows = cleaned[cleaned["trns_yr"] == year]
+    fingerprint = frame_fingerprint(rows)
+    path = PARTS / f"trns_{year}.pkl"
+    saved = pd.read_pickle(path) if path.exists() else {}
+    if saved.get("fingerprint") != fingerprint:
+        saved = {"fingerprint": fingerprint, "summary": summarize(rows, TRNS_BY, TRNS_VARS)}
+        pd.to_pickle(saved, path)
+    parts.append(saved["summary"])
+del cleaned
+trns = merge_summaries(*parts)
+for by in [["trns_yr"], ["trns_yr", "hardcopy"], ["hardcopy", "mode_detail"]]:
+    table = finalize_summary(rollup(trns, by), ["count", "sum", "mean", "sd", "min", "p25", "p50", "p75", "max"])
+    table.to_csv(SUMSTATS / f"trns_{'_'.join(by)}.csv")
+
+# Full individual level: hardcopy and softcopy payers by year
+v1v2 = pd.read_pickle(TEMP / "topup_merged_v1v2.pkl")
+frequencies(summarize(v1v2, ["yr", "hardcopy"], ["hardcopy"]), "yr", "hardcopy").to_csv(SUMSTATS / "hard_yr.csv")
+del v1v2
+
+
+def by_group(df, group, suffix):
+    # One partial at the finest grouping; the tabstat and every tab are rollups of it
+    fine = summarize(df, [group] + TAB_VARS, TABSTAT_VARS)
+    table = finalize_summary(rollup(fine, [group]), TABSTAT_STATS)
+    table[table.index.notna()].to_csv(SUMSTATS / f"tabstat_var{suffix}.csv")
+    for var in TAB_VARS:
+        frequencies(fine, var, group).to_csv(SUMSTATS / f"{var}{suffix}.csv")
+
+
+# Hardcopy/softcopy only, by hardcopy status
+by_group(pd.read_pickle(TEMP / "topup_merged_analysisv2.pkl"), "hardcopy", "")
+
+# Hard/soft/mixed: topper is 1 for hardcopy only, 2 for softcopy only, 3 for mixed
+mixed = pd.read_pickle(TEMP / "topup_merged_analysis_mixed.pkl")
+mixed["topper"] = np.select([mixed["only_hardcopy"] == 1, mixed["only_softcopy"] == 1], [1, 2], 3)
+by_group(mixed, "topper", "_m")
@@ -0,0 +1,60 @@
+from pathlib import Path
+import pandas as pd
+from pipeline.merge_data import (
+    ACCT_KEYS, MONTH_KEYS, index_member_table, latest_transactions, merge_member_data,
+    clean_merged_data, analysis_sample,
+)
+from pipeline.profiling import run_stage
+
+DATA_DIR = Path("project_folder/data")
+TEMP = DATA_DIR / "temp"
+
+# Per-stage rows in/out, time and peak memory, e.g. []; None skips measuring
+report = None
+
+# Member tables, sorted and indexed by their merge keys. The Stata exports are never
+# written: the indexed copy is saved next to each one as {name}_indexed.pkl and rebuilt
+# when the export is newer, so later runs only binary-search it.
+member_tables = {
+    "mbr_1719_constant": (ACCT_KEYS, {}),
+    "mbr_1719_varying_monthly": (MONTH_KEYS, {"mbr_varying_mth": "mth"}),
+    "mbr_1719_con_monthly": (MONTH_KEYS, {"mbr_con_mth": "mth"}),
+}
+members = {}
+for name, (keys, renames) in member_tables.items():
+    source, indexed = TEMP / f"{name}.pkl", TEMP / f"{name}_indexed.pkl"
+    if indexed.exists() and indexed.stat().st_mtime >= source.stat().st_mtime:
+        table = pd.read_pickle(indexed)
+    else:
+        table = index_member_table(pd.read_pickle(source).rename(columns=renames), keys)
+        table.to_pickle(indexed)
+    members[name] = table
+    del table
+
+# Merge each individual-level table with its latest transaction and the member tables
+# (v1 also keeps members without top-ups, as in 1. Merge Data)
+cleaned = pd.read_pickle(TEMP / "topup_trns.pkl")
+for indiv_name, merged_name, version, keep_unmatched in [
+    ("topup_indiv", "topup_merged", None, True),
+    ("topup_indivv2", "topup_mergedv2", "v2", False),
+]:
+    indiv = pd.read_pickle(TEMP / f"{indiv_name}.pkl")
+    latest = run_stage(report, f"latest_transactions_{indiv_name}", latest_transactions, cleaned, version=version)
+    merged = run_stage(
+        report, f"merge_member_data_{indiv_name}", merge_member_data, indiv, latest,
+        *members.values(), keep_unmatched_members=keep_unmatched,
+    )
+    merged.to_pickle(TEMP / f"{merged_name}.pkl")
+    del indiv, latest, merged
+
+# 1.1 Clean Merged Data: the tables the summary statistics, trees and regressions use
+merged = pd.read_pickle(TEMP / "topup_mergedv2.pkl")
+v1v2 = run_stage(report, "clean_merged_data", clean_merged_data, merged)
+v1v2.to_pickle(TEMP / "topup_merged_v1v2.pkl")
+run_stage(report, "analysis_sample", analysis_sample, v1v2).to_pickle(TEMP / "topup_merged_analysisv2.pkl")
+mixed = run_stage(report, "analysis_sample_mixed", analysis_sample, v1v2, mixed=True)
+mixed.to_pickle(TEMP / "topup_merged_analysis_mixed.pkl")
+del merged, v1v2, mixed
+
+if report is not None:
+    print(pd.DataFrame(report).to_string(index=False))
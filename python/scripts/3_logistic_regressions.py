@@ -0,0 +1,34 @@
+import time
+from pathlib import Path
+import pandas as pd
+from pipeline.logit import LOGIT_SPECS, add_log_balance, fit_logit_specs, logit_table
+
+DATA_DIR = Path("project_folder/data")
+TEMP = DATA_DIR / "temp"
+REG = DATA_DIR / "reg"
+
+# Whether wages stay significant once other covariates are added (end of 3. Logistic
+# Regressions); fitted after the main specifications
+WAGE_SPECS = {
+    "wage": ["age", "mltp_lst_con_wge"],
+    "wage_emp": ["age", "i.emp_status", "mltp_lst_con_wge"],
+    "wage_emp_female": ["i.female", "age", "i.emp_status", "mltp_lst_con_wge"],
+    "wage_emp_female_no_age": ["i.female", "i.emp_status", "mltp_lst_con_wge"],
+}
+
+df = add_log_balance(pd.read_pickle(TEMP / "topup_merged_analysisv2.pkl"))
+REG.mkdir(parents=True, exist_ok=True)
+
+# v1-v3 on one design, each warm-started from the one before; coefficients and average
+# marginal effects (margins, dydx(*)) in one column per version, as the outreg2 tables
+start = time.perf_counter()
+results = fit_logit_specs(df, LOGIT_SPECS)
+print(f"fitted {len(results)} specifications on {len(df)} members in {time.perf_counter() - start:.1f}s")
+logit_table(results, "coef").to_csv(REG / "v2logit_indiv_1720.csv")
+logit_table(results, "ame").to_csv(REG / "v2logit_indiv_1720_ame.csv")
+
+for name, r in {**results, **fit_logit_specs(df, WAGE_SPECS)}.items():
+    print(f"\n{name}: N = {r['n']}, pseudo R2 = {r['pseudo_r2']:.4f}, Pr(hardcopy) at means = {r['p_atmeans']:.4f}")
+    if r["omitted"]:
+        print(f"omitted as perfect predictors (with their rows): {', '.join(r['omitted'])}")
+    print(r["table"].round(4).to_string())
@@ -0,0 +1,46 @@
+import os
+from pathlib import Path
+import pandas as pd
+from pipeline.chaid import CHAID_INDIV, CHAID_TRNS, chaid
+from pipeline.merge_data import xtile
+
+DATA_DIR = Path("project_folder/data")
+TEMP = DATA_DIR / "temp"
+LOG = DATA_DIR / "log"
+SUMSTATS = DATA_DIR / "sumstats"
+
+# Transactions in these years enter the transaction-level tree
+YEAR_RANGE = (2017, 2020)
+# Processes evaluating predictors; None uses every core (run_pipeline.py passes its
+# worker budget as PIPELINE_WORKERS)
+WORKERS = int(os.environ["PIPELINE_WORKERS"]) if "PIPELINE_WORKERS" in os.environ else None
+# Variables summarised by cluster (tabstat ..., by(_CHAID) stat(n mean median min max))
+SUMMARY_VARS = [
+    "age", "xtage", "topup_all_num_cat", "topup_all_amt_tot", "xttopup_all_amt_tot",
+    "mltp_lst_con_wge", "xtmltp_lst_con_wge", "osra_bal_amt", "xtosra_bal_amt",
+    "race", "emp_status", "female", "close_cpf",
+]
+
+LOG.mkdir(parents=True, exist_ok=True)
+SUMSTATS.mkdir(parents=True, exist_ok=True)
+
+# CHAID - Transaction Level
+cleaned = pd.read_pickle(TEMP / "topup_trns.pkl")
+trns = cleaned[cleaned["trns_yr"].between(*YEAR_RANGE)].copy()
+del cleaned
+trns["xttopup_amt"] = xtile(trns["topup_amt"])
+trns_tree = chaid(trns, "hardcopy", workers=WORKERS, **CHAID_TRNS)
+print(trns_tree["leaves"].to_string(index=False))
+trns_tree["leaves"].to_csv(LOG / "chaid_trns_1720.csv", index=False)
+del trns
+
+# CHAID - Individual Level, with each member's cluster saved as _CHAID
+df = pd.read_pickle(TEMP / "topup_merged_analysisv2.pkl")
+indiv_tree = chaid(df, "hardcopy", workers=WORKERS, **CHAID_INDIV)
+print(indiv_tree["leaves"].to_string(index=False))
+indiv_tree["leaves"].to_csv(LOG / "chaid_indiv_1720.csv", index=False)
+df["_CHAID"] = pd.Series(indiv_tree["cluster"], index=df.index).astype("Int64")
+df.to_pickle(TEMP / "topup_merged_analysisv2_chaid.pkl")
+
+stats = df.groupby("_CHAID")[SUMMARY_VARS].agg(["count", "mean", "median", "min", "max"])
+stats.to_csv(SUMSTATS / "chaid_indiv_sumstats.csv")
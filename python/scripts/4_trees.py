@@ -0,0 +1,40 @@
+import os
+import time
+from pathlib import Path
+import pandas as pd
+from pipeline.cart import CART_FEATURES, RULES, cart_grid, predict_cart
+
+DATA_DIR = Path("project_folder/data")
+TEMP = DATA_DIR / "temp"
+LOG = DATA_DIR / "log"
+
+# crtrees ... seed(123) rule(0..3); more seeds add fits to the grid
+SEEDS = [123]
+# Processes for the grid; None uses every core (run_pipeline.py passes its
+# worker budget as PIPELINE_WORKERS)
+WORKERS = int(os.environ["PIPELINE_WORKERS"]) if "PIPELINE_WORKERS" in os.environ else None
+
+df = pd.read_pickle(TEMP / "topup_merged_analysisv2.pkl")
+
+start = time.perf_counter()
+results, codes = cart_grid(df, CART_FEATURES, rules=RULES, seeds=SEEDS, workers=WORKERS)
+print(f"fitted {len(results)} trees x {len(RULES)} rules in {time.perf_counter() - start:.1f}s")
+
+# Leaf rules and accuracy of every fit (the tree / st_code output of each crtrees run),
+# and per row, as gen() and tsample(), the predicted class and leaf (missing outside
+# e(sample)) and the test-sample flag
+LOG.mkdir(parents=True, exist_ok=True)
+leaves = []
+for (name, seed), fit in results.items():
+    suffix = "" if len(SEEDS) == 1 else f"_s{seed}"
+    for rule, r in fit["fits"].items():
+        print(f"\n{name}_{rule}{suffix}: {r['n_leaves']} leaves, accuracy learning {r['learn_accuracy']:.4f} test {r['test_accuracy']:.4f}")
+        print(r["leaves"].round(4).to_string(index=False))
+        leaves.append(r["leaves"].assign(tree=name, rule_se=rule, seed=seed))
+        grp, pred = predict_cart(fit, rule, codes)
+        sample = fit["learn"] | fit["test"]
+        df[f"{name}_{rule}{suffix}"] = pd.Series(pred, dtype="Int64").where(sample)
+        df[f"{name}_{rule}{suffix}_grp"] = pd.Series(grp.astype(int), dtype="Int64").where(sample)
+        df[f"{name}_{rule}{suffix}_tsample"] = fit["test"]
+pd.concat(leaves, ignore_index=True).to_csv(LOG / "cart_1720_rules.csv", index=False)
+df.to_pickle(TEMP / "topup_merged_cart.pkl")
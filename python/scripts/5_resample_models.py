@@ -0,0 +1,40 @@
+import os
+import time
+from pathlib import Path
+import pandas as pd
+from pipeline.cart import CART_FEATURES
+from pipeline.logit import LOGIT_SPECS, add_log_balance
+from pipeline.resample import resample_models, summarize_replicates
+
+DATA_DIR = Path("project_folder/data")
+TEMP = DATA_DIR / "temp"
+REG = DATA_DIR / "reg"
+
+# Bootstrap replicates (percentile intervals for coefficients and marginal effects) and
+# cross-validation folds (out-of-sample accuracy) of the v1-v3 logits and both trees
+REPLICATES = 200
+FOLDS = 10
+SEED = 123
+# Processes for the replicates; None uses every core (run_pipeline.py passes its
+# worker budget as PIPELINE_WORKERS)
+WORKERS = int(os.environ["PIPELINE_WORKERS"]) if "PIPELINE_WORKERS" in os.environ else None
+
+df = add_log_balance(pd.read_pickle(TEMP / "topup_merged_analysisv2.pkl"))
+REG.mkdir(parents=True, exist_ok=True)
+
+for kind in ["cv", "bootstrap"]:
+    # Replicates are appended as they finish, so an interrupted run keeps the finished ones
+    out = REG / f"resample_{kind}_1720.csv"
+    out.unlink(missing_ok=True)
+    start = time.perf_counter()
+    frames = []
+    for frame in resample_models(df, kind, LOGIT_SPECS, CART_FEATURES, replicates=REPLICATES, folds=FOLDS,
+                                 seed=SEED, workers=WORKERS):
+        frame.to_csv(out, mode="a", header=not out.exists(), index=False)
+        frames.append(frame)
+    print(f"{kind}: {len(frames)} replicates in {time.perf_counter() - start:.1f}s")
+
+    summary = summarize_replicates(pd.concat(frames, ignore_index=True))
+    summary.to_csv(REG / f"resample_{kind}_1720_summary.csv", index=False)
+    metrics = summary[summary["stat"].isin(["accuracy", "auc", "log_loss"])]
+    print(metrics.pivot(index="model", columns="stat", values="mean").round(4).to_string())
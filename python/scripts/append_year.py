@@ -0,0 +1,13 @@
+from pathlib import Path
+from pipeline.incremental import append_year
+
+DATA_DIR = Path("project_folder/data")
+TEMP = DATA_DIR / "temp"
+CLEAN = DATA_DIR / "clean"
+
+# Year whose topup_{YEAR}.csv has just arrived; must follow the years already in topup_trns.pkl
+YEAR = 2021
+
+# Clean only the new year and update topup_trns.pkl, topup_indiv.pkl and topup_indivv2.pkl
+# in place (requires topup_state.pkl from scripts/1_clean_data.py)
+append_year(YEAR, CLEAN, TEMP)
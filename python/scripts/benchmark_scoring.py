@@ -0,0 +1,80 @@
+import subprocess
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from pipeline.logit import fit_logit_specs
+from pipeline.scoring import AccountStore
+from pipeline.synthetic import topup_chunk
+
+# Latency and throughput of AccountStore (pipeline/scoring.py) on synthetic top-ups: a
+# history is loaded in one batch, then the next year's rows arrive in micro-batches of
+# each size and every batch is scored. Results are appended to RESULTS.
+DATA_DIR = Path("project_folder/data")
+BENCH_DIR = DATA_DIR / "benchmark"
+RESULTS = BENCH_DIR / "scoring_benchmarks.csv"
+
+# Original top-ups in the history (START_YEAR to END_YEAR - 1) and in the streamed year
+HISTORY_ROWS = 10**6
+STREAM_ROWS = 10**5
+N_ACCOUNTS = 2 * 10**5
+START_YEAR, END_YEAR = 2013, 2020
+SEED = 0
+BATCH_SIZES = [1, 10, 100, 1000]
+# Batches timed per size (fewer when the stream runs out)
+N_BATCHES = 200
+DATE_FORMAT = "%d/%m/%Y"  # synthetic dates are day-first
+# Scoring model on top-up aggregates only, fitted to a stand-in target (mostly-hardcopy
+# payers); only its shape matters for the timings
+TERMS = ["topup_all_amt_tot", "i.topup_all_num_cat", "topup_all_amt_mean"]
+
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+rng = np.random.default_rng(SEED)
+history = topup_chunk(rng, HISTORY_ROWS, N_ACCOUNTS, START_YEAR, END_YEAR - 1)
+stream = topup_chunk(rng, STREAM_ROWS, N_ACCOUNTS, END_YEAR, END_YEAR)
+
+rows = []
+start = time.perf_counter()
+store = AccountStore(year_range=(END_YEAR - 3, END_YEAR), date_format=DATE_FORMAT)
+store.update(history)
+seconds = time.perf_counter() - start
+rows.append({"stage": "load_history", "batch_rows": len(history), "batches": 1, "rows_per_s": len(history) / seconds,
+             "median_ms": 1000 * seconds, "p95_ms": 1000 * seconds, "max_ms": 1000 * seconds})
+
+features = store.features(list(store.accounts))
+features["mostly_hard"] = (features["topup_hard_num"] > features["topup_soft_num"]).astype(float)
+store.terms = TERMS
+store.coef = fit_logit_specs(features, {"model": TERMS}, y="mostly_hard")["model"]["table"]["coef"].to_dict()
+
+offset = 0
+for size in BATCH_SIZES:
+    latency = []
+    for _ in range(N_BATCHES):
+        if offset + size > len(stream):
+            break
+        batch = stream.iloc[offset:offset + size]
+        offset += size
+        start = time.perf_counter()
+        store.apply(batch)
+        latency.append(time.perf_counter() - start)
+    latency = np.array(latency)
+    rows.append({
+        "stage": "apply", "batch_rows": size, "batches": len(latency), "rows_per_s": size * len(latency) / latency.sum(),
+        "median_ms": 1000 * np.median(latency), "p95_ms": 1000 * np.percentile(latency, 95),
+        "max_ms": 1000 * latency.max(),
+    })
+
+out = pd.DataFrame(rows).assign(
+    history_rows=HISTORY_ROWS, run=pd.Timestamp.now().isoformat(timespec="seconds"), rev=_git_rev(),
+)
+history_runs = pd.read_csv(RESULTS) if RESULTS.exists() else None
+RESULTS.parent.mkdir(parents=True, exist_ok=True)
+pd.concat([history_runs, out], ignore_index=True).to_csv(RESULTS, index=False)
+print(out.drop(columns=["run", "rev"]).round(2).to_string(index=False))
@@ -0,0 +1,89 @@
+import subprocess
+import time
+from pathlib import Path
+import pandas as pd
+from pipeline.clean_topup import clean_topup_data, remap_mode_detail, collapse_topup_data, collapse_topup_variants
+from pipeline.import_utils import load_topup_data
+from pipeline.member_store import build_member_store, read_member_store
+from pipeline.profiling import run_stage, start_trace, stop_trace
+from pipeline.schema import TOPUP_SCHEMA, CLEANED_TOPUP_SCHEMA, MEMBER_SCHEMA
+from pipeline.synthetic import write_synthetic_data
+
+# Times every pipeline stage on synthetic data (pipeline/synthetic.py) and appends the
+# results to RESULTS, flagging stages that got slower than the last run at the same size.
+# Times include tracemalloc's overhead (large for stages that allocate many Python
+# objects), so compare them with earlier runs of this script rather than with untraced runs.
+DATA_DIR = Path("project_folder/data")
+BENCH_DIR = DATA_DIR / "benchmark"
+RESULTS = BENCH_DIR / "stage_benchmarks.csv"
+
+# Original top-ups per dataset (reinstatement rows add ~2%); sizes up to 10**8 can be
+# generated, but cleaning beyond ~10**7 needs a machine with that much memory
+SIZES = [10**5, 10**6]
+START_YEAR, END_YEAR = 2013, 2020
+SEED = 0
+# Members per monthly file; None uses the generator default (every account, up to 10**6)
+MEMBER_ROWS = None
+# A stage is flagged when its time or peak memory exceeds this multiple of the last run
+TOLERANCE = 1.25
+# Write a Chrome trace of every stage and sub-step per size to BENCH_DIR/trace_n{size}.json
+TRACE = True
+
+schema = CLEANED_TOPUP_SCHEMA
+
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+runs = []
+for size in SIZES:
+    data_dir = BENCH_DIR / f"n{size}"
+    # Datasets are generated once per size and seed and reused by later runs
+    if not (data_dir / f"topup_mbr_{END_YEAR}_12.csv").exists():
+        start = time.perf_counter()
+        write_synthetic_data(data_dir, size, START_YEAR, END_YEAR, member_rows=MEMBER_ROWS, seed=SEED)
+        print(f"generated n={size} in {time.perf_counter() - start:.1f}s")
+
+    report = []
+    if TRACE:
+        start_trace(BENCH_DIR / f"trace_n{size}.json")
+    df = run_stage(
+        report, "load_topup_data", load_topup_data, START_YEAR, END_YEAR, data_dir, data_dir, schema=TOPUP_SCHEMA,
+    )
+    cleaned = run_stage(report, "clean_topup_data", clean_topup_data, df, inplace=True, report=report, schema=schema)
+    del df
+    remapped = run_stage(report, "remap_mode_detail", remap_mode_detail, cleaned)
+    run_stage(report, "collapse_topup_data_v1", collapse_topup_data, cleaned)
+    run_stage(report, "collapse_topup_data_v2", collapse_topup_data, remapped)
+    del remapped
+    run_stage(report, "collapse_topup_variants", collapse_topup_variants, cleaned)
+    members = cleaned["tppr_acct_num"].unique()
+    del cleaned
+
+    run_stage(
+        report, "build_member_store", build_member_store, START_YEAR, END_YEAR, data_dir, data_dir / "member_store",
+        schema=MEMBER_SCHEMA,
+    )
+    run_stage(report, "read_member_store", read_member_store, data_dir / "member_store", members=members,
+              rows_in=len(members))
+    if TRACE:
+        stop_trace()
+    runs.append(pd.DataFrame(report).assign(size=size))
+
+# Compare with the previous run of each stage at each size, then append this one
+out = pd.concat(runs, ignore_index=True).assign(run=pd.Timestamp.now().isoformat(timespec="seconds"), rev=_git_rev())
+history = pd.read_csv(RESULTS) if RESULTS.exists() else None
+RESULTS.parent.mkdir(parents=True, exist_ok=True)
+pd.concat([history, out], ignore_index=True).to_csv(RESULTS, index=False)
+
+if history is not None:
+    last = history.drop_duplicates(["size", "stage"], keep="last").set_index(["size", "stage"])
+    prev = last.reindex(pd.MultiIndex.from_frame(out[["size", "stage"]]))
+    out["seconds_ratio"] = (out["seconds"] / prev["seconds"].to_numpy()).round(2)
+    out["peak_ratio"] = (out["peak_mb"] / prev["peak_mb"].to_numpy()).round(2)
+    out["regressed"] = (out["seconds_ratio"] > TOLERANCE) | (out["peak_ratio"] > TOLERANCE)
+print(out.drop(columns=["run", "rev"]).to_string(index=False))
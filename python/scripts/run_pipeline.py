@@ -0,0 +1,39 @@
+import argparse
+from pathlib import Path
+import pandas as pd
+from pipeline.dag import build_graph, run_pipeline, topological_order
+from pipeline.stages import pipeline_stages
+
+# One entry point for the numbered scripts: runs every stage, or the given stages or
+# artifacts with what they depend on, independent stages at the same time
+# (pipeline/dag.py, stages in pipeline/stages.py). Up-to-date stages are skipped.
+DATA_DIR = Path("project_folder/data")
+# Years of the yearly CSVs, and the years collapsed to individual level
+YEARS = (2013, 2020)
+YEAR_RANGE = (2017, 2020)
+# As in 0_import_data.py and 1_clean_data.py
+MEMBER_STORE = False
+COMPACT = False
+
+parser = argparse.ArgumentParser(description="Run the pipeline stages and what they depend on.")
+parser.add_argument("targets", nargs="*", help="stage names or artifacts under the data directory (default: all)")
+parser.add_argument("-j", "--workers", type=int, default=None, help="stages run at once, and processes for the tree and resampling stages (default: every core)")
+parser.add_argument("-f", "--force", action="store_true", help="rerun stages whose outputs are up to date")
+parser.add_argument("-n", "--dry-run", action="store_true", help="show what would run without running it")
+parser.add_argument("--list", action="store_true", help="list the stages with their inputs and outputs")
+args = parser.parse_args()
+
+stages = pipeline_stages(DATA_DIR, YEARS, YEAR_RANGE, MEMBER_STORE, COMPACT)
+if args.list:
+    deps = build_graph(stages)
+    for name in topological_order(deps):
+        print(name)
+        print(f"  after:   {', '.join(sorted(deps[name])) or '-'}")
+        print(f"  inputs:  {', '.join(stages[name]['inputs']) or '-'}")
+        print(f"  outputs: {', '.join(stages[name]['outputs'])}")
+else:
+    report = run_pipeline(
+        stages, DATA_DIR, args.targets, workers=args.workers, force=args.force, dry_run=args.dry_run,
+        log=lambda row: print(f"{row['stage']}: {row['status']} ({row['seconds']:.1f}s)", flush=True),
+    )
+    print(pd.DataFrame(report).to_string(index=False))
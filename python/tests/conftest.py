@@ -0,0 +1,19 @@
+import sys
+from pathlib import Path
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+DATA = Path(__file__).parent / "data"
+
+
+# A synthetic raw top-up table and the baseline pipeline's outputs for it
+# (tests/data/make_baseline.py)
+@pytest.fixture
+def raw():
+    return pd.read_pickle(DATA / "topup_raw.pkl")
+
+
+@pytest.fixture
+def baseline():
+    return {name: pd.read_pickle(DATA / f"baseline_{name}.pkl") for name in ["trns", "indiv", "indivv2"]}
@@ -0,0 +1,42 @@
+import importlib.util
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# Regenerates the fixtures in this directory: a synthetic raw top-up table (yearly files
+# concatenated in year order, as load_topup_data reads them) and what the baseline
+# pipeline, pipeline/clean_topup.py at BASELINE, makes of it. Run from python/:
+#   python tests/data/make_baseline.py
+BASELINE = "43d2bd1"
+OUT = Path(__file__).parent
+sys.path.insert(0, str(OUT.parents[1]))
+from pipeline.synthetic import topup_chunk  # noqa: E402
+
+# Original top-ups and payer accounts; few accounts give many repeated (payer, payee,
+# amount) pairs, so reinstatements within and across years are common
+N_ROWS = 4000
+N_ACCOUNTS = 300
+SEED = 7
+
+source = subprocess.run(
+    ["git", "show", f"{BASELINE}:python/pipeline/clean_topup.py"], capture_output=True, text=True, check=True,
+).stdout
+with tempfile.TemporaryDirectory() as tmp:
+    path = Path(tmp) / "baseline_clean_topup.py"
+    path.write_text(source)
+    spec = importlib.util.spec_from_file_location("baseline_clean_topup", path)
+    baseline = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(baseline)
+
+raw = topup_chunk(np.random.default_rng(SEED), N_ROWS, N_ACCOUNTS, 2013, 2020)
+year = raw["trns_dte"].str[-4:].astype(int)
+raw = pd.concat([part for _, part in raw.groupby(year)], ignore_index=True)
+raw.to_pickle(OUT / "topup_raw.pkl")
+
+cleaned = baseline.clean_topup_data(raw.copy())
+cleaned.to_pickle(OUT / "baseline_trns.pkl")
+baseline.collapse_topup_data(cleaned).to_pickle(OUT / "baseline_indiv.pkl")
+baseline.collapse_topup_data(baseline.remap_mode_detail(cleaned)).to_pickle(OUT / "baseline_indivv2.pkl")
@@ -0,0 +1,36 @@
+import pytest
+from pandas.testing import assert_frame_equal
+from pipeline.clean_topup import collapse_topup_data
+from pipeline.lazy_topup import clean_and_collapse_files
+
+
+def _write_years(raw, clean_dir):
+    year = raw["trns_dte"].str[-4:]
+    for y, part in raw.groupby(year):
+        part.to_csv(clean_dir / f"topup_{y}.csv", index=False)
+
+
+def _assert_backends_agree(clean_dir):
+    cleaned, indiv = clean_and_collapse_files(2013, 2020, clean_dir, backend="polars")
+    expected, expected_indiv = clean_and_collapse_files(2013, 2020, clean_dir, backend="pandas")
+    assert_frame_equal(cleaned, expected)
+    for version in ["v1", "v2"]:
+        assert_frame_equal(indiv[version], expected_indiv[version])
+    assert_frame_equal(expected_indiv["v1"], collapse_topup_data(expected))
+    return cleaned
+
+
+def test_polars_matches_pandas(raw, tmp_path):
+    pytest.importorskip("polars")
+    _write_years(raw, tmp_path)
+    _assert_backends_agree(tmp_path)
+
+
+def test_polars_parses_dates_the_inferred_format_misses(raw, tmp_path):
+    # Every tenth transaction date is written 11.03.2013 while the first is 11/03/2013
+    pytest.importorskip("polars")
+    dotted = raw.index % 10 == 3
+    raw.loc[dotted, "trns_dte"] = raw.loc[dotted, "trns_dte"].str.replace("/", ".")
+    _write_years(raw, tmp_path)
+    cleaned = _assert_backends_agree(tmp_path)
+    assert cleaned["trns_dte"].notna().all()
@@ -0,0 +1,71 @@
+import os
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from pipeline.cache import StageCache
+
+
+def _stage(df, scale=1, state=None, report=None):
+    _stage.calls += 1
+    if state is not None:
+        state["rows"] = len(df)
+    if report is not None:
+        report.append({"stage": "inner", "rows": len(df)})
+    return df * scale
+
+
+_stage.calls = 0
+DF = pd.DataFrame({"a": [1.0, 2.0, 3.0]})
+
+
+def _counted(cache, df, **params):
+    before = _stage.calls
+    out = cache.run(_stage, df, **params)
+    return out, _stage.calls - before
+
+
+def test_hit_and_miss(tmp_path):
+    cache = StageCache(tmp_path)
+    out, calls = _counted(cache, DF, scale=2)
+    assert calls == 1
+    again, calls = _counted(cache, DF, scale=2)
+    assert calls == 0
+    assert_frame_equal(again, out)
+    # Other parameters or other input rows are misses
+    assert _counted(cache, DF, scale=3)[1] == 1
+    assert _counted(cache, DF.iloc[:2], scale=2)[1] == 1
+
+
+def test_state_and_report_replayed_on_hit(tmp_path):
+    cache = StageCache(tmp_path)
+    cache.run(_stage, DF, state={}, report=[])
+    state, report = {}, []
+    _, calls = _counted(cache, DF, state=state, report=report)
+    assert calls == 0
+    assert state == {"rows": 3}
+    assert report == [{"stage": "inner", "rows": 3}]
+
+
+def test_unreadable_entry_is_a_miss(tmp_path):
+    cache = StageCache(tmp_path)
+    cache.run(_stage, DF)
+    (path,) = tmp_path.glob("*.pkl")
+    path.write_bytes(path.read_bytes()[:20])
+    out, calls = _counted(cache, DF)
+    assert calls == 1
+    assert_frame_equal(out, DF)
+    assert pd.read_pickle(path)["out"].equals(DF)
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    cache = StageCache(tmp_path)
+    for scale in [1, 2, 3]:
+        cache.run(_stage, DF, scale=scale)
+    sizes = {p: p.stat().st_size for p in tmp_path.glob("*.pkl")}
+    oldest = cache._path(cache.key(_stage, DF, {"scale": 1}))
+    for i, p in enumerate(sorted(sizes, key=lambda p: p != oldest)):
+        os.utime(p, (i, i))
+
+    cache.max_bytes = sum(sizes.values())
+    cache.run(_stage, DF, scale=4)
+    assert not oldest.exists()
+    assert len(list(tmp_path.glob("*.pkl"))) == 3
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pipeline.cart import bin_features, cart_grid, grow_tree, predict_cart
+
+
+@pytest.fixture
+def analysis():
+    rng = np.random.default_rng(11)
+    n = 3000
+    df = pd.DataFrame({
+        "age": rng.integers(20, 90, n).astype(float),
+        "female": rng.integers(0, 2, n).astype(float),
+        "wage": rng.lognormal(8, 0.7, n),
+    })
+    p = np.where(df["age"] > 65, 0.7, 0.1) + 0.1 * df["female"]
+    df["hardcopy"] = (rng.random(n) < p).astype(float)
+    df.loc[::50, "wage"] = np.nan
+    return df
+
+
+def _gini_gain(x, y, cut):
+    def score(part):
+        return 0 if not len(part) else (np.sum(part) ** 2 + np.sum(1 - part) ** 2) / len(part)
+    return score(y[x <= cut]) + score(y[x > cut])
+
+
+def test_root_split_is_the_best_gini_split(analysis):
+    features = ["age", "female", "wage"]
+    codes, bins, keep = bin_features(analysis, features)
+    y = analysis["hardcopy"].to_numpy()[keep].astype(np.int64)
+    codes = codes[keep]
+    counts = np.stack([1 - y, y], axis=1).astype(np.float64)
+    tree = grow_tree(codes, counts, [len(bins[f][0]) for f in features])
+
+    best = max(
+        (_gini_gain(codes[:, j], y, b), j, b)
+        for j, f in enumerate(features) for b in range(len(bins[f][0]) - 1)
+    )
+    assert (tree["feature"][0], tree["bin"][0]) == best[1:]
+    assert features[tree["feature"][0]] == "age"
+    assert tree["counts"][0].tolist() == [np.sum(y == 0), np.sum(y == 1)]
+
+
+def test_parallel_grid_matches_serial(analysis, tmp_path):
+    sets = {"small": ["age", "female"], "full": ["age", "female", "wage"]}
+    serial, codes = cart_grid(analysis, sets, seeds=(123, 7), workers=1)
+    parallel, _ = cart_grid(analysis, sets, seeds=(123, 7), workers=2, tmp_dir=tmp_path)
+    assert serial.keys() == parallel.keys()
+    for key, fit in serial.items():
+        for rule in fit["fits"]:
+            pd.testing.assert_frame_equal(fit["fits"][rule]["leaves"], parallel[key]["fits"][rule]["leaves"])
+    assert not list(tmp_path.iterdir())
+
+
+def test_predictions_follow_the_leaves(analysis):
+    fits, codes = cart_grid(analysis, {"full": ["age", "female", "wage"]}, workers=1)
+    fit = fits[("full", 123)]
+    for rule, chosen in fit["fits"].items():
+        node, pred = predict_cart(fit, rule, codes)
+        leaves = chosen["leaves"].set_index("node")
+        assert set(node[fit["learn"]]) <= set(leaves.index)
+        counts = pd.Series(node[fit["learn"]]).value_counts()
+        assert (counts.reindex(leaves.index) == leaves["n_learn"]).all()
+        assert (pred == leaves["predicted"].reindex(node).to_numpy()).all()
@@ -0,0 +1,59 @@
+from math import erfc, log, sqrt
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+from pipeline.chaid import _log_chi2_sf, chaid, merge_categories
+
+
+@pytest.mark.parametrize("x", [0.1, 1.0, 3.0, 10.0, 80.0])
+def test_chi2_tail_matches_closed_forms(x):
+    # df 1: erfc(sqrt(x / 2)); df 2: exp(-x / 2)
+    assert _log_chi2_sf(x, 1) == pytest.approx(log(erfc(sqrt(x / 2))), rel=1e-9)
+    assert _log_chi2_sf(x, 2) == pytest.approx(-x / 2, rel=1e-9)
+
+
+def test_similar_categories_merge():
+    table = np.array([[500, 500], [0, 0], [505, 495], [100, 900], [900, 100]])
+    groups, merged = merge_categories(table, ordered=False, min_node=1)
+    assert sorted(map(sorted, groups)) == [[0, 2], [3], [4]]
+    assert merged.sum() == table.sum()
+    # Ordered categories only merge with their neighbours
+    groups, _ = merge_categories(table[[0, 3, 2]], ordered=True, min_node=1)
+    assert len(groups) == 3
+
+
+@pytest.fixture
+def analysis():
+    rng = np.random.default_rng(2)
+    n = 4000
+    df = pd.DataFrame({
+        "race": rng.integers(1, 5, n),
+        "noise": rng.integers(1, 4, n),
+        "xtage": rng.integers(1, 5, n),
+    })
+    p = np.where(df["xtage"] >= 3, 0.6, 0.2) + np.where(df["race"] == 4, 0.2, 0)
+    df["hardcopy"] = (rng.random(n) < p).astype(float)
+    df.loc[::40, "hardcopy"] = np.nan
+    return df
+
+
+def test_tree_splits_on_the_predictive_variables(analysis):
+    out = chaid(analysis, unordered=["race", "noise"], ordered=["xtage"], workers=1)
+    nodes, leaves = out["nodes"], out["leaves"]
+    assert nodes.loc[0, "split"] == "xtage"
+    assert (nodes.loc[nodes["parent"] == 1, "split"] == "race").all()
+
+    cluster = pd.Series(out["cluster"])
+    assert cluster.isna().sum() == analysis["hardcopy"].isna().sum()
+    sizes = cluster.value_counts().sort_index()
+    assert sizes.tolist() == leaves["n"].tolist()
+    shares = analysis["hardcopy"].groupby(cluster).mean()
+    np.testing.assert_allclose(shares.to_numpy(), leaves["hardcopy_share"].to_numpy())
+
+
+def test_parallel_matches_serial(analysis):
+    serial = chaid(analysis, unordered=["race", "noise"], ordered=["xtage"], workers=1)
+    parallel = chaid(analysis, unordered=["race", "noise"], ordered=["xtage"], workers=2)
+    assert_frame_equal(serial["nodes"], parallel["nodes"])
+    assert np.array_equal(serial["cluster"], parallel["cluster"], equal_nan=True)
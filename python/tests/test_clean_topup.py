@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from pipeline.clean_topup import (
+    categorize_mode_and_relationships, clean_topup_columns, clean_topup_data, collapse_topup_data,
+    collapse_topup_variants, handle_reinstatements, remap_mode_detail,
+)
+
+
+def test_clean_matches_baseline(raw, baseline):
+    assert_frame_equal(clean_topup_data(raw), baseline["trns"])
+
+
+def test_clean_in_place_matches_baseline(raw, baseline):
+    report = []
+    assert_frame_equal(clean_topup_data(raw, inplace=True, report=report), baseline["trns"])
+    assert report[-1]["rows_out"] == len(baseline["trns"])
+
+
+def test_collapse_matches_baseline(baseline):
+    cleaned = baseline["trns"]
+    assert_frame_equal(collapse_topup_data(cleaned), baseline["indiv"])
+    assert_frame_equal(collapse_topup_data(remap_mode_detail(cleaned)), baseline["indivv2"])
+
+
+def test_collapse_variants_matches_baseline(baseline):
+    out = collapse_topup_variants(baseline["trns"], versions=("v1", "v2"))
+    assert_frame_equal(out["v1"], baseline["indiv"])
+    assert_frame_equal(out["v2"], baseline["indivv2"])
+
+
+def _keys(rows):
+    cols = ["tppr_acct_num", "tppe_acct_num", "topup_amt2", "trns_yr", "r_tag"]
+    return pd.DataFrame(rows, columns=cols).astype(np.float64)
+
+
+def test_reinstatements_within_and_across_years():
+    df = _keys([
+        (1, 2, 100, 2017, 0), (1, 2, 100, 2018, 1),  # cross-year pair: both go
+        (3, 4, 50, 2018, 0), (3, 4, 50, 2018, 1),  # within-year pair: both go
+        (5, 6, 70, 2016, 0), (5, 6, 70, 2017, 0), (5, 6, 70, 2018, 1),  # R cancels the first original
+        (7, 8, 30, 2018, 1), (7, 8, 30, 2019, 0),  # original after the R year survives
+        (9, 10, 20, 2017, 0),  # no reinstatement
+        (11, 12, 40, 2019, 1),  # unmatched R
+    ])
+    assert handle_reinstatements(df).index.tolist() == [5, 8, 9]
+
+
+def test_reinstatements_keep_masks_rows_out(raw):
+    df = categorize_mode_and_relationships(clean_topup_columns(raw, drop_zero=False))
+    keep = (df["topup_amt"] != 0).to_numpy()
+    assert handle_reinstatements(df, keep=keep).index.equals(handle_reinstatements(df[keep]).index)
@@ -0,0 +1,85 @@
+import os
+import time
+import pytest
+from pipeline import stages as pipeline_stages_module
+from pipeline.dag import build_graph, run_pipeline, stage
+
+
+def _write(data_dir, files, sources=(), pause=0.0, workers=None):
+    # Writes each output as the concatenated inputs and logs its start and end times
+    start = time.time()
+    time.sleep(pause)
+    text = "".join((data_dir / i).read_text() for i in sources) + "+"
+    for out in files:
+        (data_dir / out).write_text(text)
+    with open(data_dir / "log.txt", "a") as log:
+        log.write(f"{files[0]} {start} {time.time()} {workers}\n")
+
+
+def _stages(**extra):
+    return {
+        "a": stage(_write, ["src.txt"], ["a.txt"], files=["a.txt"], sources=["src.txt"]),
+        "b": stage(_write, ["a.txt"], ["b.txt"], files=["b.txt"], sources=["a.txt"]),
+        "c": stage(_write, ["a.txt", "b.txt"], ["c.txt"], files=["c.txt"], sources=["a.txt", "b.txt"]),
+        **extra,
+    }
+
+
+def _statuses(report):
+    return {row["stage"]: row["status"] for row in report}
+
+
+def test_runs_in_dependency_order_and_skips_fresh_stages(tmp_path):
+    (tmp_path / "src.txt").write_text("s")
+    report = run_pipeline(_stages(), tmp_path, workers=1)
+    assert [row["stage"] for row in report] == ["a", "b", "c"]
+    assert (tmp_path / "c.txt").read_text() == "s+s+++"
+    assert set(_statuses(run_pipeline(_stages(), tmp_path, workers=1)).values()) == {"skipped"}
+
+    # A newer input reruns its stage and everything downstream of it
+    later = time.time() + 5
+    os.utime(tmp_path / "a.txt", (later, later))
+    assert _statuses(run_pipeline(_stages(), tmp_path, ["c"], workers=1)) == {"a": "skipped", "b": "ran", "c": "ran"}
+
+
+def test_graph_errors():
+    with pytest.raises(ValueError, match="written by both"):
+        build_graph({"a": stage(_write, [], ["x"]), "b": stage(_write, [], ["x"])})
+    with pytest.raises(ValueError, match="cycle"):
+        build_graph({"a": stage(_write, ["y"], ["x"]), "b": stage(_write, ["x"], ["y"])})
+
+
+def test_exclusive_stages_run_alone_with_the_worker_budget(tmp_path):
+    extra = {
+        name: stage(_write, [], [f"{name}.txt"], exclusive=name == "x", files=[f"{name}.txt"], pause=0.3)
+        for name in ["w", "x", "y", "z"]
+    }
+    (tmp_path / "src.txt").write_text("s")
+    run_pipeline(_stages(**extra), tmp_path, workers=3)
+    spans = {}
+    for line in (tmp_path / "log.txt").read_text().splitlines():
+        out, start, end, workers = line.split()
+        spans[out] = (float(start), float(end), workers)
+    x_start, x_end, x_workers = spans.pop("x.txt")
+    assert x_workers == "3"
+    assert all(end <= x_start or start >= x_end for start, end, _ in spans.values())
+    assert {w for _, _, w in spans.values()} == {"None"}
+
+
+def test_scripts_run_as_processes_from_the_data_directory(tmp_path, monkeypatch):
+    scripts = tmp_path / "scripts"
+    scripts.mkdir()
+    (scripts / "probe.py").write_text(
+        "import os, pipeline\n"
+        "from pathlib import Path\n"
+        "Path('project_folder/data/probe.txt').write_text(os.environ.get('PIPELINE_WORKERS', '-'))\n"
+    )
+    data_dir = tmp_path / "project_folder" / "data"
+    data_dir.mkdir(parents=True)
+    monkeypatch.setattr(pipeline_stages_module, "SCRIPTS", scripts)
+    cwd = os.getcwd()
+    pipeline_stages_module._script(data_dir, "probe.py", workers=2)
+    assert os.getcwd() == cwd
+    assert (data_dir / "probe.txt").read_text() == "2"
+    with pytest.raises(ValueError, match="project_folder/data"):
+        pipeline_stages_module._script(tmp_path, "probe.py")
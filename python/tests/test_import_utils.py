@@ -0,0 +1,26 @@
+from pandas.testing import assert_frame_equal
+from pipeline.import_utils import load_topup_data, read_topup_data, stream_topup_data
+from pipeline.schema import concat_frames
+
+
+def _write_years(raw, clean_dir):
+    for y, part in raw.groupby(raw["trns_dte"].str[-4:]):
+        part.to_csv(clean_dir / f"topup_{y}.csv", index=False)
+
+
+def test_streamed_chunks_match_whole_load(raw, tmp_path):
+    _write_years(raw, tmp_path)
+    whole = load_topup_data(2013, 2020, tmp_path, tmp_path)
+    chunks = list(stream_topup_data(2013, 2020, tmp_path, tmp_path, chunksize=100))
+    assert len(chunks) > 8
+    assert_frame_equal(concat_frames(chunks, ignore_index=True), whole)
+    assert_frame_equal(read_topup_data(tmp_path), whole)
+
+
+def test_streamed_ids_with_missing_values_are_float(raw, tmp_path):
+    raw.loc[5, "tppe_acct_num"] = None
+    _write_years(raw, tmp_path)
+    whole = load_topup_data(2013, 2020, tmp_path, tmp_path)
+    streamed = concat_frames(stream_topup_data(2013, 2020, tmp_path, tmp_path, chunksize=100), ignore_index=True)
+    assert streamed["tppe_acct_num"].dtype == "float64"
+    assert_frame_equal(streamed, whole)
@@ -0,0 +1,29 @@
+from pandas.testing import assert_frame_equal
+from pipeline.clean_topup import clean_topup_data, collapse_topup_data, remap_mode_detail
+from pipeline.incremental import append_topup_year, update_collapsed
+
+
+def test_clean_with_state_matches_baseline(raw, baseline):
+    state = {}
+    n_raw = len(raw)
+    assert_frame_equal(clean_topup_data(raw, inplace=True, state=state), baseline["trns"])
+    assert state["next_row"] == n_raw
+
+
+def test_append_year_matches_full_clean(raw, baseline):
+    # The last year holds reinstatements of originals in earlier years
+    last = raw["trns_dte"].str[-4:] == "2020"
+    state = {}
+    history = clean_topup_data(raw[~last], state=state)
+    v1 = collapse_topup_data(history)
+    v2 = collapse_topup_data(remap_mode_detail(history))
+
+    cleaned, state, accounts = append_topup_year(raw[last].reset_index(drop=True), history, state)
+    assert_frame_equal(cleaned, baseline["trns"])
+    full = {}
+    clean_topup_data(raw, state=full)
+    assert_frame_equal(state["keys"], full["keys"])
+    assert_frame_equal(state["parked"], full["parked"])
+
+    assert_frame_equal(update_collapsed(v1, cleaned, accounts), baseline["indiv"])
+    assert_frame_equal(update_collapsed(v2, cleaned, accounts, version="v2"), baseline["indivv2"])
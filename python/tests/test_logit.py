@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pipeline.logit import fit_logit_specs, score_logit
+
+TERMS = ["i.female", "age", "i.emp_status"]
+
+
+@pytest.fixture
+def analysis():
+    rng = np.random.default_rng(5)
+    n = 2000
+    df = pd.DataFrame({
+        "female": rng.integers(0, 2, n).astype(float),
+        "age": rng.normal(50, 10, n),
+        "emp_status": rng.integers(1, 4, n).astype(float),
+    })
+    xb = -3 + 0.5 * df["female"] + 0.05 * df["age"] - 0.4 * (df["emp_status"] == 3)
+    df["hardcopy"] = (rng.random(n) < 1 / (1 + np.exp(-xb))).astype(float)
+    df.loc[::97, "age"] = np.nan
+    return df
+
+
+def _indicators(df):
+    # The same model with explicit indicator columns, Stata's column order
+    return pd.DataFrame({
+        "1.female": df["female"] == 1,
+        "age": df["age"],
+        "2.emp_status": df["emp_status"] == 2,
+        "3.emp_status": df["emp_status"] == 3,
+        "_cons": 1.0,
+    }).astype(float)
+
+
+def _newton(x, y):
+    beta = np.zeros(x.shape[1])
+    for _ in range(50):
+        p = 1 / (1 + np.exp(-x @ beta))
+        beta = beta + np.linalg.solve((x * (p * (1 - p))[:, None]).T @ x, x.T @ (y - p))
+    return beta
+
+
+def test_matches_dense_newton_fit(analysis):
+    fit = fit_logit_specs(analysis, {"m": TERMS})["m"]
+    used = analysis.dropna()
+    x = _indicators(used)
+    beta = _newton(x.to_numpy(), used["hardcopy"].to_numpy())
+    table = fit["table"]
+    assert table.index.tolist() == x.columns.tolist()
+    assert fit["n"] == len(used)
+    np.testing.assert_allclose(table["coef"], beta, rtol=1e-8)
+
+    # Average marginal effects: the slope for age, discrete changes for the factors
+    p = 1 / (1 + np.exp(-x.to_numpy() @ beta))
+    np.testing.assert_allclose(table.loc["age", "ame"], np.mean(p * (1 - p)) * beta[1], rtol=1e-8)
+    base = x.assign(**{"2.emp_status": 0.0, "3.emp_status": 0.0})
+    level = base.assign(**{"3.emp_status": 1.0})
+    effect = np.mean(1 / (1 + np.exp(-level.to_numpy() @ beta)) - 1 / (1 + np.exp(-base.to_numpy() @ beta)))
+    np.testing.assert_allclose(table.loc["3.emp_status", "ame"], effect, rtol=1e-8)
+
+
+def test_warm_start_reaches_the_same_fit(analysis):
+    specs = {"small": ["i.female", "age"], "full": TERMS}
+    warm = fit_logit_specs(analysis, specs)
+    cold = fit_logit_specs(analysis, specs, warm_start=False)
+    np.testing.assert_allclose(warm["full"]["table"]["coef"], cold["full"]["table"]["coef"], rtol=1e-8)
+    assert warm["full"]["iterations"] <= cold["full"]["iterations"]
+
+
+def test_score_matches_fitted_probabilities(analysis):
+    coef = fit_logit_specs(analysis, {"m": TERMS})["m"]["table"]["coef"].to_dict()
+    used = analysis.dropna()
+    x = _indicators(used)
+    expected = 1 / (1 + np.exp(-x.to_numpy() @ pd.Series(coef)[x.columns].to_numpy()))
+    np.testing.assert_allclose(score_logit(used, TERMS, coef), expected)
+    assert np.isnan(score_logit(analysis.iloc[[0]], TERMS, coef)).all()
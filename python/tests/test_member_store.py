@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from pipeline.import_utils import load_monthly_member_data
+from pipeline.member_store import build_member_store, read_member_store
+from pipeline.schema import MEMBER_SCHEMA
+from pipeline.synthetic import member_chunk
+
+
+def _write_months(clean_dir, months=((2018, 1), (2018, 2), (2019, 1))):
+    rng = np.random.default_rng(3)
+    for y, m in months:
+        mbr_num = rng.permutation(np.arange(1000, 1200))[:150]
+        member_chunk(rng, mbr_num, y, m).to_csv(clean_dir / f"topup_mbr_{y}_{m:02d}.csv", index=False)
+
+
+def _pickled(raw_dir, years):
+    frames = []
+    for y in years:
+        df = pd.read_pickle(raw_dir / f"topup_mbr_{y}.pkl")
+        frames.append(df.assign(yr=y, mth=df["perd_id"].astype(str).str[3:5].astype(int)))
+    return pd.concat(frames, ignore_index=True)
+
+
+def _sorted(df):
+    return df.sort_values(["yr", "mth", "mbr_num"], kind="stable", ignore_index=True)
+
+
+def test_store_matches_yearly_pickles(tmp_path):
+    _write_months(tmp_path)
+    load_monthly_member_data(2018, 2019, tmp_path, tmp_path)
+    build_member_store(2018, 2019, tmp_path, tmp_path / "store")
+    expected = _sorted(_pickled(tmp_path, [2018, 2019]))
+    out = read_member_store(tmp_path / "store")
+    assert_frame_equal(_sorted(out), expected, check_dtype=False)
+
+
+def test_semi_join_and_pruning(tmp_path):
+    _write_months(tmp_path)
+    build_member_store(2018, 2019, tmp_path, tmp_path / "store", schema=MEMBER_SCHEMA)
+    full = read_member_store(tmp_path / "store")
+    members = [1150, 1003, 1003, 5000]
+    out = read_member_store(tmp_path / "store", years=[2018], months=[2], columns=["mbr_num", "gndr_cde"], members=members)
+    expected = full[full["mbr_num"].isin(members) & (full["yr"] == 2018) & (full["mth"] == 2)]
+    assert_frame_equal(out, _sorted(expected[["mbr_num", "gndr_cde", "yr", "mth"]]), check_dtype=False)
+    assert len(out) and isinstance(out["gndr_cde"].dtype, pd.CategoricalDtype)
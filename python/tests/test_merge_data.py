@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+from pipeline.clean_topup import collapse_topup_data, remap_mode_detail
+from pipeline.merge_data import (
+    ACCT_KEYS, MONTH_KEYS, index_member_table, latest_transactions, merge_member_data, xtile,
+)
+
+
+def _members(cleaned):
+    rng = np.random.default_rng(0)
+    accts = np.sort(cleaned["tppr_acct_num"].unique())
+    accts = np.concatenate([accts, accts.max() + 1 + np.arange(20)])
+    constant = pd.DataFrame({"tppr_acct_num": rng.permutation(accts)[:-10], "male": rng.integers(0, 2, len(accts) - 10)})
+    varying = pd.MultiIndex.from_product(
+        [accts[::2], range(2017, 2021), range(1, 13)], names=MONTH_KEYS,
+    ).to_frame(index=False).sample(frac=0.8, random_state=1)
+    varying["emp_status"] = rng.integers(1, 4, len(varying))
+    con = varying[MONTH_KEYS].sample(frac=0.5, random_state=2)
+    con["mltp_lst_con_wge"] = rng.random(len(con)) * 5000
+    return constant, varying, con
+
+
+@pytest.mark.parametrize("version, keep_unmatched", [(None, True), ("v2", False)])
+def test_merge_matches_pandas_merges(baseline, version, keep_unmatched):
+    cleaned = baseline["trns"]
+    constant, varying, con = _members(cleaned)
+    indiv = collapse_topup_data(cleaned if version is None else remap_mode_detail(cleaned, version))
+    latest = latest_transactions(cleaned, version=version)
+    out = merge_member_data(
+        indiv, latest, index_member_table(constant, ACCT_KEYS), index_member_table(varying, MONTH_KEYS),
+        index_member_table(con, MONTH_KEYS), keep_unmatched_members=keep_unmatched,
+    )
+
+    sub = cleaned[cleaned["trns_yr"].between(2017, 2020)]
+    if version is not None:
+        sub = remap_mode_detail(sub, version)
+    last = sub.sort_values(["tppr_acct_num", "trns_dte"], kind="stable").groupby("tppr_acct_num").tail(1)
+    expected = indiv.merge(last.rename(columns={"trns_yr": "yr", "trns_mth": "mth"}), on="tppr_acct_num", how="left")
+    expected = expected.merge(constant, on="tppr_acct_num", how="outer" if keep_unmatched else "left")
+    expected = expected.merge(varying, on=MONTH_KEYS, how="left").merge(con, on=MONTH_KEYS, how="left")
+    expected = expected.sort_values("tppr_acct_num", kind="stable", ignore_index=True)
+    assert_frame_equal(out, expected, check_dtype=False)
+
+
+def test_index_member_table_rejects_duplicates_and_drops_missing_keys():
+    table = pd.DataFrame({"tppr_acct_num": [3.0, np.nan, 1.0], "x": [1, 2, 3]})
+    indexed = index_member_table(table, ACCT_KEYS)
+    assert indexed["x"].tolist() == [3, 1]
+    assert index_member_table(indexed, ACCT_KEYS) is indexed
+    with pytest.raises(ValueError, match="not unique"):
+        index_member_table(pd.DataFrame({"tppr_acct_num": [1, 1]}), ACCT_KEYS)
+
+
+def test_xtile_follows_stata_cuts():
+    # Quartile cuts of 1..8 are 2.5, 4.5 and 6.5; ties at a cut go to the lower group
+    x = pd.Series([1, 2, 3, 4, 5, 6, 7, 8, np.nan])
+    assert np.array_equal(xtile(x), [1, 1, 2, 2, 3, 3, 4, 4, np.nan], equal_nan=True)
+    assert np.array_equal(xtile(pd.Series([1, 1, 1, 2])), [1, 1, 1, 4])
@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pipeline.clean_topup import parse_dates
+
+
+def test_matches_to_datetime(raw):
+    dates, year, month = parse_dates(raw["trns_dte"])
+    expected = pd.to_datetime(raw["trns_dte"], dayfirst=True, errors="coerce")
+    assert np.array_equal(dates, expected.to_numpy())
+    assert np.array_equal(year, expected.dt.year.to_numpy())
+    assert np.array_equal(month, expected.dt.month.to_numpy())
+    assert year.dtype == expected.dt.year.dtype
+
+
+def test_other_formats_fall_back_and_bad_values_are_nat():
+    values = pd.Series(["03/02/2018", "2018-02-04", "5.2.2018", "not a date", "03/02/2018"])
+    with pytest.warns(UserWarning, match="1 date values"):
+        dates, year, month = parse_dates(values, date_format="%d/%m/%Y")
+    expected = pd.to_datetime(["2018-02-03", "2018-02-04", "2018-02-05", None, "2018-02-03"])
+    assert np.array_equal(dates, expected.to_numpy(), equal_nan=True)
+    assert np.array_equal(year, [2018, 2018, 2018, np.nan, 2018], equal_nan=True)
+    assert np.array_equal(month, [2, 2, 2, np.nan, 2], equal_nan=True)
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+from pipeline.resample import _auc, resample_models, resamples
+
+SPECS = {"m": ["i.female", "age"]}
+FEATURE_SETS = {"t": ["female", "xtage"]}
+
+
+@pytest.fixture
+def analysis():
+    rng = np.random.default_rng(8)
+    n = 1500
+    df = pd.DataFrame({"female": rng.integers(0, 2, n).astype(float), "age": rng.normal(50, 10, n)})
+    df["xtage"] = pd.qcut(df["age"], 4, labels=False).astype(float) + 1
+    df["hardcopy"] = (rng.random(n) < 1 / (1 + np.exp(-(-4 + 0.06 * df["age"])))).astype(float)
+    return df
+
+
+def test_cv_folds_partition_the_rows():
+    held_out = np.concatenate([test for _, train, test in resamples(103, "cv", folds=5)])
+    assert np.array_equal(np.sort(held_out), np.arange(103))
+    for _, train, test in resamples(103, "bootstrap", replicates=3):
+        assert len(train) == 103 and not np.isin(test, train).any()
+
+
+def test_auc_counts_ties_as_half():
+    y = np.array([True, False, True, False])
+    assert _auc(y, np.array([0.9, 0.1, 0.5, 0.5])) == 0.875
+
+
+@pytest.mark.parametrize("kind", ["bootstrap", "cv"])
+def test_parallel_matches_serial(analysis, tmp_path, kind):
+    def run(**kwargs):
+        out = pd.concat(resample_models(analysis, kind, SPECS, FEATURE_SETS, replicates=3, folds=3, **kwargs))
+        return out.sort_values(["replicate", "model", "stat", "term"], ignore_index=True)
+
+    serial = run(workers=1)
+    assert_frame_equal(run(workers=2, tmp_dir=tmp_path), serial)
+    assert set(serial["replicate"]) == {0, 1, 2}
+    assert not list(tmp_path.iterdir())
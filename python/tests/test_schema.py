@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from pipeline.clean_topup import clean_topup_data, collapse_topup_data
+from pipeline.schema import CLEANED_TOPUP_SCHEMA, TOPUP_SCHEMA, apply_schema, concat_frames
+
+
+def test_apply_schema_picks_smallest_dtypes():
+    df = pd.DataFrame({
+        "id": [1, 70000, 3],
+        "id_missing": [1.0, np.nan, 300.0],
+        "id_text": ["a1", "b2", "c3"],
+        "code": ["01", "02", "01"],
+        "amount": [1.5, 2.0, -3.25],
+        "flag": [0, 1, 1],
+    })
+    report = []
+    schema = {"id": "id", "id_missing": "id", "id_text": "id", "code": "code", "amount": "amount", "flag": "flag"}
+    out = apply_schema(df.copy(), schema, report=report, table="t")
+    assert out.dtypes.astype(str).tolist() == ["uint32", "UInt16", "category", "category", "float32", "uint8"]
+    assert out["id_missing"].isna().tolist() == [False, True, False]
+    assert out["code"].tolist() == ["01", "02", "01"]
+    assert [r["column"] for r in report] == list(schema)
+
+
+def test_compact_clean_matches_baseline_values(raw, baseline):
+    cleaned = clean_topup_data(apply_schema(raw, TOPUP_SCHEMA), schema=CLEANED_TOPUP_SCHEMA)
+    expected = baseline["trns"].astype(cleaned.dtypes.to_dict())
+    assert_frame_equal(cleaned, expected)
+    assert_frame_equal(collapse_topup_data(cleaned), baseline["indiv"], check_dtype=False)
+
+
+def test_concat_frames_unions_categories():
+    a = pd.DataFrame({"code": pd.Categorical(["b", "a"]), "x": [1, 2]})
+    b = pd.DataFrame({"code": pd.Categorical(["c"]), "x": [3]})
+    out = concat_frames([a, b], ignore_index=True)
+    assert isinstance(out["code"].dtype, pd.CategoricalDtype)
+    assert out["code"].cat.categories.tolist() == ["a", "b", "c"]
+    assert out["code"].tolist() == ["b", "a", "c"]
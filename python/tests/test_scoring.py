@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+from pipeline.logit import score_logit
+from pipeline.scoring import AccountStore
+
+
+@pytest.mark.parametrize("version, name", [("v1", "indiv"), ("v2", "indivv2")])
+def test_batched_updates_match_the_full_collapse(raw, baseline, version, name):
+    # Batches cut across years, so reinstatements reach back into earlier batches
+    expected = baseline[name]
+    store = AccountStore(version=version)
+    changed = set()
+    for start in range(0, len(raw), 700):
+        changed |= set(store.update(raw.iloc[start:start + 700]))
+    assert set(expected["tppr_acct_num"]) <= changed
+    out = store.features(expected["tppr_acct_num"])
+    assert_frame_equal(out[expected.columns], expected, check_dtype=False)
+
+
+def test_scores_use_the_model_and_member_columns(raw):
+    accounts = np.sort(raw["tppr_acct_num"].unique())
+    members = pd.DataFrame({"female": np.arange(len(accounts)) % 2}, index=pd.Index(accounts, name="tppr_acct_num"))
+    terms = ["i.female", "topup_all_amt_tot"]
+    coef = {"1.female": 0.5, "topup_all_amt_tot": 1e-4, "_cons": -1.0}
+    store = AccountStore(terms=terms, coef=coef, members=members)
+    out = store.apply(raw)
+    assert len(out) == len(accounts)
+    np.testing.assert_allclose(out["score"], score_logit(out, terms, coef))
+    unseen = store.score([-1.0])
+    assert unseen["topup_all_amt_tot"].tolist() == [0]
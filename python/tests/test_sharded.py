@@ -0,0 +1,30 @@
+import tempfile
+from collections import namedtuple
+from pathlib import Path
+from pandas.testing import assert_frame_equal
+from pipeline import sharded
+from pipeline.clean_topup import clean_topup_data
+from pipeline.sharded import clean_and_collapse_sharded, scratch_dir
+
+
+def test_sharded_matches_serial(raw, baseline):
+    state = {}
+    cleaned, indiv = clean_and_collapse_sharded(raw, workers=2, n_shards=3, state=state)
+    assert_frame_equal(cleaned, baseline["trns"])
+    assert_frame_equal(indiv["v1"], baseline["indiv"])
+    assert_frame_equal(indiv["v2"], baseline["indivv2"])
+
+    serial = {}
+    clean_topup_data(raw, state=serial)
+    assert state["next_row"] == serial["next_row"]
+    assert state["acct_tp_categories"].equals(serial["acct_tp_categories"])
+    assert_frame_equal(state["keys"], serial["keys"])
+    assert_frame_equal(state["parked"], serial["parked"])
+
+
+def test_scratch_dir_falls_back_when_shm_is_small(monkeypatch):
+    usage = namedtuple("usage", "total used free")
+    monkeypatch.setattr(sharded.shutil, "disk_usage", lambda path: usage(64 * 2**20, 0, 64 * 2**20))
+    assert scratch_dir(100 * 2**20) == tempfile.gettempdir()
+    small = "/dev/shm" if Path("/dev/shm").is_dir() else tempfile.gettempdir()
+    assert scratch_dir(2**20) == small
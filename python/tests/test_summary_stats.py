@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+from pipeline.summary_stats import finalize_summary, merge_summaries, rollup, summarize
+
+STATS = ["count", "sum", "mean", "sd", "min", "p25", "p50", "p75", "max"]
+
+
+def _stata_pctile(x, q):
+    # _pctile's default: the mean of ranks P and P + 1 when P = n * q is whole, else rank ceil(P)
+    x = np.sort(x[~np.isnan(x)])
+    if not len(x):
+        return np.nan
+    p = len(x) * q
+    i = int(np.ceil(p))
+    return (x[i - 1] + x[i]) / 2 if p == int(p) and i < len(x) else x[max(i, 1) - 1]
+
+
+@pytest.fixture
+def trns():
+    rng = np.random.default_rng(4)
+    n = 5000
+    return pd.DataFrame({
+        "year": rng.integers(2017, 2021, n),
+        "cash": rng.integers(0, 2, n),
+        "amount": rng.integers(1, 50, n).astype(float),
+        "count": rng.integers(0, 4, n).astype(float),
+    })
+
+
+def _expected(df, by, variables):
+    g = df.groupby(by)[variables]
+    parts = {
+        "count": g.count(), "sum": g.sum(), "mean": g.mean(), "sd": g.std(), "min": g.min(), "max": g.max(),
+        **{f"p{q}": g.agg(lambda s, q=q: _stata_pctile(s.to_numpy(), q / 100)) for q in (25, 50, 75)},
+    }
+    return pd.concat(parts, axis=1).swaplevel(axis=1).reindex(columns=pd.MultiIndex.from_product([variables, STATS]))
+
+
+def test_integer_values_match_exact_statistics(trns):
+    out = finalize_summary(summarize(trns, ["year", "cash"], ["amount", "count"]), STATS)
+    assert_frame_equal(out, _expected(trns, ["year", "cash"], ["amount", "count"]), check_dtype=False, check_names=False)
+
+
+def test_median_of_an_even_count_interpolates():
+    df = pd.DataFrame({"g": 1, "x": [2.0, 3.0, 2.0, 3.0]})
+    assert finalize_summary(summarize(df, ["g"], ["x"]), ["p50"]).loc[1, ("x", "p50")] == 2.5
+
+
+def test_all_missing_groups_have_missing_quantiles():
+    # The last group, and one before other groups, have no values of x
+    df = pd.DataFrame({
+        "g": [1, 1, 2, 2, 3, 3, 4],
+        "x": [np.nan, np.nan, 1.0, 2.0, 5.0, 7.0, np.nan],
+        "y": [1.0, 2.0, np.nan, np.nan, 3.0, 4.0, 8.0],
+    })
+    out = finalize_summary(summarize(df, ["g"], ["x", "y"]), ["count", "p50"])
+    assert out[("x", "count")].tolist() == [0, 2, 2, 0]
+    assert np.array_equal(out[("x", "p50")], [np.nan, 1.5, 6.0, np.nan], equal_nan=True)
+    assert np.array_equal(out[("y", "p50")], [1.5, np.nan, 3.5, 8.0], equal_nan=True)
+
+
+def test_merged_partitions_and_rollups_match_a_single_pass(trns):
+    by_year = [summarize(part, ["year", "cash"], ["amount"]) for _, part in trns.groupby("year")]
+    merged = merge_summaries(*by_year)
+    whole = summarize(trns, ["year", "cash"], ["amount"])
+    assert_frame_equal(finalize_summary(merged, STATS), finalize_summary(whole, STATS))
+    assert_frame_equal(
+        finalize_summary(rollup(merged, ["cash"]), STATS),
+        finalize_summary(summarize(trns, ["cash"], ["amount"]), STATS),
+    )